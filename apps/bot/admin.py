@@ -1,8 +1,142 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.db import transaction
+from django.db.models import BooleanField, ExpressionWrapper, Q, Sum
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.utils.html import format_html
-from django.http import HttpResponse
-import base64
-from .models import TelegramUser, ExpenseRequest, MoneyRequest
+from django.http import FileResponse, Http404, HttpResponseNotFound
+from django.utils.http import http_date
+from PIL import UnidentifiedImageError
+from .export import export, iter_receipts_zip
+from .models import TelegramUser, ExpenseRequest, MoneyRequest, RequestRollup
+from .notifications import enqueue_status_notifications
+from .pagination import EstimatedCountPaginator
+from .responses import ranged_file_response, streaming_response
+from .rollups import record_deleted, record_change, snapshot
+from .search import full_text_q
+from .services import transition_status
+from .storage import ReceiptStorage
+from .thumbnails import get_thumbnail, thumbnail_sizes
+
+
+def format_ids(ids, limit=20):
+    """Список номеров для сообщения в админке"""
+    if not ids:
+        return ""
+    shown = ", ".join(f"#{pk}" for pk in ids[:limit])
+    return f" ({shown}{', …' if len(ids) > limit else ''})"
+
+
+class StatusNotificationMixin:
+    """Уведомляет пользователя, когда финансист меняет статус или комментарий"""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and {'status', 'admin_comment'} & set(form.changed_data):
+            enqueue_status_notifications(type(obj), [obj.pk])
+
+
+class RollupDeleteMixin:
+    """Удаление заявок в админке вычитает их из сводки (bot.rollups)"""
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            record_change(type(obj), snapshot(obj), None)
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            record_deleted(queryset)
+            super().delete_queryset(request, queryset)
+
+
+class ExportMixin:
+    """Выгрузка выбранных заявок для бухгалтерии (потоком, без загрузки в память)"""
+
+    def _export_response(self, request, queryset, fmt):
+        content, content_type = export(queryset, fmt)
+        response = streaming_response(request, content, content_type=content_type)
+        name = f"{queryset.model._meta.model_name}_{timezone.localdate():%Y%m%d}.{fmt}"
+        response['Content-Disposition'] = f'attachment; filename="{name}"'
+        return response
+
+    def export_csv(self, request, queryset):
+        return self._export_response(request, queryset, 'csv')
+
+    export_csv.short_description = "Выгрузить в CSV"
+
+    def export_xlsx(self, request, queryset):
+        return self._export_response(request, queryset, 'xlsx')
+
+    export_xlsx.short_description = "Выгрузить в Excel (XLSX)"
+
+
+class DeferredChangeList(ChangeList):
+    """Список не загружает тяжелые колонки, которые он не показывает"""
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        return queryset.defer(*self.model_admin.changelist_defer)
+
+
+class RequestChangeListMixin:
+    """Быстрый список заявок на больших таблицах.
+
+    Пользователь подгружается JOIN-ом, обоснование не читается, общее
+    число строк берется из статистики БД. Поиск: по пользователю через
+    подзапрос к маленькой таблице пользователей и по обоснованию через
+    полнотекстовый индекс (bot.search).
+    """
+    list_select_related = ('user',)
+    changelist_defer = ('justification',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_fields = ('user__telegram_id', 'user__full_name', 'justification')
+    search_help_text = "Telegram ID, имя или username пользователя, слова из обоснования"
+
+    def get_changelist(self, request, **kwargs):
+        return DeferredChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        users = Q(full_name__icontains=search_term) | Q(username__icontains=search_term)
+        if search_term.isdigit():
+            users |= Q(telegram_id=int(search_term))
+        user_ids = TelegramUser.objects.filter(users).values('pk')
+
+        condition = Q(user__in=user_ids) | full_text_q(queryset.model, search_term)
+        return queryset.filter(condition), False
+
+
+class DuplicateReceiptFilter(admin.SimpleListFilter):
+    title = "повтор чека"
+    parameter_name = 'receipt_duplicate'
+
+    def lookups(self, request, model_admin):
+        return [
+            ('exact', "Тот же чек"),
+            ('similar', "Похожий чек"),
+            ('no', "Без повторов"),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'exact':
+            return queryset.filter(receipt_duplicate_distance=0)
+        if self.value() == 'similar':
+            return queryset.filter(receipt_duplicate_distance__gt=0)
+        if self.value() == 'no':
+            return queryset.filter(receipt_duplicate_of__isnull=True)
+        return queryset
 
 
 @admin.register(TelegramUser)
@@ -53,12 +187,15 @@ class TelegramUserAdmin(admin.ModelAdmin):
     telegram_button_readonly.short_description = "Ссылка на Telegram"
 
 @admin.register(ExpenseRequest)
-class ExpenseRequestAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'amount', 'status', 'created_at', 'receipt_preview')
-    list_filter = ('status', 'created_at')
-    search_fields = ('user__telegram_id', 'user__full_name', 'justification')
-    readonly_fields = ('created_at', 'updated_at', 'receipt_display')
-    actions = ['approve_requests', 'reject_requests']
+class ExpenseRequestAdmin(
+    RequestChangeListMixin, RollupDeleteMixin, StatusNotificationMixin, ExportMixin, admin.ModelAdmin
+):
+    list_display = ('id', 'user', 'amount', 'status', 'created_at', 'receipt_preview', 'receipt_duplicate')
+    list_filter = ('status', 'receipt_status', DuplicateReceiptFilter, 'created_at')
+    readonly_fields = ('created_at', 'updated_at', 'receipt_display', 'receipt_duplicate')
+    actions = [
+        'approve_requests', 'reject_requests', 'retry_receipts', 'export_csv', 'export_xlsx', 'export_receipts_zip',
+    ]
 
     fieldsets = (
         (None, {
@@ -68,119 +205,214 @@ class ExpenseRequestAdmin(admin.ModelAdmin):
             'fields': ('amount', 'justification')
         }),
         ('Чек', {
-            'fields': ('receipt_display',)
+            'fields': ('receipt_display', 'receipt_duplicate')
         }),
         ('Даты', {
             'fields': ('created_at', 'updated_at')
         }),
     )
 
+    def get_queryset(self, request):
+        # Байты чека из старого поля в БД никогда не нужны списку и форме:
+        # миниатюры отдаются отдельным URL
+        return super().get_queryset(request).defer('receipt_photo').annotate(
+            has_receipt_blob=ExpressionWrapper(Q(receipt_photo__isnull=False), output_field=BooleanField())
+        )
+
+    @staticmethod
+    def _has_receipt(obj):
+        return bool(obj.receipt_sha256) or getattr(obj, 'has_receipt_blob', False)
+
+    @staticmethod
+    def _receipt_state(obj):
+        """Текст вместо фото, пока чек скачивается из Telegram или если загрузка не удалась"""
+        if obj.receipt_status == 'pending':
+            return "⏳ Загружается"
+        if obj.receipt_status == 'failed':
+            return format_html('<span style="color: #ba2121;" title="{}">⚠️ Ошибка загрузки</span>', obj.receipt_error)
+        return None
+
     def receipt_preview(self, obj):
         """Миниатюра чека в списке"""
-        if obj.receipt_photo:
-            try:
-                # Проверяем что это байты, а не строка
-                if isinstance(obj.receipt_photo, str):
-                    photo_bytes = obj.receipt_photo.encode('utf-8')
-                else:
-                    photo_bytes = obj.receipt_photo
-
-                b64_data = base64.b64encode(photo_bytes).decode('utf-8')
-                return format_html(
-                    '<a href="/admin/bot/expenserequest/{}/receipt/" target="_blank" title="Открыть чек">'
-                    '<img src="data:{};base64,{}" width="50" height="50" style="object-fit: cover; border-radius: 4px;" />'
-                    '</a>',
-                    obj.id, obj.receipt_photo_content_type, b64_data[:500]  # Обрезаем для превью
-                )
-            except Exception as e:
-                return f"Ошибка: {e}"
+        state = self._receipt_state(obj)
+        if state:
+            return state
+        if self._has_receipt(obj):
+            return format_html(
+                '<a href="{}" target="_blank" title="Открыть чек">'
+                '<img src="{}" width="50" height="50" loading="lazy" style="object-fit: cover; border-radius: 4px;" />'
+                '</a>',
+                reverse('admin:expenserequest_receipt', args=[obj.pk]),
+                reverse('admin:expenserequest_thumbnail', args=[obj.pk, 'list']),
+            )
         return "Нет фото"
 
     receipt_preview.short_description = "Чек"
 
     def receipt_display(self, obj):
         """Отображение чека в форме редактирования"""
-        if obj.receipt_photo:
-            try:
-                # Проверяем что это байты, а не строка
-                if isinstance(obj.receipt_photo, str):
-                    photo_bytes = obj.receipt_photo.encode('utf-8')
-                else:
-                    photo_bytes = obj.receipt_photo
-
-                b64_data = base64.b64encode(photo_bytes).decode('utf-8')
-                return format_html(
-                    '<div style="margin-bottom: 20px;">'
-                    '<h4>Фотография чека:</h4>'
-                    '<img src="data:{};base64,{}" style="max-width: 100%; max-height: 500px; border: 1px solid #ddd; border-radius: 8px;" />'
-                    '<p><a href="/admin/bot/expenserequest/{}/receipt/" target="_blank" style="margin-top: 10px; display: inline-block;">'
-                    '📎 Открыть в полном размере</a></p>'
-                    '<p><small>Размер: {} KB | Тип: {} | Имя: {}</small></p>'
-                    '</div>',
-                    obj.receipt_photo_content_type, b64_data,
-                    obj.id,
-                    len(photo_bytes) // 1024,
-                    obj.receipt_photo_content_type,
-                    obj.receipt_photo_name
-                )
-            except Exception as e:
-                return format_html(
-                    '<div style="color: red;">Ошибка отображения фото: {}</div>',
-                    e
-                )
+        if obj.receipt_status == 'pending':
+            return f"⏳ Фото чека загружается из Telegram (попыток: {obj.receipt_attempts})"
+        if obj.receipt_status == 'failed':
+            return format_html(
+                '⚠️ Не удалось загрузить фото чека из Telegram после {} попыток: {}',
+                obj.receipt_attempts, obj.receipt_error,
+            )
+        if self._has_receipt(obj):
+            return format_html(
+                '<div style="margin-bottom: 20px;">'
+                '<h4>Фотография чека:</h4>'
+                '<img src="{}" style="max-width: 100%; max-height: 500px; border: 1px solid #ddd; border-radius: 8px;" />'
+                '<p><a href="{}" target="_blank" style="margin-top: 10px; display: inline-block;">'
+                '📎 Открыть в полном размере</a></p>'
+                '<p><small>Размер: {} KB | Тип: {} | Имя: {}</small></p>'
+                '</div>',
+                reverse('admin:expenserequest_thumbnail', args=[obj.pk, 'detail']),
+                reverse('admin:expenserequest_receipt', args=[obj.pk]),
+                obj.receipt_size // 1024,
+                obj.receipt_photo_content_type,
+                obj.receipt_photo_name
+            )
         return "Фотография чека не загружена"
 
     receipt_display.short_description = "Предпросмотр чека"
 
+    def receipt_duplicate(self, obj):
+        """Пометка для финансиста: такой же или похожий чек уже был в другой заявке"""
+        if not obj.receipt_duplicate_of_id:
+            return "—"
+        kind = "тот же чек" if obj.receipt_duplicate_distance == 0 else f"похож, {obj.receipt_duplicate_distance} бит"
+        return format_html(
+            '<a href="{}" style="color: #ba2121;" title="Чек совпадает с заявкой #{}">⚠️ #{} ({})</a>',
+            reverse('admin:bot_expenserequest_change', args=[obj.receipt_duplicate_of_id]),
+            obj.receipt_duplicate_of_id, obj.receipt_duplicate_of_id, kind,
+        )
+
+    receipt_duplicate.short_description = "Повтор чека"
+
     def get_urls(self):
-        """Добавляем endpoint для скачивания чека"""
+        """Добавляем endpoint для скачивания чека и миниатюр"""
         from django.urls import path
 
         urls = super().get_urls()
         custom_urls = [
-            path('<path:object_id>/receipt/', self.admin_site.admin_view(self.download_receipt),
+            path('<path:object_id>/receipt/', self.admin_site.admin_view(self.download_receipt, cacheable=True),
                  name='expenserequest_receipt'),
+            path('<path:object_id>/thumbnail/<str:size>/', self.admin_site.admin_view(self.receipt_thumbnail, cacheable=True),
+                 name='expenserequest_thumbnail'),
         ]
         return custom_urls + urls
 
+    def receipt_thumbnail(self, request, object_id, size):
+        """Endpoint миниатюры чека, кешируется на диске и в браузере"""
+        if size not in thumbnail_sizes():
+            raise Http404("Неизвестный размер миниатюры")
+
+        expense = ExpenseRequest.objects.filter(pk=object_id).only('id', 'receipt_sha256').first()
+        if expense is None:
+            raise Http404("Заявка не найдена")
+
+        sha256 = expense.receipt_sha256
+        if not sha256:
+            # Чек еще в старом поле БД - хеш можно узнать, только прочитав байты
+            photo = expense.read_receipt()
+            if not photo:
+                raise Http404("Фотография чека не загружена")
+            sha256 = ReceiptStorage.hash_bytes(photo)
+            load_original = lambda: photo
+        else:
+            load_original = expense.read_receipt
+
+        etag = f'"{sha256}-{size}"'
+        max_age = settings.RECEIPT_THUMBNAILS['MAX_AGE']
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            try:
+                thumb = get_thumbnail(sha256, size, load_original)
+            except (OSError, UnidentifiedImageError):
+                raise Http404("Не удалось построить миниатюру")
+            response = FileResponse(open(thumb, 'rb'), content_type='image/jpeg')
+        response['ETag'] = etag
+        response['Cache-Control'] = f'private, max-age={max_age}'
+        return response
+
     def download_receipt(self, request, object_id):
-        """Endpoint для скачивания чека"""
-        try:
-            expense = ExpenseRequest.objects.get(id=object_id)
+        """Endpoint для скачивания чека: потоково, с Range и условными запросами"""
+        expense = ExpenseRequest.objects.filter(pk=object_id).only(
+            'id', 'created_at', 'receipt_sha256', 'receipt_size',
+            'receipt_photo_name', 'receipt_photo_content_type',
+        ).first()
+        if expense is None:
+            return HttpResponseNotFound("Ошибка: заявка не найдена")
+
+        # Чек не меняется после создания заявки, поэтому ETag - это хеш содержимого,
+        # а Last-Modified - дата заявки. 304 отдается до открытия файла
+        etag = f'"{expense.receipt_sha256}"' if expense.receipt_sha256 else None
+        last_modified = int(expense.created_at.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+        if response is None:
+            try:
+                fileobj = expense.open_receipt()
+            except OSError as e:
+                return HttpResponseNotFound(f"Ошибка: {e}")
 
-            # Проверяем тип данных
-            if isinstance(expense.receipt_photo, str):
-                photo_data = expense.receipt_photo.encode('utf-8')
+            if expense.receipt_sha256 and expense.receipt_size:
+                size = expense.receipt_size
             else:
-                photo_data = expense.receipt_photo
-
-            response = HttpResponse(photo_data, content_type=expense.receipt_photo_content_type)
+                size = fileobj.seek(0, os.SEEK_END)
+                fileobj.seek(0)
+            if not size:
+                fileobj.close()
+                return HttpResponseNotFound("Ошибка: фотография чека не загружена")
+
+            response = ranged_file_response(
+                request, fileobj, size, expense.receipt_photo_content_type, etag=etag
+            )
             response['Content-Disposition'] = f'inline; filename="{expense.receipt_photo_name}"'
-            return response
-        except Exception as e:
-            from django.http import HttpResponseNotFound
-            return HttpResponseNotFound(f"Ошибка: {e}")
+        elif etag:
+            response['ETag'] = etag
+
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = f"private, max-age={settings.RECEIPT_THUMBNAILS['MAX_AGE']}"
+        return response
 
     def approve_requests(self, request, queryset):
-        queryset.update(status='approved')
-        self.message_user(request, f"{queryset.count()} заявок одобрено.")
+        ids = transition_status(queryset, 'approved')
+        self.message_user(request, f"{len(ids)} заявок одобрено.{format_ids(ids)}")
 
     approve_requests.short_description = "Одобрить выбранные заявки"
 
     def reject_requests(self, request, queryset):
-        queryset.update(status='rejected')
-        self.message_user(request, f"{queryset.count()} заявок отклонено.")
+        ids = transition_status(queryset, 'rejected')
+        self.message_user(request, f"{len(ids)} заявок отклонено.{format_ids(ids)}")
 
     reject_requests.short_description = "Отклонить выбранные заявки"
 
+    def retry_receipts(self, request, queryset):
+        count = queryset.filter(receipt_status='failed').exclude(receipt_file_id='').update(
+            receipt_status='pending', receipt_attempts=0, receipt_next_attempt_at=timezone.now(), receipt_error='',
+        )
+        self.message_user(request, f"{count} чеков поставлено на повторную загрузку.")
+
+    retry_receipts.short_description = "Повторить загрузку чеков"
+
+    def export_receipts_zip(self, request, queryset):
+        response = streaming_response(request, iter_receipts_zip(queryset), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="receipts_{timezone.localdate():%Y%m%d}.zip"'
+        return response
+
+    export_receipts_zip.short_description = "Скачать чеки архивом (ZIP)"
+
 
 @admin.register(MoneyRequest)
-class MoneyRequestAdmin(admin.ModelAdmin):
+class MoneyRequestAdmin(
+    RequestChangeListMixin, RollupDeleteMixin, StatusNotificationMixin, ExportMixin, admin.ModelAdmin
+):
     list_display = ('id', 'user', 'amount', 'status', 'created_at')
     list_filter = ('status', 'created_at')
-    search_fields = ('user__telegram_id', 'user__full_name', 'justification')
     readonly_fields = ('created_at', 'updated_at')
-    actions = ['approve_requests', 'reject_requests']
+    actions = ['approve_money_requests', 'reject_money_requests', 'export_csv', 'export_xlsx']
 
     fieldsets = (
         (None, {
@@ -196,13 +428,94 @@ class MoneyRequestAdmin(admin.ModelAdmin):
 
 
     def approve_money_requests(self, request, queryset):
-        queryset.update(status='approved')
-        self.message_user(request, f"{queryset.count()} запросов одобрено.")
+        ids = transition_status(queryset, 'approved')
+        self.message_user(request, f"{len(ids)} запросов одобрено.{format_ids(ids)}")
 
     approve_money_requests.short_description = "Одобрить выбранные запросы"
 
     def reject_money_requests(self, request, queryset):
-        queryset.update(status='rejected')
-        self.message_user(request, f"{queryset.count()} запросов отклонено.")
+        ids = transition_status(queryset, 'rejected')
+        self.message_user(request, f"{len(ids)} запросов отклонено.{format_ids(ids)}")
+
+    reject_money_requests.short_description = "Отклонить выбранные запросы"
+
+
+@admin.register(RequestRollup)
+class RequestRollupAdmin(admin.ModelAdmin):
+    """Сводка по заявкам: только просмотр, обновляется автоматически"""
+    list_display = ('kind', 'user', 'month', 'status', 'count', 'amount')
+    list_filter = ('kind', 'status', 'month')
+    list_select_related = ('user',)
+    date_hierarchy = 'month'
+    search_fields = ('user__full_name', 'user__username', '=user__telegram_id')
+    report_months = 12
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        from django.urls import path
+
+        urls = super().get_urls()
+        custom_urls = [
+            path('report/', self.admin_site.admin_view(self.report_view), name='requestrollup_report'),
+        ]
+        return custom_urls + urls
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {**(extra_context or {}), 'report_url': reverse('admin:requestrollup_report')}
+        return super().changelist_view(request, extra_context)
+
+    def report_view(self, request):
+        """Отчет по месяцам и статусам и крупнейшие получатели - только из сводки"""
+        kinds = dict(RequestRollup.KIND_CHOICES)
+        kind = request.GET.get('kind') if request.GET.get('kind') in kinds else 'expense'
+        model = ExpenseRequest if kind == 'expense' else MoneyRequest
+        statuses = model.STATUS_CHOICES
+
+        today = timezone.localdate()
+        first = today.replace(day=1)
+        for _ in range(self.report_months - 1):
+            first = (first - timedelta(days=1)).replace(day=1)
+        rollups = RequestRollup.objects.filter(kind=kind, month__gte=first)
+
+        cells = {}
+        for row in rollups.values('month', 'status').annotate(n=Sum('count'), total=Sum('amount')):
+            cells[(row['month'], row['status'])] = (row['n'], row['total'])
+
+        months = []
+        month = today.replace(day=1)
+        while month >= first:
+            values = [cells.get((month, status), (0, 0)) for status, _ in statuses]
+            months.append({
+                'month': month,
+                'cells': values,
+                'count': sum(n for n, _ in values),
+                'amount': sum(total for _, total in values),
+            })
+            month = (month - timedelta(days=1)).replace(day=1)
+
+        top_users = (
+            rollups.exclude(status='rejected')
+            .values('user__full_name', 'user__username', 'user__telegram_id')
+            .annotate(n=Sum('count'), total=Sum('amount'))
+            .order_by('-total')[:20]
+        )
 
-    reject_money_requests.short_description = "Отклонить выбранные запросы"
\ No newline at end of file
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f"Отчет: {kinds[kind].lower()} за {self.report_months} мес.",
+            'kinds': kinds,
+            'kind': kind,
+            'statuses': statuses,
+            'months': months,
+            'top_users': top_users,
+        }
+        return TemplateResponse(request, 'admin/bot/requestrollup/report.html', context)
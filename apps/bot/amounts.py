@@ -0,0 +1,97 @@
+"""Разбор суммы, которую пользователь ввел в боте.
+
+Принимает "1500", "1 500,50", "1.500,50", "1,500.50", "1500 руб.", "1500₽"
+и т.п., возвращает Decimal с двумя знаками после запятой. "1.500" и "1,500"
+не принимаются: это и 1500, и 1,5 - пользователя просят ввести сумму
+однозначно. Сумма сразу проверяется на лимиты (и на размер поля amount
+в БД), чтобы ошибка была видна на шаге ввода суммы, а не при сохранении
+заявки.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+
+from .models import ExpenseRequest
+
+CENT = Decimal('0.01')
+
+# Обозначения валюты, которые можно писать после (или перед) суммой
+CURRENCY_WORDS = r'(?:рублей|рубля|рубль|руб|р|₽|rub|rur)\.?'
+CURRENCY = re.compile(rf'^{CURRENCY_WORDS}\s*|\s*{CURRENCY_WORDS}$')
+# Пробелы между разрядами (включая неразрывные) и апострофы
+GROUP_SEPARATORS = re.compile(r"[\s'’]")
+NUMBER = re.compile(r'^[0-9]+(?:[.,][0-9]+)*$')
+
+
+class AmountError(ValueError):
+    """Сумма не разобрана или вне лимитов; текст исключения - для пользователя"""
+
+
+def field_max():
+    """Наибольшая сумма, которая помещается в поле amount"""
+    field = ExpenseRequest._meta.get_field('amount')
+    return Decimal(10) ** (field.max_digits - field.decimal_places) - CENT
+
+
+def amount_limits():
+    minimum = Decimal(settings.REQUEST_AMOUNT['MIN'])
+    maximum = settings.REQUEST_AMOUNT['MAX']
+    maximum = min(Decimal(maximum), field_max()) if maximum else field_max()
+    return minimum, maximum
+
+
+def _normalize_separators(text):
+    """Оставляет одну десятичную точку, остальные точки и запятые считает разделителями разрядов"""
+    separators = [char for char in text if char in '.,']
+    if not separators:
+        return text
+    last = max(text.rfind('.'), text.rfind(','))
+    integer, fraction = text[:last], text[last + 1:]
+    if len(separators) == 1 and len(fraction) == 3 and integer != '0':
+        # "1.500" - разделитель тысяч или десятичная дробь, угадывать нельзя
+        raise AmountError(
+            f"Непонятно, {text} - это тысячи или дробная часть. "
+            "Разряды разделяйте пробелом, копейки пишите двумя знаками."
+        )
+    if len(set(separators)) == 1 and len(separators) > 1:
+        # "1,500,000" или "1.500.000" - только разделители разрядов
+        groups = text.split(separators[0])
+        if all(len(group) == 3 for group in groups[1:]):
+            return ''.join(groups)
+        raise AmountError("Не удалось разобрать сумму.")
+    groups = re.split(r'[.,]', integer)
+    if len(groups) > 1 and not all(len(group) == 3 for group in groups[1:]):
+        raise AmountError("Не удалось разобрать сумму.")
+    return ''.join(groups) + '.' + fraction
+
+
+def parse_amount(text):
+    """Сумма из текста пользователя как Decimal (2 знака) или AmountError"""
+    text = (text or '').strip().lower()
+    text = CURRENCY.sub('', text).strip()
+    text = GROUP_SEPARATORS.sub('', text)
+    if not NUMBER.match(text):
+        raise AmountError("Не удалось разобрать сумму.")
+
+    try:
+        amount = Decimal(_normalize_separators(text))
+    except InvalidOperation:
+        raise AmountError("Не удалось разобрать сумму.")
+    # Два знака после запятой и в ответе пользователю ("1500.00")
+    cents = amount.quantize(CENT)
+    if cents != amount:
+        raise AmountError("Сумма может содержать не больше двух знаков после запятой.")
+    amount = cents
+
+    minimum, maximum = amount_limits()
+    if amount < minimum:
+        raise AmountError(f"Сумма должна быть не меньше {format_amount(minimum)} руб.")
+    if amount > maximum:
+        raise AmountError(f"Сумма должна быть не больше {format_amount(maximum)} руб.")
+    return amount
+
+
+def format_amount(amount):
+    """1234567.5 -> '1 234 567,50'"""
+    return f"{Decimal(amount):,.2f}".replace(',', ' ').replace('.', ',')
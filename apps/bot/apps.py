@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class BotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bot'
-    verbose_name = "Телеграм Бот"
\ No newline at end of file
+    verbose_name = "Телеграм Бот"
+
+    def ready(self):
+        from . import signals  # noqa: F401
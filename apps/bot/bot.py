@@ -1,30 +1,128 @@
 import os
 import asyncio
 from django.conf import settings
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ConversationHandler
-from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove
-from .handlers import start, expense, money
+from telegram.ext import (
+    Application, CallbackQueryHandler, CommandHandler, MessageHandler, TypeHandler, filters, ConversationHandler,
+)
+from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
+from .concurrency import PerChatUpdateProcessor
+from .handlers import start, expense, money, history, stats
+from .imaging import shutdown_image_executor
+from .inbox import InboxReader
+from .instrumentation import TimedUpdateQueue, instrument_handlers, metrics_enabled, serve_metrics
+from .outbox import OutboxWorker
+from .persistence import DjangoPersistence
+from .receipts import ReceiptFetcher
+from .sessions import SessionKeeper
+from .throttling import FloodControl
+from .transport import build_get_updates_request, build_request
+
+
+# Имена состояний диалога для меток метрик
+STATE_NAMES = {
+    start.START_MENU: 'START_MENU',
+    expense.AMOUNT: 'AMOUNT',
+    expense.JUSTIFICATION: 'JUSTIFICATION',
+    expense.RECEIPT: 'RECEIPT',
+    money.AMOUNT: 'MONEY_AMOUNT',
+    money.JUSTIFICATION: 'MONEY_JUSTIFICATION',
+    ConversationHandler.TIMEOUT: 'TIMEOUT',
+}
 
 
 class ExpenseBot:
     def __init__(self):
         self.token = settings.TELEGRAM_BOT_TOKEN
         self.application = None
+        self.outbox_task = None
+        self.fetcher_task = None
+        self.sessions = None
+        self.sessions_task = None
+        self.metrics_server = None
+
+    def build_application(self):
+        """Сборка Application с учетом настроек (адрес Bot API и т.п.)"""
+        builder = Application.builder().token(self.token)
+        if settings.TELEGRAM_BASE_URL:
+            base_url = settings.TELEGRAM_BASE_URL.rstrip('/')
+            builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+        if settings.BOT_PERSISTENCE:
+            builder = builder.persistence(DjangoPersistence())
+        if settings.BOT_CONCURRENT_UPDATES > 1:
+            builder = builder.concurrent_updates(PerChatUpdateProcessor(settings.BOT_CONCURRENT_UPDATES))
+        builder = builder.request(build_request()).get_updates_request(build_get_updates_request())
+        if metrics_enabled():
+            builder = builder.update_queue(TimedUpdateQueue())
+        builder = builder.post_init(self.post_init).post_stop(self.post_stop)
+        return builder.build()
+
+    async def post_init(self, application):
+        """Фоновые задачи процесса runbot (вызывается из run_polling)"""
+        if settings.BOT_OUTBOX['ENABLED']:
+            self.outbox_task = asyncio.create_task(OutboxWorker(application.bot).run())
+        self.start_fetcher(application)
+        self.start_sessions()
+        await self.start_metrics_server()
+
+    async def post_stop(self, application):
+        if self.outbox_task is not None:
+            self.outbox_task.cancel()
+            self.outbox_task = None
+        self.stop_fetcher()
+        self.stop_sessions()
+        await self.stop_metrics_server()
+        shutdown_image_executor()
+
+    async def start_metrics_server(self):
+        """/metrics процесса runbot: обработчики, outbox и загрузка чеков"""
+        if metrics_enabled() and settings.BOT_METRICS['PORT'] and self.metrics_server is None:
+            self.metrics_server = await serve_metrics(settings.BOT_METRICS['HOST'], settings.BOT_METRICS['PORT'])
+
+    async def stop_metrics_server(self):
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            await self.metrics_server.wait_closed()
+            self.metrics_server = None
+
+    def start_fetcher(self, application):
+        """Фоновая загрузка чеков в процессе, который обрабатывает обновления"""
+        if settings.RECEIPT_FETCHER['ENABLED'] and self.fetcher_task is None:
+            self.fetcher_task = asyncio.create_task(ReceiptFetcher(application.bot).run())
+
+    def stop_fetcher(self):
+        if self.fetcher_task is not None:
+            self.fetcher_task.cancel()
+            self.fetcher_task = None
+
+    def start_sessions(self):
+        """Выгрузка user_data/chat_data молчащих пользователей"""
+        if self.sessions is not None and self.sessions_task is None:
+            self.sessions_task = asyncio.create_task(self.sessions.run())
+
+    def stop_sessions(self):
+        if self.sessions_task is not None:
+            self.sessions_task.cancel()
+            self.sessions_task = None
 
     async def init(self):
         """Инициализация бота"""
-        self.application = Application.builder().token(self.token).build()
+        self.application = self.build_application()
+
+        def menu_handlers():
+            return [
+                MessageHandler(filters.Regex('^(Новая заявка)$'), expense.new_expense_start),
+                MessageHandler(filters.Regex('^(Мои заявки)$'), start.my_requests),
+                MessageHandler(filters.Regex('^(Новый запрос)$'), money.new_request_start),
+                MessageHandler(filters.Regex('^(Мои запросы)$'), start.my_money_requests),
+            ]
 
         # Обработчики
         conv_handler = ConversationHandler(
-            entry_points=[CommandHandler('start', start.start_command)],
+            # Кнопки меню начинают диалог и без /start: после тайм-аута диалог
+            # завершен, а клавиатура у пользователя осталась
+            entry_points=[CommandHandler('start', start.start_command), *menu_handlers()],
             states={
-                start.START_MENU: [
-                    MessageHandler(filters.Regex('^(Новая заявка)$'), expense.new_expense_start),
-                    MessageHandler(filters.Regex('^(Мои заявки)$'), start.my_requests),
-                    MessageHandler(filters.Regex('^(Новый запрос)$'), money.new_request_start),
-                    MessageHandler(filters.Regex('^(Мои запросы)$'), start.my_money_requests),
-                ],
+                start.START_MENU: menu_handlers(),
                 expense.AMOUNT: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, expense.get_amount),
                 ],
@@ -40,13 +138,30 @@ class ExpenseBot:
                 money.JUSTIFICATION: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, money.get_justification),
                 ],
-
+                ConversationHandler.TIMEOUT: [
+                    TypeHandler(Update, start.conversation_timeout),
+                ],
             },
             fallbacks=[CommandHandler('cancel', start.cancel)],
+            name='main',
+            persistent=settings.BOT_PERSISTENCE,
+            # Диалог без ответа дольше тайм-аута завершается (нужен JobQueue - APScheduler)
+            conversation_timeout=settings.BOT_SESSIONS['CONVERSATION_TIMEOUT'] or None,
         )
 
+        if settings.BOT_FLOOD['ENABLED']:
+            # Группа -1 обрабатывается раньше диалога и может остановить обновление
+            self.application.add_handler(TypeHandler(Update, FloodControl().check), group=-1)
         self.application.add_handler(conv_handler)
+        self.sessions = SessionKeeper(self.application)
+        # Группа -2: время последнего обновления запоминается раньше всех обработчиков
+        self.application.add_handler(TypeHandler(Update, self.sessions.touch), group=-2)
         self.application.add_handler(CommandHandler("help", start.help_command))
+        self.application.add_handler(CommandHandler("stats", stats.stats_command))
+        self.application.add_handler(CallbackQueryHandler(history.history_page, pattern=r'^h:'))
+
+        if metrics_enabled():
+            instrument_handlers(self.application, STATE_NAMES)
 
         # Обработчик ошибок
         self.application.add_error_handler(self.error_handler)
@@ -56,10 +171,68 @@ class ExpenseBot:
     async def error_handler(self, update: object, context):
         """Обработчик ошибок"""
         logger = context.bot.logger
-        logger.error(f"Exception while handling an update: {context.error}")
+        logger.error(f"Exception while handling an update: {context.error}", exc_info=context.error)
+
+    async def run_webhook(self):
+        """Обработка обновлений, принятых webhook, до остановки процесса.
+
+        Обновления сохраняет в БД ASGI endpoint (см. bot.webhook), здесь их
+        забирает InboxReader и передает Application этого процесса.
+        """
+        await self.set_webhook()
+        application = self.application
+        await application.initialize()
+        await self.post_init(application)
+        await application.start()
+        try:
+            await InboxReader(application).run()
+        finally:
+            await application.stop()
+            await self.post_stop(application)
+            await application.shutdown()
+
+    async def start_polling(self, poll_interval=0.0, timeout=10):
+        """Polling внутри уже запущенного event loop (run_polling управляет циклом сам).
+
+        Нужен для сквозных тестов с фейковым Bot API (см. команду loadtest_bot).
+        """
+        if self.application is None:
+            await self.init()
+        await self.application.initialize()
+        await self.post_init(self.application)
+        await self.application.updater.start_polling(poll_interval=poll_interval, timeout=timeout)
+        await self.application.start()
+
+    async def stop_polling(self):
+        application = self.application
+        if application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+        await self.post_stop(application)
+        await application.shutdown()
+
+    async def set_webhook(self):
+        """Регистрирует адрес webhook в Telegram"""
+        if self.application is None:
+            await self.init()
+        url = settings.TELEGRAM_WEBHOOK_URL.rstrip('/') + '/' + settings.TELEGRAM_WEBHOOK_PATH.lstrip('/')
+        async with self.application.bot as tg_bot:
+            await tg_bot.set_webhook(
+                url=url,
+                secret_token=settings.TELEGRAM_WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        print(f"Webhook зарегистрирован: {url}")
 
     def run(self):
         """Запуск бота"""
+        if settings.TELEGRAM_BOT_MODE == 'webhook':
+            # Обновления принимает ASGI-приложение (config.asgi), здесь регистрируем адрес,
+            # обрабатываем очередь обновлений и рассылаем уведомления из outbox
+            asyncio.run(self.run_webhook())
+            return
+
         loop = asyncio.get_event_loop()
         if loop.is_running():
             loop.create_task(self.init())
@@ -0,0 +1,98 @@
+"""Параллельная обработка обновлений с сохранением порядка внутри чата.
+
+По умолчанию Application обрабатывает обновления строго по одному, и
+медленный обработчик одного пользователя (скачивание фото чека) задерживает
+всех. PerChatUpdateProcessor обрабатывает обновления разных чатов
+параллельно (не больше MAX_UPDATES одновременно), а обновления одного чата -
+по очереди, в порядке поступления: ConversationHandler видит их так же, как
+при последовательной обработке.
+
+Порядок: Application создает задачу на каждое обновление в порядке очереди,
+задача первым делом встает в очередь блокировки своего чата (asyncio.Lock
+отдает блокировку по очереди ожидания), и только потом занимает общий слот.
+Обновления одного чата не держат слоты, пока ждут друг друга.
+"""
+import asyncio
+import time
+
+from telegram.ext import BaseUpdateProcessor
+
+from .metrics import Gauge, Histogram
+
+chat_lock_wait = Histogram(
+    'bot_chat_lock_wait_seconds', 'Ожидание предыдущих обновлений того же чата',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+updates_in_progress = Gauge('bot_updates_in_progress', 'Обновлений в обработке')
+chats_waiting = Gauge('bot_chats_with_pending_updates', 'Чатов, у которых обрабатывается или ждет обновление')
+
+
+def chat_key(update):
+    """Ключ очереди: чат обновления, иначе пользователь; None - без упорядочивания"""
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return ('chat', chat.id)
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return ('user', user.id)
+    return None
+
+
+def pending_updates(application):
+    """Обновлений в очереди Application и у обработчика обновлений (ждут или обрабатываются)"""
+    return application.update_queue.qsize() + getattr(application.update_processor, 'pending', 0)
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """До max_concurrent_updates обновлений одновременно, внутри чата - по одному"""
+
+    __slots__ = ('_chat_locks', 'pending')
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        # ключ чата -> [блокировка, сколько обновлений ее ждут или держат]
+        self._chat_locks = {}
+        # Обновлений, которые ждут своей очереди или обрабатываются
+        self.pending = 0
+
+    async def process_update(self, update, coroutine):
+        self.pending += 1
+        try:
+            await self._process_in_order(update, coroutine)
+        finally:
+            self.pending -= 1
+
+    async def _process_in_order(self, update, coroutine):
+        key = chat_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+            chats_waiting.inc()
+        entry[1] += 1
+        started = time.monotonic()
+        try:
+            async with entry[0]:
+                chat_lock_wait.observe(time.monotonic() - started)
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[key]
+                chats_waiting.dec()
+
+    async def do_process_update(self, update, coroutine):
+        updates_in_progress.inc()
+        try:
+            await coroutine
+        finally:
+            updates_in_progress.dec()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
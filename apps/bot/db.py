@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+
+
+def get_db_executor():
+    """Пул потоков для работы бота с БД (размер - BOT_DB_POOL_SIZE)"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BOT_DB_POOL_SIZE,
+            thread_name_prefix='bot-db',
+        )
+    return _executor
+
+
+def shutdown_db_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполняет синхронный код с ORM вне event loop.
+
+    Асинхронные методы QuerySet (aget, acreate...) в Django все равно
+    уходят в единственный thread-sensitive поток asgiref, поэтому запросы
+    всех пользователей выполняются по очереди. Здесь работа распределяется
+    по ограниченному пулу потоков, у каждого потока свое соединение с БД.
+    При BOT_DB_POOL_SIZE = 0 используется прежнее поведение.
+    """
+    if settings.BOT_DB_POOL_SIZE <= 0:
+        return await sync_to_async(_call)(func, *args, **kwargs)
+    return await sync_to_async(_call, thread_sensitive=False, executor=get_db_executor())(func, *args, **kwargs)
+
+
+def _call(func, *args, **kwargs):
+    # Как в начале HTTP-запроса: закрыть соединение потока, если оно устарело
+    # (CONN_MAX_AGE) или не прошло проверку (CONN_HEALTH_CHECKS)
+    close_old_connections()
+    return func(*args, **kwargs)
@@ -0,0 +1,115 @@
+"""Поиск повторно отправленных чеков.
+
+Точное совпадение - тот же file_unique_id в Telegram или те же байты
+(SHA-256). Похожие фото (пережатые, уменьшенные, переснятые) ищутся по
+перцептивному хешу: 64 бита делятся на 4 части по 16 бит, у каждой свой
+индекс. Если хеши отличаются не более чем на 3 бита, хотя бы одна часть
+совпадает полностью, поэтому кандидатов дают 4 поиска по индексу, а не
+перебор всех чеков. Расстояние до кандидатов считается уже в Python.
+
+Проверяются все кандидаты: на похожих друг на друга чеках (один бланк,
+белый фон) значение части бывает общим у тысяч заявок, и обрезка списка
+молча теряла бы настоящий дубль. Если кандидатов больше MAX_CANDIDATES,
+это пишется в лог и в метрику - значит, хеш плохо различает такие чеки.
+"""
+import logging
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db.models import Q
+
+from .metrics import Counter
+from .models import ExpenseRequest
+
+logger = logging.getLogger(__name__)
+
+dedup_overflows = Counter(
+    'bot_receipt_dedup_overflows_total', 'Поиски похожих чеков, где кандидатов больше MAX_CANDIDATES',
+)
+
+BANDS = 4
+BAND_BITS = 16
+MASK = (1 << 64) - 1
+
+
+@dataclass(frozen=True)
+class Duplicate:
+    pk: int
+    distance: int
+
+
+def phash_fields(phash):
+    """Значения полей receipt_phash* для сохранения хеша в заявке"""
+    if phash is None:
+        return {'receipt_phash': None, **{f'receipt_phash_b{i}': None for i in range(BANDS)}}
+    unsigned = phash & MASK
+    fields = {'receipt_phash': phash}
+    for i in range(BANDS):
+        fields[f'receipt_phash_b{i}'] = (unsigned >> (BAND_BITS * i)) & ((1 << BAND_BITS) - 1)
+    return fields
+
+
+def hamming(a, b):
+    return ((a ^ b) & MASK).bit_count()
+
+
+def find_by_unique_id(file_unique_id, exclude_pk=None):
+    """Ранее загруженный чек с тем же file_unique_id (поля для повторного использования)"""
+    if not file_unique_id:
+        return None
+    return (
+        ExpenseRequest.objects
+        .filter(receipt_file_unique_id=file_unique_id, receipt_status='ready')
+        .exclude(receipt_sha256='').exclude(pk=exclude_pk)
+        .order_by('id')
+        .values(
+            'id', 'receipt_sha256', 'receipt_size', 'receipt_photo_content_type',
+            'receipt_photo_name', *phash_fields(0),
+        )
+        .first()
+    )
+
+
+def find_duplicate(sha256, phash, exclude_pk=None, max_distance=None):
+    """Самая ранняя заявка с тем же или похожим чеком, либо None"""
+    if max_distance is None:
+        max_distance = settings.RECEIPT_DEDUP['MAX_DISTANCE']
+    requests = ExpenseRequest.objects.exclude(pk=exclude_pk).order_by('id')
+
+    if sha256:
+        pk = requests.filter(receipt_sha256=sha256).values_list('id', flat=True).first()
+        if pk is not None:
+            return Duplicate(pk, 0)
+
+    # Однотонные картинки дают вырожденный хеш и совпадают с чем угодно
+    if phash is None or phash in (0, -1):
+        return None
+
+    bands = phash_fields(phash)
+    condition = Q()
+    for i in range(BANDS):
+        condition |= Q(**{f'receipt_phash_b{i}': bands[f'receipt_phash_b{i}']})
+    # Без сортировки: иначе планировщик может предпочесть обход по первичному ключу
+    candidates = requests.filter(condition).order_by().values_list('id', 'receipt_phash')
+    limit = settings.RECEIPT_DEDUP['MAX_CANDIDATES']
+    best = None
+    checked = 0
+    for pk, other in candidates.iterator(chunk_size=limit):
+        checked += 1
+        match = (hamming(phash, other), pk)
+        if match[0] <= max_distance and (best is None or match < best):
+            best = match
+    if checked > limit:
+        dedup_overflows.inc()
+        logger.warning(f"Похожие чеки: {checked} кандидатов по частям хеша {phash} (MAX_CANDIDATES {limit})")
+
+    if best is None:
+        return None
+    distance, pk = best
+    return Duplicate(pk, distance)
+
+
+def duplicate_fields(duplicate):
+    if duplicate is None:
+        return {'receipt_duplicate_of_id': None, 'receipt_duplicate_distance': None}
+    return {'receipt_duplicate_of_id': duplicate.pk, 'receipt_duplicate_distance': duplicate.distance}
@@ -0,0 +1,293 @@
+"""Потоковая выгрузка заявок для бухгалтерии: CSV, XLSX и ZIP с чеками.
+
+Строки читаются через values() (без receipt_photo) и iterator(chunk_size),
+результат отдается кусками, поэтому память не зависит от числа заявок.
+XLSX и ZIP пишутся стандартным zipfile в буфер, который опустошается после
+каждого куска (архив без перемотки, с data descriptor). Админка отдает
+итераторы через responses.streaming_response - под ASGI тоже по кускам.
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from .models import ExpenseRequest, MoneyRequest
+
+CHUNK_SIZE = 2000
+FILE_CHUNK = 64 * 1024
+
+COMMON_COLUMNS = [
+    ('id', '№'),
+    ('created_at', 'Дата'),
+    ('user__telegram_id', 'Telegram ID'),
+    ('user__full_name', 'Сотрудник'),
+    ('user__username', 'Username'),
+    ('amount', 'Сумма'),
+    ('status', 'Статус'),
+    ('justification', 'Обоснование'),
+    ('admin_comment', 'Комментарий финансиста'),
+    ('updated_at', 'Изменена'),
+]
+
+COLUMNS = {
+    ExpenseRequest: COMMON_COLUMNS + [('receipt_photo_name', 'Файл чека')],
+    MoneyRequest: COMMON_COLUMNS,
+}
+
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# Начало текста, которое Excel и LibreOffice принимают за формулу
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def export_rows(queryset, chunk_size=CHUNK_SIZE):
+    """Строки выгрузки (списки значений) в порядке создания заявок"""
+    model = queryset.model
+    fields = [name for name, _ in COLUMNS[model]]
+    statuses = dict(model.STATUS_CHOICES)
+    status_index = fields.index('status')
+    rows = queryset.order_by('created_at', 'id').values_list(*fields).iterator(chunk_size=chunk_size)
+    for row in rows:
+        row = list(row)
+        row[status_index] = statuses.get(row[status_index], row[status_index])
+        yield row
+
+
+def headers(model):
+    return [title for _, title in COLUMNS[model]]
+
+
+def _text(value):
+    """Текст ячейки; то, что начинается как формула, экранируется апострофом.
+
+    Обоснование и комментарий вводят сотрудники: "=HYPERLINK(...)" в файле
+    для бухгалтерии должно открываться как текст, а не как формула.
+    """
+    if value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _plain(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime('%d.%m.%Y %H:%M')
+    if isinstance(value, Decimal):
+        # Русский Excel ждет запятую в дробных числах
+        return str(value).replace('.', ',')
+    if isinstance(value, str):
+        return _text(value)
+    return value
+
+
+def iter_csv(model, rows, chunk_rows=500):
+    """CSV для Excel: UTF-8 с BOM, разделитель ';'"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    buffer.write('﻿')
+    writer.writerow(headers(model))
+    count = 0
+    for row in rows:
+        writer.writerow([_plain(value) for value in row])
+        count += 1
+        if count % chunk_rows == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Файл только на запись без перемотки: zipfile пишет сюда, мы забираем байты"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries):
+    """ZIP из записей (имя, итератор байтов, сжимать ли) без сборки архива в памяти"""
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, chunks, compress in entries:
+            info = zipfile.ZipInfo(name, date_time=timezone.localtime().timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            with archive.open(info, 'w', force_zip64=True) as dest:
+                for chunk in chunks:
+                    dest.write(chunk)
+                    data = buffer.pop()
+                    if data:
+                        yield data
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+# Минимальная книга XLSX: один лист, строки с inline-строками, стиль для дат
+XLSX_STATIC = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="1"><numFmt numFmtId="164" formatCode="dd.mm.yyyy hh:mm"/></numFmts>'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+EXCEL_EPOCH = datetime(1899, 12, 30)
+
+
+def _xlsx_workbook(sheet_name):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+def _xlsx_cell(value, style=0):
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, datetime):
+        local = timezone.localtime(value).replace(tzinfo=None)
+        serial = (local - EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c s="1"><v>{serial:.6f}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_ILLEGAL_XML.sub('', _text(str(value))))
+    style = f' s="{style}"' if style else ''
+    return f'<c t="inlineStr"{style}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_sheet(model, rows, chunk_rows):
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" state="frozen"/>'
+        '</sheetView></sheetViews><sheetData>',
+        '<row>' + ''.join(_xlsx_cell(title, style=2) for title in headers(model)) + '</row>',
+    ]
+    for count, row in enumerate(rows, 1):
+        parts.append('<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>')
+        if count % chunk_rows == 0:
+            yield ''.join(parts).encode('utf-8')
+            parts.clear()
+    parts.append('</sheetData></worksheet>')
+    yield ''.join(parts).encode('utf-8')
+
+
+def iter_xlsx(model, rows, chunk_rows=500):
+    entries = [(name, [content.encode('utf-8')], True) for name, content in XLSX_STATIC.items()]
+    entries.append(('xl/workbook.xml', [_xlsx_workbook(str(model._meta.verbose_name_plural)).encode('utf-8')], True))
+    entries.append(('xl/worksheets/sheet1.xml', _xlsx_sheet(model, rows, chunk_rows), True))
+    return stream_zip(entries)
+
+
+def _read_file(fileobj):
+    with fileobj:
+        while chunk := fileobj.read(FILE_CHUNK):
+            yield chunk
+
+
+def _receipt_entries(queryset, chunk_size):
+    rows = (
+        queryset.order_by('created_at', 'id')
+        .values_list('id', 'receipt_sha256', 'receipt_photo_name')
+        .iterator(chunk_size=chunk_size)
+    )
+    for pk, sha256, name in rows:
+        if sha256:
+            expense = ExpenseRequest(pk=pk, receipt_sha256=sha256)
+        else:
+            # Чек еще в старом поле БД: читаем по одной заявке
+            expense = ExpenseRequest.objects.filter(pk=pk, receipt_photo__isnull=False).only(
+                'id', 'receipt_sha256', 'receipt_photo'
+            ).first()
+            if expense is None:
+                continue
+        try:
+            fileobj = expense.open_receipt()
+        except OSError:
+            continue
+        yield f"{pk}_{name or 'receipt'}", _read_file(fileobj), False
+
+
+def iter_receipts_zip(queryset, chunk_size=CHUNK_SIZE):
+    """ZIP с чеками заявок; фото уже сжаты, поэтому хранятся без сжатия"""
+    return stream_zip(_receipt_entries(queryset.filter(receipt_status='ready'), chunk_size))
+
+
+FORMATS = {
+    'csv': (iter_csv, 'text/csv; charset=utf-8'),
+    'xlsx': (iter_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def export(queryset, fmt, chunk_size=CHUNK_SIZE):
+    """Итератор байтов выгрузки queryset в формате fmt и content type"""
+    writer, content_type = FORMATS[fmt]
+    return writer(queryset.model, export_rows(queryset, chunk_size)), content_type
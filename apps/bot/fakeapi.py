@@ -0,0 +1,284 @@
+"""Локальный фейковый Telegram Bot API для сквозных и нагрузочных тестов.
+
+ASGI-приложение, на которое Application бота указывает через base_url
+(TELEGRAM_BASE_URL). Поддерживает то, что использует бот: getMe,
+getUpdates (long polling), sendMessage, editMessageText,
+answerCallbackQuery, getFile и скачивание файла. Сообщения пользователей
+кладутся в очередь методами send_text/send_photo, ответы бота можно
+дождаться через expect_reply.
+
+Отдельный сервер для ручной проверки: ``manage.py fake_bot_api``; тогда
+сообщения отправляются через POST /_fake/message, ответы читаются GET
+/_fake/messages?chat_id=...
+"""
+import asyncio
+import base64
+import contextlib
+import hashlib
+import itertools
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from urllib.parse import parse_qsl
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+FAKE_TOKEN = '123456:fake-token'
+
+
+class FakeAPIError(Exception):
+    def __init__(self, description, code=400):
+        super().__init__(description)
+        self.description = description
+        self.code = code
+
+
+class FakeBotAPI:
+    """Состояние фейкового Bot API: очередь обновлений, файлы, отправленные сообщения.
+
+    latency - задержка каждого метода API, file_latency - скачивания файла, в секундах.
+    """
+
+    def __init__(self, latency=0.0, file_latency=0.0):
+        self.latency = latency
+        self.file_latency = file_latency
+        self.bot_user = {'id': 100000001, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_expense_bot'}
+        self.updates = deque()
+        self.files = {}
+        self.sent = defaultdict(list)
+        self.calls = defaultdict(int)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._new_updates = asyncio.Event()
+        self._waiters = defaultdict(deque)
+
+    # Сторона пользователя
+
+    def _user(self, chat_id, first_name=None):
+        return {'id': chat_id, 'is_bot': False, 'first_name': first_name or f'User {chat_id}', 'username': f'u{chat_id}'}
+
+    def _push(self, chat_id, first_name=None, **content):
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': self._user(chat_id, first_name),
+            **content,
+        }
+        update = {'update_id': next(self._update_ids), 'message': message}
+        self.updates.append(update)
+        self._new_updates.set()
+        return update
+
+    def send_text(self, chat_id, text, first_name=None):
+        """Сообщение пользователя боту; команды (/start) размечаются как в Telegram"""
+        content = {'text': text}
+        if text.startswith('/'):
+            content['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return self._push(chat_id, first_name, **content)
+
+    def send_photo(self, chat_id, data, first_name=None):
+        """Фото от пользователя: файл доступен боту через getFile"""
+        number = next(self._file_ids)
+        file_id = f'photo-{chat_id}-{number}'
+        self.files[file_id] = data
+        photo = {
+            'file_id': file_id,
+            'file_unique_id': f'u{number}-{hashlib.sha256(data).hexdigest()[:8]}',
+            'width': 1280, 'height': 960, 'file_size': len(data),
+        }
+        return self._push(chat_id, first_name, photo=[photo])
+
+    def expect_reply(self, chat_id):
+        """Future со следующим сообщением бота в этот чат (вызывать до отправки обновления)"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id].append(future)
+        return future
+
+    def _deliver(self, chat_id, message):
+        self.sent[chat_id].append(message)
+        waiters = self._waiters.get(chat_id)
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result(message)
+                break
+
+    # Методы Bot API
+
+    def _bot_message(self, chat_id, text, message_id=None):
+        return {
+            'message_id': message_id or next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': self.bot_user,
+            'text': text,
+        }
+
+    async def get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        while self.updates and self.updates[0]['update_id'] < offset:
+            self.updates.popleft()
+        if not self.updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self.updates, limit))
+
+    async def send_message(self, params):
+        chat_id = int(params['chat_id'])
+        message = self._bot_message(chat_id, params.get('text', ''))
+        self._deliver(chat_id, message)
+        return message
+
+    async def edit_message_text(self, params):
+        chat_id = int(params['chat_id'])
+        message = self._bot_message(chat_id, params.get('text', ''), int(params['message_id']))
+        self._deliver(chat_id, message)
+        return message
+
+    async def get_file(self, params):
+        file_id = params.get('file_id', '')
+        if file_id not in self.files:
+            raise FakeAPIError('Bad Request: invalid file_id')
+        return {
+            'file_id': file_id,
+            'file_unique_id': file_id,
+            'file_size': len(self.files[file_id]),
+            'file_path': f'photos/{file_id}.jpg',
+        }
+
+    async def call(self, method, params):
+        self.calls[method] += 1
+        if method == 'getUpdates':
+            return await self.get_updates(params)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == 'getMe':
+            return self.bot_user
+        if method == 'sendMessage':
+            return await self.send_message(params)
+        if method == 'editMessageText':
+            return await self.edit_message_text(params)
+        if method == 'getFile':
+            return await self.get_file(params)
+        if method in ('answerCallbackQuery', 'deleteWebhook', 'setWebhook', 'setMyCommands', 'close', 'logOut'):
+            return True
+        raise FakeAPIError('Not Found', 404)
+
+    # ASGI
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while (await receive())['type'] != 'lifespan.shutdown':
+                await send({'type': 'lifespan.startup.complete'})
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+        if scope['type'] != 'http':
+            return
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        path = scope['path']
+        try:
+            if path.startswith('/file/bot'):
+                await self._send_file(path, send)
+                return
+            if path.startswith('/_fake/'):
+                result = self._control(scope, path, body)
+            elif path.startswith('/bot'):
+                method = path.rsplit('/', 1)[-1]
+                result = await self.call(method, self._params(scope, body))
+            else:
+                raise FakeAPIError('Not Found', 404)
+        except FakeAPIError as e:
+            await self._send_json(send, {'ok': False, 'error_code': e.code, 'description': e.description}, e.code)
+        except (KeyError, ValueError) as e:
+            await self._send_json(send, {'ok': False, 'error_code': 400, 'description': f'Bad Request: {e}'}, 400)
+        else:
+            await self._send_json(send, {'ok': True, 'result': result})
+
+    def _params(self, scope, body):
+        headers = dict(scope['headers'])
+        content_type = headers.get(b'content-type', b'').decode('latin-1')
+        params = dict(parse_qsl(scope.get('query_string', b'').decode()))
+        if content_type.startswith('application/json') and body:
+            params.update(json.loads(body))
+        elif content_type.startswith('application/x-www-form-urlencoded'):
+            params.update(parse_qsl(body.decode()))
+        elif body:
+            raise FakeAPIError('Bad Request: unsupported content type')
+        return params
+
+    def _control(self, scope, path, body):
+        if path == '/_fake/message' and scope['method'] == 'POST':
+            data = json.loads(body or b'{}')
+            if 'photo' in data:
+                return self.send_photo(int(data['chat_id']), base64.b64decode(data['photo']))
+            return self.send_text(int(data['chat_id']), data['text'])
+        if path == '/_fake/messages':
+            chat_id = int(dict(parse_qsl(scope['query_string'].decode()))['chat_id'])
+            return self.sent.get(chat_id, [])
+        raise FakeAPIError('Not Found', 404)
+
+    async def _send_file(self, path, send):
+        file_id = path.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+        data = self.files.get(file_id)
+        if data is None:
+            await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        self.calls['download'] += 1
+        if self.file_latency:
+            await asyncio.sleep(self.file_latency)
+        await send({
+            'type': 'http.response.start', 'status': 200,
+            'headers': [(b'content-type', b'image/jpeg'), (b'content-length', str(len(data)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': data})
+
+    async def _send_json(self, send, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        await send({
+            'type': 'http.response.start', 'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+class _EmbeddedServer(uvicorn.Server):
+    """uvicorn внутри чужого event loop: сигналы остаются у вызывающего кода"""
+
+    def capture_signals(self):
+        return contextlib.nullcontext()
+
+
+async def start_fake_api(api, host='127.0.0.1', port=0):
+    """Запускает uvicorn с api в текущем event loop. Возвращает (server, task, base_url)"""
+    config = uvicorn.Config(api, host=host, port=port, log_level='warning', lifespan='off', access_log=False)
+    server = _EmbeddedServer(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, f'http://{host}:{port}'
+
+
+async def stop_fake_api(server, task):
+    server.should_exit = True
+    await task
@@ -1,19 +1,32 @@
 from telegram import Update, ReplyKeyboardMarkup
 from telegram.ext import ContextTypes
-from bot.models import TelegramUser, ExpenseRequest
+from bot.models import ExpenseRequest
+from bot.storage import get_receipt_storage
 import logging
+from pathlib import PurePath
 from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from bot.amounts import AmountError, parse_amount
+from bot.db import run_db
+from bot.dedup import duplicate_fields, find_duplicate, phash_fields
+from bot.receipts import download_receipt, wake_receipt_fetcher
+from bot.services import create_request
+from bot.user_cache import get_user_pk, user_cache
 
 logger = logging.getLogger(__name__)
 
 from .start import START_MENU
+from .states import EXPENSE_AMOUNT, EXPENSE_JUSTIFICATION, EXPENSE_RECEIPT
 
 # Состояния для ConversationHandler
-AMOUNT, JUSTIFICATION, RECEIPT = range(1, 4)
+AMOUNT, JUSTIFICATION, RECEIPT = EXPENSE_AMOUNT, EXPENSE_JUSTIFICATION, EXPENSE_RECEIPT
 
 
 async def new_expense_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало создания новой заявки"""
+    # Сообщение, с которого начат диалог, - ключ от дублей при сохранении
+    context.user_data['request_key'] = f"{update.effective_chat.id}:{update.message.message_id}"
     await update.message.reply_text(
         "<b>Новая заявка на возмещение</b>\n\n"
         "Шаг 1 из 3\n"
@@ -26,25 +39,24 @@ async def new_expense_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def get_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение суммы"""
     try:
-        amount = float(update.message.text.replace(',', '.'))
-        if amount <= 0:
-            raise ValueError
-
-        context.user_data['amount'] = amount
-        await update.message.reply_text(
-            "Шаг 2 из 3\n"
-            "Введите обоснование расхода:\n"
-            "<i>Например: Удлинитель в 305 кабинет</i>",
-            parse_mode='HTML'
-        )
-        return JUSTIFICATION
-    except ValueError:
+        amount = parse_amount(update.message.text)
+    except AmountError as e:
         await update.message.reply_text(
-            "Неверный формат суммы!\n"
-            "Введите число (например: 1500 или 1500.50):"
+            f"{e}\n"
+            "Введите сумму числом (например: 1500, 1 500 или 1500,50):"
         )
         return AMOUNT
 
+    # Строкой: user_data сохраняется в JSON
+    context.user_data['amount'] = str(amount)
+    await update.message.reply_text(
+        "Шаг 2 из 3\n"
+        "Введите обоснование расхода:\n"
+        "<i>Например: Удлинитель в 305 кабинет</i>",
+        parse_mode='HTML'
+    )
+    return JUSTIFICATION
+
 
 async def get_justification(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение обоснования"""
@@ -66,32 +78,45 @@ async def get_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
 
     try:
-        # Получаем фото
-        photo_file = await update.message.photo[-1].get_file()
-
-        # Скачиваем фото в память
-        photo_bytes = await photo_file.download_as_bytearray()
-
-        # Определяем тип файла
-        file_extension = photo_file.file_path.split('.')[-1].lower() if photo_file.file_path else 'jpg'
-        content_type = f'image/{file_extension}' if file_extension in ['jpg', 'jpeg', 'png', 'gif'] else 'image/jpeg'
-
-        # Генерируем имя файла
-        file_name = f"receipt_{user.id}_{update.message.date.strftime('%Y%m%d_%H%M%S')}.{file_extension}"
+        photo = update.message.photo[-1]
+        file_name = f"receipt_{user.id}_{update.message.date.strftime('%Y%m%d_%H%M%S')}.jpg"
 
         # Получаем пользователя
-        tg_user = await sync_to_async(TelegramUser.objects.get)(telegram_id=user.id)
-
-        # Создаем заявку с фото в БД
-        expense = await sync_to_async(ExpenseRequest.objects.create)(
-            user=tg_user,
-            amount=context.user_data['amount'],
-            justification=context.user_data['justification'],
-            receipt_photo=bytes(photo_bytes),  # Сохраняем как bytes
-            receipt_photo_name=file_name,
-            receipt_photo_content_type=content_type,
-            status='new'
-        )
+        user_pk = await get_user_pk(user.id)
+
+        fields = {
+            'user_id': user_pk,
+            'amount': context.user_data['amount'],
+            'justification': context.user_data['justification'],
+            'receipt_file_id': photo.file_id,
+            'receipt_file_unique_id': photo.file_unique_id,
+            'receipt_photo_name': file_name,
+            'status': 'new',
+            'idempotency_key': context.user_data.get('request_key'),
+        }
+        if settings.RECEIPT_FETCHER['ENABLED']:
+            # Фото скачает фоновый загрузчик, пользователь не ждет загрузки
+            fields.update(receipt_status='pending', receipt_next_attempt_at=timezone.now())
+        else:
+            data, extension, content_type, phash = await download_receipt(context.bot, photo.file_id)
+            # Кладем фото в хранилище чеков, в БД остается только хеш
+            stored = await sync_to_async(get_receipt_storage().save, thread_sensitive=False)(data)
+            duplicate = await run_db(find_duplicate, stored.sha256, phash)
+            fields.update(
+                receipt_sha256=stored.sha256,
+                receipt_size=stored.size,
+                receipt_photo_name=PurePath(file_name).with_suffix(f'.{extension}').name,
+                receipt_photo_content_type=content_type,
+                **phash_fields(phash),
+                **duplicate_fields(duplicate),
+            )
+
+        # Создаем заявку (повтор того же диалога вернет уже созданную)
+        expense, created = await run_db(create_request, ExpenseRequest, **fields)
+        if created:
+            wake_receipt_fetcher()
+        else:
+            logger.info(f"Повтор сохранения заявки #{expense.id} от пользователя {user.id}")
 
         # Очищаем временные данные
         context.user_data.clear()
@@ -112,10 +137,13 @@ async def get_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=ReplyKeyboardMarkup([['Новая заявка', 'Мои заявки', 'Новый запрос', 'Мои запросы']], resize_keyboard=True)
         )
 
-        logger.info(f"Создана новая заявка #{expense.id} от пользователя {user.id}")
+        if created:
+            logger.info(f"Создана новая заявка #{expense.id} от пользователя {user.id}")
 
     except Exception as e:
         logger.error(f"Error creating expense: {e}")
+        # Пользователь мог быть удален в админке другого процесса
+        user_cache.invalidate(user.id)
         await update.message.reply_text(
             " Произошла ошибка при создании заявки. Попробуйте еще раз.",
             reply_markup=ReplyKeyboardMarkup([['Новая заявка', 'Мои заявки', 'Новый запрос', 'Мои запросы']], resize_keyboard=True)
@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db.models import CharField, Q, Value
+from django.utils import timezone as dj_timezone
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes
+
+from bot.db import run_db
+from bot.models import ExpenseRequest, MoneyRequest, TelegramUser
+from bot.user_cache import get_user_pk
+
+# Виды списков: заявки, запросы и общая лента
+EXPENSES, MONEY, TIMELINE = 'e', 'm', 'a'
+
+KINDS = {
+    EXPENSES: (ExpenseRequest, 'Заявка', dict(ExpenseRequest.STATUS_CHOICES)),
+    MONEY: (MoneyRequest, 'Запрос', dict(MoneyRequest.STATUS_CHOICES)),
+}
+
+TITLES = {
+    EXPENSES: "📋 Ваши заявки:",
+    MONEY: "📋 Ваши запросы:",
+    TIMELINE: "📋 Вся история:",
+}
+
+EMPTY = {
+    EXPENSES: "У вас пока нет заявок.",
+    MONEY: "У вас пока нет запросов.",
+    TIMELINE: "У вас пока нет заявок и запросов.",
+}
+
+STATUS_EMOJI = {
+    'new': '🆕',
+    'approved': '✅',
+    'paid': '💵',
+    'rejected': '❌',
+}
+
+STALE_CURSOR = "Список устарел, показана первая страница."
+
+FIELDS = ('kind', 'id', 'amount', 'status', 'created_at', 'admin_comment')
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MAX_COMMENT = 200
+
+
+def encode_cursor(created_at, pk):
+    micros = (created_at - EPOCH) // timedelta(microseconds=1)
+    return f"{micros}:{pk}"
+
+
+def decode_cursor(raw):
+    """(created_at, id) из курсора encode_cursor; ValueError, если курсор испорчен"""
+    micros, pk = raw.split(':')
+    try:
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except OverflowError as e:
+        raise ValueError(f"Курсор вне диапазона дат: {raw!r}") from e
+
+
+def _requests(kind, user_pk, cursor):
+    model = KINDS[kind][0]
+    qs = model.objects.filter(user_id=user_pk)
+    if cursor:
+        created_at, pk = cursor
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    # values() - только нужные колонки, фото чека никогда не читается
+    return qs.annotate(kind=Value(kind, output_field=CharField())).values(*FIELDS)
+
+
+def fetch_page(kind, user_pk, cursor=None, page_size=None):
+    """Одна страница истории по ключу (created_at, id), одним запросом.
+
+    Возвращает (строки, есть_следующая_страница).
+    """
+    page_size = page_size or settings.BOT_HISTORY_PAGE_SIZE
+    if kind == TIMELINE:
+        qs = _requests(EXPENSES, user_pk, cursor).order_by().union(
+            _requests(MONEY, user_pk, cursor).order_by(), all=True
+        )
+    else:
+        qs = _requests(kind, user_pk, cursor)
+    rows = list(qs.order_by('-created_at', '-id')[:page_size + 1])
+    return rows[:page_size], len(rows) > page_size
+
+
+def render_page(kind, rows):
+    lines = [TITLES[kind], ""]
+    for row in rows:
+        _, label, statuses = KINDS[row['kind']]
+        comment = row['admin_comment'] or ''
+        if len(comment) > MAX_COMMENT:
+            comment = comment[:MAX_COMMENT] + '…'
+        created_at = dj_timezone.localtime(row['created_at'])
+        lines += [
+            f"{STATUS_EMOJI.get(row['status'], '📄')} {label} #{row['id']}",
+            f"Сумма: {row['amount']} руб.",
+            f"Статус: {statuses.get(row['status'], row['status'])}",
+            f"Дата: {created_at.strftime('%d.%m.%Y %H:%M')}",
+            f"Комментарий: {comment}",
+            '-' * 30,
+        ]
+    return "\n".join(lines)
+
+
+def page_keyboard(kind, rows, has_next, is_first):
+    buttons = []
+    if not is_first:
+        buttons.append(InlineKeyboardButton("⏮ В начало", callback_data=f"h:{kind}:"))
+    if has_next:
+        last = rows[-1]
+        cursor = encode_cursor(last['created_at'], last['id'])
+        buttons.append(InlineKeyboardButton("Дальше ▶", callback_data=f"h:{kind}:{cursor}"))
+
+    keyboard = [buttons] if buttons else []
+    if kind != TIMELINE:
+        keyboard.append([InlineKeyboardButton("🗂 Вся история", callback_data=f"h:{TIMELINE}:")])
+    return InlineKeyboardMarkup(keyboard) if keyboard else None
+
+
+async def send_history(update: Update, kind):
+    """Первая страница истории в ответ на кнопку меню"""
+    try:
+        user_pk = await get_user_pk(update.effective_user.id)
+    except TelegramUser.DoesNotExist:
+        await update.message.reply_text("Вы не зарегистрированы. Нажмите /start")
+        return
+
+    rows, has_next = await run_db(fetch_page, kind, user_pk)
+    if not rows:
+        await update.message.reply_text(EMPTY[kind])
+        return
+
+    await update.message.reply_text(
+        render_page(kind, rows),
+        reply_markup=page_keyboard(kind, rows, has_next, is_first=True),
+    )
+
+
+async def history_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание истории по inline-кнопкам (callback_data вида h:<вид>:<курсор>)"""
+    query = update.callback_query
+    _, _, data = query.data.partition(':')
+    kind, _, raw_cursor = data.partition(':')
+    # Кнопка из старого сообщения или испорченные данные - показываем начало списка
+    notice = None
+    if kind not in TITLES:
+        kind, raw_cursor, notice = TIMELINE, '', STALE_CURSOR
+
+    try:
+        user_pk = await get_user_pk(query.from_user.id)
+    except TelegramUser.DoesNotExist:
+        await query.answer("Вы не зарегистрированы. Нажмите /start", show_alert=True)
+        return
+
+    try:
+        cursor = decode_cursor(raw_cursor) if raw_cursor else None
+    except ValueError:
+        cursor = None
+        notice = STALE_CURSOR
+    rows, has_next = await run_db(fetch_page, kind, user_pk, cursor)
+    await query.answer(notice)
+    if not rows:
+        await query.edit_message_text(EMPTY[kind])
+        return
+
+    try:
+        await query.edit_message_text(
+            render_page(kind, rows),
+            reply_markup=page_keyboard(kind, rows, has_next, is_first=cursor is None),
+        )
+    except BadRequest as e:
+        # Возврат к первой странице из нее же: сообщение не изменилось
+        if 'not modified' not in e.message:
+            raise
@@ -1,18 +1,24 @@
 from telegram import Update, ReplyKeyboardMarkup
 from telegram.ext import ContextTypes
-from bot.models import TelegramUser, MoneyRequest
+from bot.models import MoneyRequest
 import logging
-from asgiref.sync import sync_to_async
+from bot.amounts import AmountError, parse_amount
+from bot.db import run_db
+from bot.services import create_request
+from bot.user_cache import get_user_pk, user_cache
 
 logger = logging.getLogger(__name__)
 
 from .start import START_MENU
+from .states import MONEY_AMOUNT, MONEY_JUSTIFICATION
 
 # Состояния для ConversationHandler
-AMOUNT, JUSTIFICATION = range(1, 3)
+AMOUNT, JUSTIFICATION = MONEY_AMOUNT, MONEY_JUSTIFICATION
 
 async def new_request_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало создания новой заявки"""
+    # Сообщение, с которого начат диалог, - ключ от дублей при сохранении
+    context.user_data['request_key'] = f"{update.effective_chat.id}:{update.message.message_id}"
     await update.message.reply_text(
         "<b>Новый запрос денежных средств</b>\n\n"
         "Шаг 1 из 2\n"
@@ -25,25 +31,24 @@ async def new_request_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def get_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение суммы"""
     try:
-        amount = float(update.message.text.replace(',', '.'))
-        if amount <= 0:
-            raise ValueError
-
-        context.user_data['amount'] = amount
-        await update.message.reply_text(
-            "Шаг 2 из 2\n"
-            "Введите обоснование запроса:\n"
-            "<i>Например: необходимо заправить машину</i>",
-            parse_mode='HTML'
-        )
-        return JUSTIFICATION
-    except ValueError:
+        amount = parse_amount(update.message.text)
+    except AmountError as e:
         await update.message.reply_text(
-            "Неверный формат суммы!\n"
-            "Введите число (например: 1500 или 1500.50):"
+            f"{e}\n"
+            "Введите сумму числом (например: 1500, 1 500 или 1500,50):"
         )
         return AMOUNT
 
+    # Строкой: user_data сохраняется в JSON
+    context.user_data['amount'] = str(amount)
+    await update.message.reply_text(
+        "Шаг 2 из 2\n"
+        "Введите обоснование запроса:\n"
+        "<i>Например: необходимо заправить машину</i>",
+        parse_mode='HTML'
+    )
+    return JUSTIFICATION
+
 
 async def get_justification(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение обоснования и сохранение заявки"""
@@ -55,14 +60,20 @@ async def get_justification(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return JUSTIFICATION
 
         # Получаем пользователя
-        tg_user = await sync_to_async(TelegramUser.objects.get)(telegram_id=user.id)
+        user_pk = await get_user_pk(user.id)
 
-        request = await sync_to_async(MoneyRequest.objects.create)(
-            user=tg_user,
+        # Повтор того же диалога вернет уже созданный запрос
+        request, created = await run_db(
+            create_request,
+            MoneyRequest,
+            user_id=user_pk,
             amount=context.user_data['amount'],
             justification=justification,
-            status='new'
+            status='new',
+            idempotency_key=context.user_data.get('request_key'),
         )
+        if not created:
+            logger.info(f"Повтор сохранения запроса #{request.id} от пользователя {user.id}")
 
         # Очищаем временные данные
         context.user_data.clear()
@@ -83,10 +94,13 @@ async def get_justification(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=ReplyKeyboardMarkup([['Новая заявка', 'Мои заявки', 'Новый запрос', 'Мои запросы']], resize_keyboard=True)
         )
 
-        logger.info(f"Создан новый запрос #{request.id} от пользователя {user.id}")
+        if created:
+            logger.info(f"Создан новый запрос #{request.id} от пользователя {user.id}")
 
     except Exception as e:
         logger.error(f"Error creating expense: {e}")
+        # Пользователь мог быть удален в админке другого процесса
+        user_cache.invalidate(user.id)
         await update.message.reply_text(
             " Произошла ошибка при создании запроса. Попробуйте еще раз.",
             reply_markup=ReplyKeyboardMarkup([['Новая заявка', 'Мои заявки', 'Новый запрос', 'Мои запросы']], resize_keyboard=True)
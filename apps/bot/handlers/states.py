@@ -0,0 +1,16 @@
+"""Состояния ConversationHandler 'main' (см. ExpenseBot.init).
+
+Заявки и запросы идут через один ConversationHandler, поэтому номера
+состояний всех диалогов задаются здесь, подряд: одинаковый номер у двух
+диалогов молча заменил бы обработчики одного обработчиками другого.
+Номера сохраняются в BotState - существующие не меняем, новые добавляем
+в конец.
+"""
+(
+    START_MENU,
+    EXPENSE_AMOUNT,
+    EXPENSE_JUSTIFICATION,
+    EXPENSE_RECEIPT,
+    MONEY_AMOUNT,
+    MONEY_JUSTIFICATION,
+) = range(6)
@@ -0,0 +1,54 @@
+from django.db.models import Sum
+from django.utils import timezone
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from bot.db import run_db
+from bot.models import ExpenseRequest, MoneyRequest, RequestRollup, TelegramUser
+from bot.user_cache import get_user_pk
+
+from .history import STATUS_EMOJI
+
+SECTIONS = (
+    ('expense', "📋 Заявки на возмещение", dict(ExpenseRequest.STATUS_CHOICES)),
+    ('money', "💰 Запросы денежных средств", dict(MoneyRequest.STATUS_CHOICES)),
+)
+
+
+def _load_stats(user_pk):
+    """Итоги пользователя из сводки: за все время и за текущий месяц"""
+    month = timezone.localdate().replace(day=1)
+    rollups = RequestRollup.objects.filter(user_id=user_pk, count__gt=0)
+    totals = rollups.values('kind', 'status').annotate(n=Sum('count'), total=Sum('amount'))
+    current = rollups.filter(month=month).values('kind').annotate(n=Sum('count'), total=Sum('amount'))
+    return list(totals), {row['kind']: row for row in current}
+
+
+def render_stats(totals, current):
+    lines = ["📊 <b>Ваша статистика</b>"]
+    for kind, title, statuses in SECTIONS:
+        rows = [row for row in totals if row['kind'] == kind]
+        if not rows:
+            continue
+        lines.append(f"\n<b>{title}</b>")
+        for status, label in statuses.items():
+            for row in rows:
+                if row['status'] == status:
+                    lines.append(f"{STATUS_EMOJI.get(status, '')} {label}: {row['n']} на {row['total']:.2f} руб.")
+        month = current.get(kind)
+        if month:
+            lines.append(f"В этом месяце: {month['n']} на {month['total']:.2f} руб.")
+    if len(lines) == 1:
+        lines.append("\nУ вас пока нет заявок и запросов.")
+    return "\n".join(lines)
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /stats"""
+    try:
+        user_pk = await get_user_pk(update.effective_user.id)
+    except TelegramUser.DoesNotExist:
+        await update.message.reply_text("Сначала отправьте /start")
+        return
+    totals, current = await run_db(_load_stats, user_pk)
+    await update.message.reply_text(render_stats(totals, current), parse_mode='HTML')
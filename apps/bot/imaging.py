@@ -0,0 +1,112 @@
+"""Нормализация фото чеков при приеме: уменьшение, перекодирование, без метаданных.
+
+Декодирование и сжатие занимают десятки миллисекунд CPU на фото, поэтому
+выполняются в отдельном пуле процессов, а не в event loop бота.
+"""
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from PIL import Image, ImageOps
+
+FORMATS = {
+    'WEBP': ('image/webp', 'webp'),
+    'JPEG': ('image/jpeg', 'jpg'),
+}
+
+_executor = None
+
+
+@dataclass(frozen=True)
+class NormalizedImage:
+    data: bytes
+    content_type: str
+    extension: str
+    width: int
+    height: int
+    phash: int
+
+
+def perceptual_hash(image) -> int:
+    """dHash: 64 бита - светлее ли каждый пиксель соседа справа на картинке 9x8.
+
+    Не меняется при пережатии и уменьшении фото, поэтому повторно
+    отправленный чек дает тот же или близкий (по Хэммингу) хеш.
+    Возвращается как знаковое 64-битное число, чтобы поместиться в BigIntegerField.
+    """
+    small = image.convert('L').resize((9, 8), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left, right = pixels[row * 9 + col], pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def hash_image_bytes(data: bytes) -> int:
+    """Перцептивный хеш фото, которое не нормализуется"""
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft('L', (64, 64))
+        return perceptual_hash(ImageOps.exif_transpose(image))
+
+
+def normalize_image(data: bytes, max_edge: int, fmt: str = 'WEBP', quality: int = 80) -> NormalizedImage:
+    """Приводит фото к max_edge по длинной стороне и кодирует в fmt.
+
+    EXIF (включая геометку), ICC и прочие метаданные не переносятся,
+    ориентация из EXIF применяется к пикселям заранее.
+    """
+    content_type, extension = FORMATS[fmt]
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG можно декодировать сразу в уменьшенном масштабе (1/2, 1/4, 1/8)
+        image.draft('RGB', (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge))
+
+        keep_alpha = fmt == 'WEBP' and image.mode in ('RGBA', 'LA', 'P')
+        mode = 'RGBA' if keep_alpha else 'RGB'
+        if image.mode != mode:
+            image = image.convert(mode)
+
+        out = io.BytesIO()
+        if fmt == 'WEBP':
+            # method 2 вдвое быстрее стандартного 4 при файлах больше на ~8%
+            image.save(out, 'WEBP', quality=quality, method=2)
+        else:
+            image.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+        return NormalizedImage(
+            out.getvalue(), content_type, extension, image.width, image.height, perceptual_hash(image)
+        )
+
+
+def get_image_executor():
+    """Пул процессов для обработки фото (размер - RECEIPT_NORMALIZATION['WORKERS'])"""
+    global _executor
+    if _executor is None:
+        # spawn: процесс бота многопоточный, fork в нем небезопасен
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.RECEIPT_NORMALIZATION['WORKERS'],
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _executor
+
+
+def shutdown_image_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+async def normalize_receipt(data: bytes) -> NormalizedImage:
+    """Нормализует фото чека по настройкам RECEIPT_NORMALIZATION, не блокируя event loop"""
+    config = settings.RECEIPT_NORMALIZATION
+    args = (data, config['MAX_EDGE'], config['FORMAT'], config['QUALITY'])
+    if config['WORKERS'] <= 0:
+        return await sync_to_async(normalize_image, thread_sensitive=False)(*args)
+    return await asyncio.get_running_loop().run_in_executor(get_image_executor(), normalize_image, *args)
@@ -0,0 +1,83 @@
+"""Очередь обновлений, принятых webhook (модель WebhookUpdate).
+
+ASGI-воркеров может быть сколько угодно: endpoint (bot.webhook) только
+проверяет обновление и сохраняет его в БД. Обрабатывает очередь один процесс
+runbot, у которого единственный Application. Поэтому все чаты обслуживает
+один воркер: состояние диалогов и user_data не расходятся между процессами,
+сообщения одного чата обрабатываются по порядку, а после перезапуска
+runbot состояние загружается из БД (DjangoPersistence).
+"""
+import asyncio
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from telegram import Update
+
+from .db import run_db
+from .metrics import Counter
+from .models import WebhookUpdate
+
+logger = logging.getLogger(__name__)
+
+inbox_updates = Counter('bot_webhook_inbox_updates_total', 'Обновления из очереди webhook', ['result'])
+
+
+def store_update(update_id, data):
+    """Сохраняет обновление; повтор того же update_id от Telegram игнорируется"""
+    WebhookUpdate.objects.bulk_create([WebhookUpdate(update_id=update_id, data=data)], ignore_conflicts=True)
+
+
+def _claim_batch(batch_size):
+    """Забирает и удаляет из очереди самые старые обновления.
+
+    Как и при polling, обновление, взятое в работу, при падении процесса
+    теряется: Telegram его уже не повторит.
+    """
+    with transaction.atomic():
+        batch = list(
+            WebhookUpdate.objects
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('id', 'data')[:batch_size]
+        )
+        if batch:
+            WebhookUpdate.objects.filter(id__in=[pk for pk, _ in batch]).delete()
+    return [data for _, data in batch]
+
+
+class InboxReader:
+    """Передает обновления из очереди webhook в update_queue Application"""
+
+    def __init__(self, application, config=None):
+        config = {**settings.BOT_WEBHOOK_INBOX, **(config or {})}
+        self.application = application
+        self.batch_size = config['BATCH_SIZE']
+        self.poll_interval = config['POLL_INTERVAL']
+
+    async def process_batch(self):
+        """Один проход: забрать пачку и поставить в очередь Application. Возвращает размер пачки"""
+        batch = await run_db(_claim_batch, self.batch_size)
+        for data in batch:
+            try:
+                update = Update.de_json(data, self.application.bot)
+            except Exception:
+                inbox_updates.inc(result='invalid')
+                logger.warning(f"Некорректное обновление в очереди webhook: {str(data)[:200]}")
+                continue
+            inbox_updates.inc(result='queued')
+            await self.application.update_queue.put(update)
+        return len(batch)
+
+    async def run(self):
+        logger.info("Обработка очереди webhook запущена")
+        while True:
+            try:
+                processed = await self.process_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка чтения очереди webhook")
+                processed = 0
+            if processed < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,229 @@
+"""Метрики обработки обновлений бота.
+
+Каждый обработчик из ExpenseBot.init оборачивается (instrument_handlers):
+время обработчика, время запросов к БД и к Bot API внутри него и задержка
+обновления в очереди Application пишутся в гистограммы с метками состояния
+диалога и обработчика. Время БД и Bot API собирается через contextvar:
+run_db копирует контекст в поток пула, поэтому запросы из потока
+засчитываются обновлению, которое их вызвало.
+
+При BOT_METRICS['ENABLED'] = False ничего не оборачивается и не
+подключается - накладных расходов нет. Метрики отдает /metrics в Django
+(bot.views.metrics) и HTTP-сервер процесса runbot (serve_metrics).
+"""
+import asyncio
+import contextvars
+import logging
+import time
+
+from django.conf import settings
+from telegram.ext import ApplicationHandlerStop, ConversationHandler
+from telegram.request import HTTPXRequest
+
+from .metrics import Counter, Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+handler_duration = Histogram(
+    'bot_handler_seconds', 'Время обработчика обновления', ['state', 'handler'],
+)
+handler_db_time = Histogram(
+    'bot_handler_db_seconds', 'Время запросов к БД за одно обновление', ['state', 'handler'],
+)
+handler_api_time = Histogram(
+    'bot_handler_telegram_seconds', 'Время запросов к Bot API за одно обновление', ['state', 'handler'],
+)
+handler_errors = Counter(
+    'bot_handler_errors_total', 'Исключения в обработчиках', ['state', 'handler'],
+)
+queue_lag = Histogram(
+    'bot_update_queue_lag_seconds', 'Время от постановки обновления в очередь до начала обработки', ['state'],
+)
+api_duration = Histogram(
+    'bot_telegram_request_seconds', 'Время запросов к Bot API', ['method'],
+)
+
+# Время БД и Bot API текущего обновления
+_timing = contextvars.ContextVar('bot_update_timing', default=None)
+# Когда текущее обновление попало в очередь Application (time.monotonic)
+_enqueued_at = contextvars.ContextVar('bot_update_enqueued_at', default=None)
+
+NO_STATE = 'none'
+
+# Точные замеры для нагрузочного теста (collect_samples), иначе None
+_samples = None
+
+
+class UpdateTiming:
+    __slots__ = ('db', 'api')
+
+    def __init__(self):
+        self.db = 0.0
+        self.api = 0.0
+
+
+def metrics_enabled():
+    return settings.BOT_METRICS['ENABLED']
+
+
+def time_query(execute, sql, params, many, context):
+    """execute_wrapper соединения: время запроса засчитывается текущему обновлению"""
+    timing = _timing.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.db += time.perf_counter() - started
+
+
+class TimedUpdateQueue(asyncio.Queue):
+    """Очередь обновлений Application, которая помнит время постановки.
+
+    Элемент забирает цикл Application и запускает обработку в том же
+    контексте, поэтому время постановки передается через contextvar.
+    """
+
+    def _put(self, item):
+        super()._put((time.monotonic(), item))
+
+    def _get(self):
+        enqueued_at, item = super()._get()
+        _enqueued_at.set(enqueued_at)
+        return item
+
+
+class InstrumentedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest, который замеряет время каждого метода Bot API"""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            # Файлы скачиваются по /file/bot<token>/<path> - метод не из URL
+            api_duration.observe(elapsed, method=url.rsplit('/', 1)[-1] if '/file/' not in url else 'download')
+            timing = _timing.get()
+            if timing is not None:
+                timing.api += elapsed
+
+
+def instrumented(callback, state):
+    """Обертка обработчика, записывающая метрики с меткой состояния диалога"""
+    name = getattr(callback, '__name__', type(callback).__name__)
+    module = getattr(callback, '__module__', '') or ''
+    label = f"{module.rsplit('.', 1)[-1]}.{name}" if module else name
+
+    async def wrapper(update, context):
+        started = time.monotonic()
+        enqueued_at = _enqueued_at.get()
+        if enqueued_at is not None:
+            # Задержка одна на обновление, а оберток за обновление может сработать
+            # несколько (разные группы): пишет первая. Обработчики одного
+            # обновления выполняются в одном контексте
+            _enqueued_at.set(None)
+            queue_lag.observe(started - enqueued_at, state=state)
+        timing = UpdateTiming()
+        token = _timing.set(timing)
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            # Штатная остановка обработки обновления, не ошибка
+            raise
+        except Exception:
+            handler_errors.inc(state=state, handler=label)
+            raise
+        finally:
+            _timing.reset(token)
+            elapsed = time.monotonic() - started
+            handler_duration.observe(elapsed, state=state, handler=label)
+            handler_db_time.observe(timing.db, state=state, handler=label)
+            handler_api_time.observe(timing.api, state=state, handler=label)
+            if _samples is not None:
+                _samples.append((state, label, elapsed, timing.db, timing.api))
+
+    wrapper.__name__ = name
+    wrapper.__wrapped__ = callback
+    return wrapper
+
+
+def collect_samples():
+    """Начинает запись (состояние, обработчик, время, время БД, время API) каждого вызова"""
+    global _samples
+    _samples = []
+    return _samples
+
+
+def stop_collecting():
+    global _samples
+    samples, _samples = _samples, None
+    return samples
+
+
+def _wrap(handler, state):
+    if isinstance(handler, ConversationHandler):
+        instrument_conversation(handler)
+    elif not hasattr(handler.callback, '__wrapped__'):
+        handler.callback = instrumented(handler.callback, state)
+
+
+def instrument_conversation(conversation, state_names=None):
+    state_names = state_names or {}
+    for handler in conversation.entry_points:
+        _wrap(handler, 'entry')
+    for state, handlers in conversation.states.items():
+        for handler in handlers:
+            _wrap(handler, state_names.get(state, str(state)))
+    for handler in conversation.fallbacks:
+        _wrap(handler, 'fallback')
+
+
+def instrument_handlers(application, state_names=None):
+    """Оборачивает все зарегистрированные обработчики Application.
+
+    state_names - имена состояний диалогов для меток ({0: 'START_MENU', ...}).
+    Группы с отрицательными номерами - служебные (ограничение потока и т.п.):
+    они видят каждое обновление, и их время не относится к обработчикам
+    пользователя. Отброшенные обновления считает bot_updates_dropped_total.
+    """
+    for group, handlers in application.handlers.items():
+        if group < 0:
+            continue
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                instrument_conversation(handler, state_names)
+            else:
+                _wrap(handler, NO_STATE)
+
+
+async def _handle_metrics_request(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # Заголовки не нужны, но их надо дочитать
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, body = '200 OK', registry.render().encode('utf-8')
+        else:
+            status, body = '404 Not Found', b'Not found\n'
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(host, port):
+    """HTTP /metrics процесса runbot (у polling-бота нет своего веб-сервера)"""
+    server = await asyncio.start_server(_handle_metrics_request, host, port)
+    logger.info(f"Метрики бота: http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import statistics
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from bot.db import shutdown_db_executor
+from bot.handlers import money, start
+from bot.models import TelegramUser
+
+# Пользователи бенчмарка заводятся с заведомо нереальными telegram_id
+BENCH_ID_BASE = 9_000_000_000
+
+
+class FakeMessage:
+    """Минимальная замена telegram.Message для вызова обработчиков напрямую"""
+
+    def __init__(self, text, message_id):
+        self.text = text
+        self.message_id = message_id
+        self.date = datetime.now(timezone.utc)
+        self.photo = []
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def fake_update(user, text, message_id):
+    return SimpleNamespace(
+        effective_user=user, effective_chat=SimpleNamespace(id=user.id), message=FakeMessage(text, message_id)
+    )
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест обработчиков бота: диалоги в секунду при общем потоке БД и при пуле'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Одновременных диалогов')
+        parser.add_argument('--rounds', type=int, default=5, help='Диалогов на пользователя')
+        parser.add_argument('--pool-size', type=int, default=8, help='Размер пула потоков БД')
+        parser.add_argument('--db-latency', type=float, default=0.0,
+                            help='Искусственная задержка на каждый SQL-запрос, мс (имитация сетевой БД)')
+        parser.add_argument('--mode', choices=['shared', 'pool', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        latency = options['db_latency'] / 1000
+        # Логи о каждой созданной заявке только мешают читать результат
+        logging.getLogger('bot.handlers').setLevel(logging.WARNING)
+
+        def add_latency(sender, connection, **kwargs):
+            def wrapper(execute, sql, params, many, context):
+                time.sleep(latency)
+                return execute(sql, params, many, context)
+            connection.execute_wrappers.append(wrapper)
+
+        if latency:
+            connection_created.connect(add_latency, weak=False)
+
+        modes = ['shared', 'pool'] if options['mode'] == 'both' else [options['mode']]
+        try:
+            for mode in modes:
+                pool_size = options['pool_size'] if mode == 'pool' else 0
+                self._cleanup()
+                with override_settings(BOT_DB_POOL_SIZE=pool_size):
+                    durations, elapsed = asyncio.run(self._run(options['users'], options['rounds']))
+                    shutdown_db_executor()
+                self._report(mode, pool_size, durations, elapsed)
+        finally:
+            self._cleanup()
+            if latency:
+                connection_created.disconnect(add_latency)
+
+    async def _run(self, users, rounds):
+        durations = []
+
+        async def conversation(index):
+            user = SimpleNamespace(
+                id=BENCH_ID_BASE + index, username=f'bench{index}',
+                first_name='Bench', last_name=str(index),
+            )
+            context = SimpleNamespace(user_data={})
+            message_id = 0
+            for _ in range(rounds):
+                started = time.perf_counter()
+                for handler, text in (
+                    (start.start_command, '/start'),
+                    (money.new_request_start, 'Новый запрос'),
+                    (money.get_amount, '1500'),
+                    (money.get_justification, 'Нагрузочный тест'),
+                    (start.my_money_requests, 'Мои запросы'),
+                ):
+                    message_id += 1
+                    await handler(fake_update(user, text, message_id), context)
+                durations.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(conversation(i) for i in range(users)))
+        return durations, time.perf_counter() - started
+
+    def _report(self, mode, pool_size, durations, elapsed):
+        durations = sorted(durations)
+        p50 = statistics.median(durations) * 1000
+        p99 = durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1000
+        label = 'общий поток asgiref' if mode == 'shared' else f'пул из {pool_size} потоков'
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: {len(durations)} диалогов за {elapsed:.2f} с, "
+            f"{len(durations) / elapsed:.1f} диалогов/с, p50 {p50:.0f} мс, p99 {p99:.0f} мс"
+        ))
+
+    def _cleanup(self):
+        TelegramUser.objects.filter(telegram_id__gte=BENCH_ID_BASE).delete()
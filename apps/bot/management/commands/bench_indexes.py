@@ -0,0 +1,128 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from bot.models import ExpenseRequest, MoneyRequest, TelegramUser
+
+from .bench_handlers import BENCH_ID_BASE
+
+MODELS = {'expense': ExpenseRequest, 'money': MoneyRequest}
+
+
+class Command(BaseCommand):
+    help = 'Заполняет БД тестовыми заявками и сравнивает планы и время запросов без индексов и с ними'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Сколько заявок создать')
+        parser.add_argument('--users', type=int, default=2000, help='Сколько пользователей')
+        parser.add_argument('--model', choices=list(MODELS), default='expense')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов каждого запроса')
+        parser.add_argument('--keep', action='store_true', help='Не удалять тестовые данные после прогона')
+        parser.add_argument('--reuse', action='store_true', help='Не заполнять, использовать уже созданные данные')
+
+    def handle(self, *args, **options):
+        model = MODELS[options['model']]
+        if not options['reuse']:
+            self._cleanup(model)
+            self._seed(model, options['rows'], options['users'], options['batch_size'])
+
+        user_pk = (
+            TelegramUser.objects.filter(telegram_id__gte=BENCH_ID_BASE)
+            .order_by('telegram_id').values_list('pk', flat=True).first()
+        )
+        month_ago = timezone.now() - timedelta(days=30)
+        queries = {
+            'история пользователя': lambda: model.objects.filter(user_id=user_pk).order_by('-created_at', '-id')[:5],
+            'фильтр по статусу': lambda: model.objects.filter(status='approved').order_by('-created_at')[:100],
+            'статус + период': lambda: model.objects.filter(status='paid', created_at__gte=month_ago).order_by('-created_at')[:100],
+            'очередь новых': lambda: model.objects.filter(status='new').order_by('-created_at')[:100],
+        }
+
+        indexes = model._meta.indexes
+        try:
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.remove_index(model, index)
+            self._analyze(model)
+            before = self._measure(queries, options['repeat'], 'без индексов')
+        finally:
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.add_index(model, index)
+        self._analyze(model)
+        after = self._measure(queries, options['repeat'], 'с индексами')
+
+        self.stdout.write(self.style.MIGRATE_HEADING('\nИтог (медиана, мс):'))
+        for name in queries:
+            speedup = before[name] / after[name] if after[name] else float('inf')
+            self.stdout.write(f"  {name}: {before[name]:.2f} -> {after[name]:.2f} (x{speedup:.1f})")
+
+        if not options['keep']:
+            self._cleanup(model)
+
+    def _seed(self, model, rows, users, batch_size):
+        self.stdout.write(f"Создаю {users} пользователей и {rows} заявок...")
+        TelegramUser.objects.bulk_create(
+            [TelegramUser(telegram_id=BENCH_ID_BASE + i, full_name=f'Bench {i}') for i in range(users)],
+            batch_size=batch_size,
+        )
+        user_pks = list(
+            TelegramUser.objects.filter(telegram_id__gte=BENCH_ID_BASE).values_list('pk', flat=True)
+        )
+        # Реалистичное распределение: большинство заявок уже обработано
+        statuses = ['paid'] * 70 + ['approved'] * 15 + ['rejected'] * 10 + ['new'] * 5
+        now = timezone.now()
+        extra = {'receipt_photo_name': 'bench.jpg'} if model is ExpenseRequest else {}
+        rng = random.Random(42)
+
+        started = time.perf_counter()
+        for offset in range(0, rows, batch_size):
+            objs = [
+                model(
+                    user_id=rng.choice(user_pks),
+                    amount=Decimal(rng.randint(100, 100_000)) / 100,
+                    justification='Нагрузочный тест',
+                    status=rng.choice(statuses),
+                    **extra,
+                )
+                for _ in range(min(batch_size, rows - offset))
+            ]
+            with transaction.atomic():
+                created = model.objects.bulk_create(objs)
+                # created_at с auto_now_add нельзя задать при создании - разносим по двум годам
+                for obj in created:
+                    obj.created_at = now - timedelta(seconds=rng.randint(0, 2 * 365 * 24 * 3600))
+                model.objects.bulk_update(created, ['created_at'], batch_size=1000)
+            self.stdout.write(f"  {offset + len(objs)} / {rows}", ending='\r')
+        self.stdout.write(f"\nЗаполнено за {time.perf_counter() - started:.1f} с")
+
+    def _analyze(self, model):
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+
+    def _measure(self, queries, repeat, label):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n=== {label} ==="))
+        results = {}
+        for name, build in queries.items():
+            self.stdout.write(self.style.SUCCESS(f"{name}:"))
+            self.stdout.write(f"  {build().explain()}")
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(build().values_list('id', flat=True))
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = statistics.median(timings)
+            self.stdout.write(f"  медиана {results[name]:.2f} мс, максимум {max(timings):.2f} мс")
+        return results
+
+    def _cleanup(self, model):
+        # Удаление без загрузки объектов: у заявок нет сигналов и каскадов
+        model.objects.filter(user__telegram_id__gte=BENCH_ID_BASE).delete()
+        TelegramUser.objects.filter(telegram_id__gte=BENCH_ID_BASE).delete()
@@ -0,0 +1,113 @@
+import io
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import multiprocessing
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageDraw, ImageFilter
+
+from bot.imaging import FORMATS, normalize_image
+from bot.models import ExpenseRequest
+
+
+def synthetic_receipt(seed, size=(2560, 1920)):
+    """Похожее на фото чека изображение: бумага с шумом, строки текста, EXIF"""
+    rng = random.Random(seed)
+    image = Image.effect_noise(size, 24).convert('RGB')
+    paper = Image.new('RGB', size, (rng.randint(225, 245),) * 3)
+    image = Image.blend(paper, image, 0.15)
+    draw = ImageDraw.Draw(image)
+    for y in range(120, size[1] - 120, 48):
+        x = 200
+        while x < size[0] - 300:
+            width = rng.randint(20, 160)
+            draw.rectangle((x, y, x + width, y + 22), fill=(rng.randint(20, 60),) * 3)
+            x += width + rng.randint(15, 40)
+    image = image.filter(ImageFilter.GaussianBlur(1.2))
+    exif = Image.Exif()
+    exif[0x010F] = 'PhoneMaker'
+    exif[0x0112] = 1
+    out = io.BytesIO()
+    # Телефоны сохраняют фото с высоким качеством
+    image.save(out, 'JPEG', quality=95, exif=exif)
+    return out.getvalue()
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает размер и время обработки фото чеков до и после нормализации'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', help='Каталог с фото (по умолчанию - чеки из БД или синтетические)')
+        parser.add_argument('--limit', type=int, default=20, help='Сколько фото взять')
+        parser.add_argument('--format', choices=list(FORMATS), action='append', help='Форматы для сравнения')
+        parser.add_argument('--max-edge', type=int, default=settings.RECEIPT_NORMALIZATION['MAX_EDGE'])
+        parser.add_argument('--quality', type=int, default=settings.RECEIPT_NORMALIZATION['QUALITY'])
+        parser.add_argument('--workers', type=int, default=settings.RECEIPT_NORMALIZATION['WORKERS'])
+
+    def handle(self, *args, **options):
+        images = self._load(options['source'], options['limit'])
+        if not images:
+            self.stderr.write("Нет фото для теста")
+            return
+        total_in = sum(len(data) for data in images)
+        self.stdout.write(f"Фото: {len(images)}, исходный объем {total_in / 1024:.0f} KB "
+                          f"(в среднем {total_in / len(images) / 1024:.0f} KB)")
+
+        for fmt in options['format'] or [settings.RECEIPT_NORMALIZATION['FORMAT']]:
+            args = (options['max_edge'], fmt, options['quality'])
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"\n{fmt}, до {options['max_edge']} px, качество {options['quality']}"
+            ))
+
+            timings, total_out = [], 0
+            for data in images:
+                started = time.perf_counter()
+                result = normalize_image(data, *args)
+                timings.append((time.perf_counter() - started) * 1000)
+                total_out += len(result.data)
+            saved = 100 * (1 - total_out / total_in)
+            self.stdout.write(
+                f"  объем: {total_in / 1024:.0f} KB -> {total_out / 1024:.0f} KB (-{saved:.0f}%), "
+                f"в среднем {total_out / len(images) / 1024:.0f} KB на чек"
+            )
+            self.stdout.write(
+                f"  один процесс: медиана {statistics.median(timings):.1f} мс, "
+                f"максимум {max(timings):.1f} мс на фото"
+            )
+
+            if options['workers'] > 0:
+                with ProcessPoolExecutor(options['workers'], mp_context=multiprocessing.get_context('spawn')) as pool:
+                    # Прогрев: запуск процессов и импорт Pillow не входят в замер
+                    list(pool.map(normalize_image, images[:options['workers']], *[[a] * options['workers'] for a in args]))
+                    started = time.perf_counter()
+                    list(pool.map(normalize_image, images, *[[a] * len(images) for a in args]))
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"  пул из {options['workers']} процессов: {len(images) / elapsed:.1f} фото/с "
+                    f"({elapsed * 1000 / len(images):.1f} мс на фото)"
+                )
+
+    def _load(self, source, limit):
+        if source:
+            paths = sorted(p for p in Path(source).iterdir() if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.webp'))
+            return [p.read_bytes() for p in paths[:limit]]
+
+        receipts = (
+            ExpenseRequest.objects.exclude(receipt_sha256='')
+            .order_by('-created_at').values_list('pk', flat=True)[:limit]
+        )
+        images = []
+        for pk in receipts:
+            try:
+                images.append(ExpenseRequest.objects.get(pk=pk).read_receipt())
+            except OSError:
+                continue
+        if images:
+            return images
+
+        self.stdout.write("Чеков в хранилище нет, используются синтетические фото")
+        return [synthetic_receipt(seed) for seed in range(limit)]
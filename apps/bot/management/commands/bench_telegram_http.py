@@ -0,0 +1,110 @@
+import asyncio
+import io
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from PIL import Image
+from telegram import Bot
+from telegram.error import TimedOut
+
+from bot.fakeapi import FAKE_TOKEN, FakeBotAPI, start_fake_api, stop_fake_api
+from bot.management.commands.bench_receipts import synthetic_receipt
+from bot.management.commands.loadtest_bot import ms, percentile
+from bot.transport import build_get_updates_request, build_request, http_version
+
+BENCH_CHAT_ID = 9_300_000_000
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк HTTP-клиента бота на фейковом Bot API: задержка sendMessage, пока параллельно '
+            'скачиваются фото, с общим пулом соединений и с отдельным пулом для файлов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--senders', type=int, default=16, help='Одновременных отправителей sendMessage')
+        parser.add_argument('--downloads', type=int, default=32, help='Одновременных скачиваний (getFile + файл)')
+        parser.add_argument('--duration', type=float, default=5.0, help='Длительность каждого режима, с')
+        parser.add_argument('--api-latency', type=float, default=30.0, help='Задержка методов API, мс')
+        parser.add_argument('--file-latency', type=float, default=300.0, help='Задержка скачивания файла, мс')
+        parser.add_argument('--pool-size', type=int, default=settings.TELEGRAM_HTTP['API']['POOL_SIZE'],
+                            help='Размер пула API (в режиме shared - единственного пула)')
+        parser.add_argument('--media-pool-size', type=int, default=settings.TELEGRAM_HTTP['MEDIA']['POOL_SIZE'],
+                            help='Размер пула файлов в режиме split')
+        parser.add_argument('--http-version', default=settings.TELEGRAM_HTTP['HTTP_VERSION'])
+        parser.add_argument('--mode', choices=['shared', 'split', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        modes = ['shared', 'split'] if options['mode'] == 'both' else [options['mode']]
+        for mode in modes:
+            config = {
+                **settings.TELEGRAM_HTTP,
+                'HTTP_VERSION': options['http_version'],
+                'API': {**settings.TELEGRAM_HTTP['API'], 'POOL_SIZE': options['pool_size']},
+                'MEDIA': {
+                    **settings.TELEGRAM_HTTP['MEDIA'],
+                    'POOL_SIZE': options['media_pool_size'] if mode == 'split' else 0,
+                },
+            }
+            with override_settings(TELEGRAM_HTTP=config):
+                result = asyncio.run(self._run(options))
+                self._report(mode, config, result, options['duration'])
+
+    def _photo(self):
+        out = io.BytesIO()
+        Image.open(io.BytesIO(synthetic_receipt(0, size=(1280, 960)))).save(out, 'JPEG', quality=85)
+        return out.getvalue()
+
+    async def _run(self, options):
+        api = FakeBotAPI(latency=options['api_latency'] / 1000, file_latency=options['file_latency'] / 1000)
+        file_id = api.send_photo(BENCH_CHAT_ID, self._photo())['message']['photo'][0]['file_id']
+        api.updates.clear()
+        server, server_task, base_url = await start_fake_api(api)
+
+        bot = Bot(
+            FAKE_TOKEN, base_url=f'{base_url}/bot', base_file_url=f'{base_url}/file/bot',
+            request=build_request(), get_updates_request=build_get_updates_request(),
+        )
+        result = {'send': [], 'download': [], 'timeouts': 0}
+        deadline = time.perf_counter() + options['duration']
+
+        async def worker(kind, call):
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    await call()
+                except TimedOut:
+                    result['timeouts'] += 1
+                    continue
+                result[kind].append(time.perf_counter() - started)
+
+        async def send():
+            await bot.send_message(chat_id=BENCH_CHAT_ID, text='Заявка #1 создана')
+
+        async def download():
+            photo_file = await bot.get_file(file_id)
+            await photo_file.download_as_bytearray()
+
+        try:
+            async with bot:
+                await asyncio.gather(
+                    *(worker('send', send) for _ in range(options['senders'])),
+                    *(worker('download', download) for _ in range(options['downloads'])),
+                )
+        finally:
+            await stop_fake_api(server, server_task)
+        return result
+
+    def _report(self, mode, config, result, duration):
+        pools = f"API {config['API']['POOL_SIZE']}"
+        if config['MEDIA']['POOL_SIZE']:
+            pools += f", файлы {config['MEDIA']['POOL_SIZE']}"
+        sends, downloads = result['send'], result['download']
+        self.stdout.write(self.style.SUCCESS(
+            f"{mode} (пулы: {pools}, HTTP/{http_version()}): "
+            f"sendMessage {len(sends) / duration:.1f}/с, p50 {ms(percentile(sends, 0.5))}, "
+            f"p99 {ms(percentile(sends, 0.99))}; скачиваний {len(downloads) / duration:.1f}/с, "
+            f"p50 {ms(percentile(downloads, 0.5))}; таймаутов пула {result['timeouts']}"
+        ))
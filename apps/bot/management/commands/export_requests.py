@@ -0,0 +1,71 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bot.export import CHUNK_SIZE, FORMATS, export, iter_receipts_zip
+from bot.models import ExpenseRequest, MoneyRequest
+
+MODELS = {
+    'expense': ExpenseRequest,
+    'money': MoneyRequest,
+}
+
+
+def month_range(value):
+    try:
+        start = datetime.strptime(value, '%Y-%m')
+    except ValueError:
+        raise CommandError(f"Месяц должен быть в формате ГГГГ-ММ: {value}")
+    end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return timezone.make_aware(start), timezone.make_aware(end)
+
+
+def write_chunks(path, chunks):
+    size = 0
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            size += len(chunk)
+    return size
+
+
+class Command(BaseCommand):
+    help = 'Выгружает заявки для бухгалтерии в CSV или XLSX (и чеки в ZIP)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=list(MODELS), default='expense')
+        parser.add_argument('--month', help='Месяц создания заявок, ГГГГ-ММ')
+        parser.add_argument('--status', choices=[value for value, _ in ExpenseRequest.STATUS_CHOICES],
+                            action='append', help='Только заявки в этих статусах')
+        parser.add_argument('--format', choices=list(FORMATS), default='xlsx')
+        parser.add_argument('--output', required=True, help='Файл выгрузки')
+        parser.add_argument('--receipts', help='Файл ZIP для чеков (только для --kind expense)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Сколько строк читать из БД за раз')
+
+    def handle(self, *args, **options):
+        model = MODELS[options['kind']]
+        queryset = model.objects.all()
+        if options['month']:
+            start, end = month_range(options['month'])
+            queryset = queryset.filter(created_at__gte=start, created_at__lt=end)
+        if options['status']:
+            queryset = queryset.filter(status__in=options['status'])
+        if options['receipts'] and model is not ExpenseRequest:
+            raise CommandError("Чеки есть только у заявок на возмещение (--kind expense)")
+
+        started = time.perf_counter()
+        content, _ = export(queryset, options['format'], options['chunk_size'])
+        size = write_chunks(options['output'], content)
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['output']}: {size / 1024:.0f} КБ за {time.perf_counter() - started:.1f} с"
+        ))
+
+        if options['receipts']:
+            started = time.perf_counter()
+            size = write_chunks(options['receipts'], iter_receipts_zip(queryset, options['chunk_size']))
+            self.stdout.write(self.style.SUCCESS(
+                f"{options['receipts']}: {size / 1024:.0f} КБ за {time.perf_counter() - started:.1f} с"
+            ))
@@ -0,0 +1,32 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from bot.fakeapi import FAKE_TOKEN, FakeBotAPI, start_fake_api, stop_fake_api
+
+
+class Command(BaseCommand):
+    help = 'Запускает локальный фейковый Telegram Bot API (для runbot без настоящего токена)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument('--api-latency', type=float, default=0.0, help='Задержка каждого метода API, мс')
+        parser.add_argument('--file-latency', type=float, default=0.0, help='Задержка скачивания файла, мс')
+
+    def handle(self, *args, **options):
+        api = FakeBotAPI(latency=options['api_latency'] / 1000, file_latency=options['file_latency'] / 1000)
+        asyncio.run(self._serve(api, options['host'], options['port']))
+
+    async def _serve(self, api, host, port):
+        server, task, base_url = await start_fake_api(api, host, port)
+        self.stdout.write(self.style.SUCCESS(f"Фейковый Bot API: {base_url}"))
+        self.stdout.write(
+            f"Бот: TELEGRAM_BASE_URL={base_url} TELEGRAM_BOT_TOKEN={FAKE_TOKEN} python manage.py runbot\n"
+            f"Сообщение боту: curl -X POST {base_url}/_fake/message -d '{{\"chat_id\": 1, \"text\": \"/start\"}}'\n"
+            f"Ответы бота: curl '{base_url}/_fake/messages?chat_id=1'"
+        )
+        try:
+            await task
+        except asyncio.CancelledError:
+            await stop_fake_api(server, task)
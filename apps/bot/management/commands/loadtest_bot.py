@@ -0,0 +1,222 @@
+import asyncio
+import io
+import json
+import logging
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from PIL import Image
+
+from bot.concurrency import chat_lock_wait
+from bot.fakeapi import FAKE_TOKEN, FakeBotAPI, start_fake_api, stop_fake_api
+from bot.instrumentation import collect_samples, metrics_enabled, stop_collecting
+from bot.management.commands.bench_receipts import synthetic_receipt
+from bot.models import BotState, ExpenseRequest, Notification, TelegramUser
+
+LOADTEST_ID_BASE = 9_100_000_000
+
+JUSTIFICATIONS = ['Такси до аэропорта', 'Канцелярия для отдела', 'Удлинитель в 305 кабинет', 'Обед с клиентом']
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def ms(seconds):
+    return f"{seconds * 1000:.1f} мс"
+
+
+class Command(BaseCommand):
+    help = ('Сквозной нагрузочный тест бота через фейковый Bot API: N пользователей одновременно '
+            'проходят диалоги заявки (с фото чека) и запроса денежных средств')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Одновременных пользователей')
+        parser.add_argument('--flows', type=int, default=5, help='Диалогов на пользователя')
+        parser.add_argument('--money-share', type=float, default=0.5,
+                            help='Доля диалогов запроса денежных средств (остальные - заявки с чеком)')
+        parser.add_argument('--api-latency', type=float, default=0.0,
+                            help='Задержка каждого метода фейкового Bot API, мс (имитация сети до Telegram)')
+        parser.add_argument('--file-latency', type=float, default=0.0, help='Задержка скачивания файла, мс')
+        parser.add_argument('--think-time', type=float, default=0.0,
+                            help='Пауза пользователя между сообщениями, мс')
+        parser.add_argument('--concurrent-updates', type=int, default=settings.BOT_CONCURRENT_UPDATES,
+                            help='Сколько обновлений бот обрабатывает одновременно (1 - по одному)')
+        parser.add_argument('--flood-control', action='store_true',
+                            help='Не отключать ограничение потока (BOT_FLOOD): пользователи теста '
+                                 'пишут быстрее людей и упираются в лимит')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Сколько ждать ответа бота, с')
+        parser.add_argument('--wait-receipts', action='store_true',
+                            help='Дождаться фоновой загрузки всех чеков и показать время')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданных пользователей и заявки')
+
+    def handle(self, *args, **options):
+        # Логи о каждой заявке и запросе к API только мешают читать результат
+        logging.getLogger('bot').setLevel(logging.WARNING)
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        self.options = options
+        try:
+            asyncio.run(self._run())
+        finally:
+            if not options['keep']:
+                self._cleanup(options['users'])
+
+    def _photos(self, count=8):
+        photos = []
+        for seed in range(count):
+            image = Image.open(io.BytesIO(synthetic_receipt(seed, size=(1280, 960))))
+            out = io.BytesIO()
+            image.save(out, 'JPEG', quality=85)
+            photos.append(out.getvalue())
+        return photos
+
+    async def _run(self):
+        options = self.options
+        api = FakeBotAPI(latency=options['api_latency'] / 1000, file_latency=options['file_latency'] / 1000)
+        photos = await asyncio.to_thread(self._photos)
+        server, server_task, base_url = await start_fake_api(api)
+
+        # Метрики процесса не нужны: порт может быть занят запущенным ботом
+        metrics = {'ENABLED': metrics_enabled(), 'HOST': '127.0.0.1', 'PORT': 0, 'TOKEN': ''}
+        with override_settings(
+            TELEGRAM_BOT_TOKEN=FAKE_TOKEN, TELEGRAM_BASE_URL=base_url, BOT_METRICS=metrics,
+            BOT_CONCURRENT_UPDATES=options['concurrent_updates'],
+            BOT_FLOOD={**settings.BOT_FLOOD, 'ENABLED': options['flood_control']},
+        ):
+            from bot.bot import ExpenseBot
+
+            expense_bot = ExpenseBot()
+            await expense_bot.start_polling()
+            samples = collect_samples()
+            try:
+                steps, flows, elapsed = await self._load(api, photos)
+                receipts_elapsed = await self._wait_receipts() if options['wait_receipts'] else None
+            finally:
+                stop_collecting()
+                await expense_bot.stop_polling()
+                await stop_fake_api(server, server_task)
+
+        self._report(steps, flows, elapsed, samples, receipts_elapsed, api)
+
+    async def _load(self, api, photos):
+        options = self.options
+        rng = random.Random(options['seed'])
+        think = options['think_time'] / 1000
+        steps = defaultdict(list)
+        flows = defaultdict(int)
+
+        async def say(chat_id, step, send):
+            reply = api.expect_reply(chat_id)
+            started = time.perf_counter()
+            send()
+            message = await asyncio.wait_for(reply, options['timeout'])
+            steps[step].append(time.perf_counter() - started)
+            if think:
+                await asyncio.sleep(think)
+            return message['text']
+
+        async def user(index):
+            chat_id = LOADTEST_ID_BASE + index
+            await say(chat_id, '/start', lambda: api.send_text(chat_id, '/start', f'Load {index}'))
+            for _ in range(options['flows']):
+                amount = f"{rng.randint(1, 50)} {rng.randint(0, 999):03d},{rng.randint(0, 99):02d}"
+                justification = rng.choice(JUSTIFICATIONS)
+                try:
+                    if rng.random() < options['money_share']:
+                        kind = 'money'
+                        await say(chat_id, 'Новый запрос', lambda: api.send_text(chat_id, 'Новый запрос'))
+                        await say(chat_id, 'MONEY_AMOUNT', lambda: api.send_text(chat_id, amount))
+                        text = await say(chat_id, 'MONEY_JUSTIFICATION', lambda: api.send_text(chat_id, justification))
+                    else:
+                        kind = 'expense'
+                        photo = rng.choice(photos)
+                        await say(chat_id, 'Новая заявка', lambda: api.send_text(chat_id, 'Новая заявка'))
+                        await say(chat_id, 'AMOUNT', lambda: api.send_text(chat_id, amount))
+                        await say(chat_id, 'JUSTIFICATION', lambda: api.send_text(chat_id, justification))
+                        text = await say(chat_id, 'RECEIPT', lambda: api.send_photo(chat_id, photo))
+                except asyncio.TimeoutError:
+                    flows['timeout'] += 1
+                    return
+                flows[kind if 'создан' in text else 'failed'] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user(i) for i in range(options['users'])))
+        return steps, flows, time.perf_counter() - started
+
+    async def _wait_receipts(self):
+        from bot.db import run_db
+
+        def pending():
+            return ExpenseRequest.objects.filter(
+                user__telegram_id__gte=LOADTEST_ID_BASE, receipt_status='pending'
+            ).count()
+
+        started = time.perf_counter()
+        while await run_db(pending):
+            if time.perf_counter() - started > self.options['timeout'] * 10:
+                break
+            await asyncio.sleep(0.1)
+        return time.perf_counter() - started
+
+    def _report(self, steps, flows, elapsed, samples, receipts_elapsed, api):
+        done = flows['expense'] + flows['money']
+        updates = sum(len(values) for values in steps.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Диалогов: {done} (заявок {flows['expense']}, запросов {flows['money']}, "
+            f"ошибок {flows['failed']}, таймаутов {flows['timeout']}) за {elapsed:.2f} с: "
+            f"{done / elapsed:.1f} диалогов/с, {updates / elapsed:.1f} обновлений/с"
+        ))
+        replies = [value for values in steps.values() for value in values]
+        self.stdout.write(
+            f"Ответ бота (от сообщения до ответа): p50 {ms(percentile(replies, 0.5))}, "
+            f"p99 {ms(percentile(replies, 0.99))}"
+        )
+
+        if samples:
+            durations = [sample[2] for sample in samples]
+            db_times = [sample[3] for sample in samples]
+            api_times = [sample[4] for sample in samples]
+            self.stdout.write(
+                f"Обработчики: p50 {ms(percentile(durations, 0.5))}, p99 {ms(percentile(durations, 0.99))}; "
+                f"БД p50 {ms(percentile(db_times, 0.5))}, p99 {ms(percentile(db_times, 0.99))}, "
+                f"в среднем {ms(statistics.fmean(db_times))}; "
+                f"Bot API в среднем {ms(statistics.fmean(api_times))}"
+            )
+            by_state = defaultdict(list)
+            for state, handler, duration, db_time, api_time in samples:
+                by_state[(state, handler)].append((duration, db_time))
+            self.stdout.write("По состояниям (обработчик, вызовов, p50 / p99, БД p50 / p99):")
+            for (state, handler), values in sorted(by_state.items()):
+                durations = [value[0] for value in values]
+                db_times = [value[1] for value in values]
+                self.stdout.write(
+                    f"  {state:<20} {handler:<28} {len(values):>6}  "
+                    f"{ms(percentile(durations, 0.5)):>9} / {ms(percentile(durations, 0.99)):>9}  "
+                    f"{ms(percentile(db_times, 0.5)):>9} / {ms(percentile(db_times, 0.99)):>9}"
+                )
+        else:
+            self.stdout.write("Время обработчиков и БД не измерено: BOT_METRICS_ENABLED=False")
+
+        waits, wait_total = chat_lock_wait.totals()
+        if waits:
+            self.stdout.write(
+                f"Ожидание обновлений того же чата: {waits} раз, в среднем {ms(wait_total / waits)} "
+                f"(параллельно до {self.options['concurrent_updates']} обновлений)"
+            )
+        if receipts_elapsed is not None:
+            self.stdout.write(f"Фоновая загрузка чеков завершена через {receipts_elapsed:.2f} с после диалогов")
+        self.stdout.write(f"Вызовы Bot API: {json.dumps(dict(api.calls), ensure_ascii=False)}")
+
+    def _cleanup(self, users):
+        ids = [LOADTEST_ID_BASE + i for i in range(users)]
+        TelegramUser.objects.filter(telegram_id__in=ids).delete()
+        Notification.objects.filter(chat_id__in=ids).delete()
+        keys = [str(i) for i in ids] + [json.dumps([i, i]) for i in ids]
+        BotState.objects.filter(key__in=keys).delete()
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from bot.models import ExpenseRequest
+from bot.storage import get_receipt_storage
+
+
+class Command(BaseCommand):
+    help = 'Переносит фото чеков из поля БД в хранилище чеков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Сколько заявок читать из БД за один запрос')
+        parser.add_argument('--keep-blob', action='store_true',
+                            help='Не очищать старое поле receipt_photo после переноса')
+        parser.add_argument('--vacuum', action='store_true',
+                            help='Выполнить VACUUM после переноса (только SQLite)')
+
+    def handle(self, *args, **options):
+        storage = get_receipt_storage()
+        batch_size = options['batch_size']
+        moved = created = total_bytes = 0
+        last_id = 0
+
+        # Идём по первичному ключу пачками, чтобы в памяти была только одна пачка фото
+        while True:
+            batch = list(
+                ExpenseRequest.objects
+                .filter(id__gt=last_id, receipt_sha256='', receipt_photo__isnull=False)
+                .order_by('id')
+                .values_list('id', 'receipt_photo')[:batch_size]
+            )
+            if not batch:
+                break
+
+            with transaction.atomic():
+                for expense_id, photo in batch:
+                    if isinstance(photo, str):
+                        photo = photo.encode('utf-8')
+                    stored = storage.save(bytes(photo))
+                    update = {'receipt_sha256': stored.sha256, 'receipt_size': stored.size}
+                    if not options['keep_blob']:
+                        update['receipt_photo'] = None
+                    ExpenseRequest.objects.filter(id=expense_id).update(**update)
+
+                    moved += 1
+                    created += stored.created
+                    total_bytes += stored.size
+
+            last_id = batch[-1][0]
+            self.stdout.write(f"Перенесено {moved} чеков (до заявки #{last_id})")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: {moved} чеков, {total_bytes // 1024} KB, "
+            f"новых файлов {created}, совпадений {moved - created}"
+        ))
+
+        if options['vacuum']:
+            if connection.vendor == 'sqlite':
+                with connection.cursor() as cursor:
+                    cursor.execute('VACUUM')
+                self.stdout.write(self.style.SUCCESS('VACUUM выполнен'))
+            else:
+                self.stderr.write('VACUUM поддерживается только для SQLite')
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bot.models import TelegramUser
+from bot.rollups import KINDS, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводку по заявкам (RequestRollup) из таблиц заявок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Сколько пользователей пересчитывать в одной транзакции')
+        parser.add_argument('--kind', choices=list(KINDS.values()), action='append',
+                            help='Что пересчитать (по умолчанию - все)')
+
+    def handle(self, *args, **options):
+        kinds = options['kind'] or list(KINDS.values())
+        models = [model for model, kind in KINDS.items() if kind in kinds]
+        batch_size = options['batch_size']
+
+        for model in models:
+            started = time.perf_counter()
+            users = rows = 0
+            last_id = 0
+            # Пачками по пользователям: каждая транзакция короткая и не мешает боту
+            while True:
+                user_ids = list(
+                    TelegramUser.objects.filter(id__gt=last_id)
+                    .order_by('id').values_list('id', flat=True)[:batch_size]
+                )
+                if not user_ids:
+                    break
+                with transaction.atomic():
+                    rows += rebuild(model, user_ids)
+                users += len(user_ids)
+                last_id = user_ids[-1]
+
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.verbose_name_plural}: {users} пользователей, {rows} строк сводки "
+                f"за {time.perf_counter() - started:.1f} с"
+            ))
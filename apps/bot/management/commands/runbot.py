@@ -15,7 +15,7 @@ class Command(BaseCommand):
         django.setup()
 
         try:
-            from apps.bot.bot import bot
+            from bot.bot import bot
             bot.run()
         except ImportError as e:
             self.stderr.write(f"Ошибка импорта: {e}")
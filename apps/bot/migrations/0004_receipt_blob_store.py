@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0003_alter_expenserequest_status_moneyrequest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_sha256',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='SHA-256 чека'),
+        ),
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_size',
+            field=models.PositiveIntegerField(default=0, verbose_name='Размер чека'),
+        ),
+        migrations.AlterField(
+            model_name='expenserequest',
+            name='receipt_photo',
+            field=models.BinaryField(blank=True, null=True, verbose_name='Фото чека (в БД)'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0006_notification'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expenserequest',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='expense_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenserequest',
+            index=models.Index(fields=['status', '-created_at'], name='expense_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenserequest',
+            index=models.Index(condition=models.Q(('status', 'new')), fields=['-created_at'], name='expense_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='moneyrequest',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='money_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='moneyrequest',
+            index=models.Index(fields=['status', '-created_at'], name='money_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='moneyrequest',
+            index=models.Index(condition=models.Q(('status', 'new')), fields=['-created_at'], name='money_new_idx'),
+        ),
+    ]
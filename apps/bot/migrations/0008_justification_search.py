@@ -0,0 +1,76 @@
+from django.db import migrations
+
+TABLES = ['bot_expenserequest', 'bot_moneyrequest']
+
+SQLITE_FORWARD = [
+    # Внешний контент: текст хранится только в основной таблице
+    """CREATE VIRTUAL TABLE {table}_fts USING fts5(
+        justification, content='{table}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER {table}_fts_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {table}_fts(rowid, justification) VALUES (new.id, new.justification);
+    END""",
+    """CREATE TRIGGER {table}_fts_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, justification) VALUES ('delete', old.id, old.justification);
+    END""",
+    """CREATE TRIGGER {table}_fts_au AFTER UPDATE OF justification ON {table} BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, justification) VALUES ('delete', old.id, old.justification);
+        INSERT INTO {table}_fts(rowid, justification) VALUES (new.id, new.justification);
+    END""",
+    "INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS {table}_fts_ai",
+    "DROP TRIGGER IF EXISTS {table}_fts_ad",
+    "DROP TRIGGER IF EXISTS {table}_fts_au",
+    "DROP TABLE IF EXISTS {table}_fts",
+]
+
+POSTGRES_FORWARD = [
+    "CREATE INDEX IF NOT EXISTS {table}_fts_idx ON {table} USING gin (to_tsvector('russian', justification))",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS {table}_fts_idx",
+]
+
+
+def _has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def _run(schema_editor, sqlite_statements, postgres_statements):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        statements = postgres_statements
+    elif connection.vendor == 'sqlite' and _has_fts5(connection):
+        statements = sqlite_statements
+    else:
+        # Другие БД и SQLite без FTS5: поиск работает через icontains
+        return
+    for table in TABLES:
+        for sql in statements:
+            schema_editor.execute(sql.format(table=table))
+
+
+def create_search_indexes(apps, schema_editor):
+    _run(schema_editor, SQLITE_FORWARD, POSTGRES_FORWARD)
+
+
+def drop_search_indexes(apps, schema_editor):
+    _run(schema_editor, SQLITE_BACKWARD, POSTGRES_BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0007_request_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
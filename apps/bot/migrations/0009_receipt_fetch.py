@@ -0,0 +1,47 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0008_justification_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Попыток загрузки чека'),
+        ),
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_error',
+            field=models.TextField(blank=True, default='', verbose_name='Ошибка загрузки чека'),
+        ),
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_file_id',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='file_id чека в Telegram'),
+        ),
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_file_unique_id',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='file_unique_id чека'),
+        ),
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Следующая попытка загрузки'),
+        ),
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_status',
+            field=models.CharField(choices=[('pending', 'Загружается'), ('ready', 'Загружен'), ('failed', 'Ошибка')], default='ready', max_length=10, verbose_name='Загрузка чека'),
+        ),
+        migrations.AddIndex(
+            model_name='expenserequest',
+            index=models.Index(condition=models.Q(('receipt_status', 'pending')), fields=['receipt_next_attempt_at'], name='expense_receipt_queue_idx'),
+        ),
+    ]
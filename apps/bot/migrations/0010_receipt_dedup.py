@@ -0,0 +1,69 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0009_receipt_fetch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_duplicate_distance',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Отличие от чека-оригинала (бит)'),
+        ),
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bot.expenserequest', verbose_name='Чек совпадает с заявкой'),
+        ),
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_phash',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='Перцептивный хеш чека'),
+        ),
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_phash_b0',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_phash_b1',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_phash_b2',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='expenserequest',
+            name='receipt_phash_b3',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='expenserequest',
+            index=models.Index(fields=['receipt_file_unique_id'], name='expense_file_unique_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenserequest',
+            index=models.Index(fields=['receipt_phash_b0'], name='expense_phash_b0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenserequest',
+            index=models.Index(fields=['receipt_phash_b1'], name='expense_phash_b1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenserequest',
+            index=models.Index(fields=['receipt_phash_b2'], name='expense_phash_b2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenserequest',
+            index=models.Index(fields=['receipt_phash_b3'], name='expense_phash_b3_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncMonth
+
+
+def fill_rollups(apps, schema_editor):
+    """Начальное заполнение сводки из уже существующих заявок"""
+    RequestRollup = apps.get_model('bot', 'RequestRollup')
+    for kind, model_name in (('expense', 'ExpenseRequest'), ('money', 'MoneyRequest')):
+        rows = (
+            apps.get_model('bot', model_name).objects.order_by()
+            .values('user_id', 'status', month=TruncMonth('created_at', output_field=DateField()))
+            .annotate(n=Count('id'), total=Sum('amount'))
+        )
+        RequestRollup.objects.bulk_create(
+            [
+                RequestRollup(
+                    kind=kind, user_id=row['user_id'], month=row['month'], status=row['status'],
+                    count=row['n'], amount=row['total'],
+                )
+                for row in rows.iterator(chunk_size=2000)
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0010_receipt_dedup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('expense', 'Заявки на возмещение'), ('money', 'Запросы денежных средств')], max_length=10, verbose_name='Тип')),
+                ('month', models.DateField(verbose_name='Месяц')),
+                ('status', models.CharField(max_length=20, verbose_name='Статус')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bot.telegramuser', verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Сводка по заявкам',
+                'verbose_name_plural': 'Сводка по заявкам',
+                'indexes': [models.Index(fields=['kind', 'month'], name='rollup_kind_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'user', 'month', 'status'), name='rollup_kind_user_month_status')],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0011_request_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expenserequest',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='Ключ идемпотентности'),
+        ),
+        migrations.AddField(
+            model_name='moneyrequest',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='Ключ идемпотентности'),
+        ),
+        migrations.AddConstraint(
+            model_name='expenserequest',
+            constraint=models.UniqueConstraint(fields=('user', 'idempotency_key'), name='expense_idempotency_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='moneyrequest',
+            constraint=models.UniqueConstraint(fields=('user', 'idempotency_key'), name='money_idempotency_key'),
+        ),
+    ]
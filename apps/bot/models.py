@@ -1,4 +1,10 @@
+import io
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
+
+from .storage import get_receipt_storage
 
 
 class TelegramUser(models.Model):
@@ -28,27 +34,99 @@ class ExpenseRequest(models.Model):
         ('paid', 'Выплачена'),
         ('rejected', 'Отклонена'),
     ]
+    RECEIPT_STATUS_CHOICES = [
+        ('pending', 'Загружается'),
+        ('ready', 'Загружен'),
+        ('failed', 'Ошибка'),
+    ]
 
     user = models.ForeignKey(TelegramUser, on_delete=models.CASCADE, verbose_name="Пользователь")
     amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Сумма")
     justification = models.TextField(verbose_name="Обоснование")
-    receipt_photo = models.BinaryField(verbose_name="Фото чека")
+    # Устаревшее хранение байтов в БД, переносится командой migrate_receipts
+    receipt_photo = models.BinaryField(null=True, blank=True, editable=False, verbose_name="Фото чека (в БД)")
+    receipt_sha256 = models.CharField(max_length=64, blank=True, default='', db_index=True, verbose_name="SHA-256 чека")
+    receipt_size = models.PositiveIntegerField(default=0, verbose_name="Размер чека")
     receipt_photo_name = models.CharField(max_length=255, verbose_name="Имя файла")
     receipt_photo_content_type = models.CharField(max_length=100, default='image/jpeg', verbose_name="Тип файла")
+    # Фото скачивается из Telegram в фоне (bot.receipts), пока - только file_id
+    receipt_file_id = models.CharField(max_length=255, blank=True, default='', verbose_name="file_id чека в Telegram")
+    receipt_file_unique_id = models.CharField(max_length=64, blank=True, default='', verbose_name="file_unique_id чека")
+    receipt_status = models.CharField(
+        max_length=10, choices=RECEIPT_STATUS_CHOICES, default='ready', verbose_name="Загрузка чека"
+    )
+    receipt_attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток загрузки чека")
+    receipt_next_attempt_at = models.DateTimeField(null=True, blank=True, verbose_name="Следующая попытка загрузки")
+    receipt_error = models.TextField(blank=True, default='', verbose_name="Ошибка загрузки чека")
+    # Перцептивный хеш чека и его четыре 16-битные части для поиска похожих (bot.dedup)
+    receipt_phash = models.BigIntegerField(null=True, blank=True, verbose_name="Перцептивный хеш чека")
+    receipt_phash_b0 = models.IntegerField(null=True, blank=True, editable=False)
+    receipt_phash_b1 = models.IntegerField(null=True, blank=True, editable=False)
+    receipt_phash_b2 = models.IntegerField(null=True, blank=True, editable=False)
+    receipt_phash_b3 = models.IntegerField(null=True, blank=True, editable=False)
+    receipt_duplicate_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        verbose_name="Чек совпадает с заявкой",
+    )
+    receipt_duplicate_distance = models.PositiveSmallIntegerField(
+        null=True, blank=True, verbose_name="Отличие от чека-оригинала (бит)"
+    )
 
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='new', verbose_name="Статус")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
     admin_comment = models.TextField(blank=True, null=True, verbose_name="Комментарий финансиста")
+    # Ключ диалога в боте, в котором создана заявка: повтор того же сообщения не создает дубль
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False, verbose_name="Ключ идемпотентности")
 
     class Meta:
         verbose_name = "Заявка на возмещение"
         verbose_name_plural = "Заявки на возмещение"
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='expense_idempotency_key'),
+        ]
+        indexes = [
+            # История пользователя в боте (keyset по created_at, id)
+            models.Index(fields=['user', '-created_at', '-id'], name='expense_user_created_idx'),
+            # Фильтр по статусу и дате в админке
+            models.Index(fields=['status', '-created_at'], name='expense_status_created_idx'),
+            # Очередь финансиста: только новые заявки
+            models.Index(fields=['-created_at'], condition=models.Q(status='new'), name='expense_new_idx'),
+            # Очередь фоновой загрузки чеков
+            models.Index(
+                fields=['receipt_next_attempt_at'], condition=models.Q(receipt_status='pending'),
+                name='expense_receipt_queue_idx',
+            ),
+            # Повторно отправленное то же фото (file_unique_id не меняется)
+            models.Index(fields=['receipt_file_unique_id'], name='expense_file_unique_idx'),
+            # Поиск похожих чеков: совпадение хотя бы одной части хеша
+            models.Index(fields=['receipt_phash_b0'], name='expense_phash_b0_idx'),
+            models.Index(fields=['receipt_phash_b1'], name='expense_phash_b1_idx'),
+            models.Index(fields=['receipt_phash_b2'], name='expense_phash_b2_idx'),
+            models.Index(fields=['receipt_phash_b3'], name='expense_phash_b3_idx'),
+        ]
 
     def __str__(self):
         return f"Заявка #{self.id} от {self.user} - {self.amount} руб."
 
+    @property
+    def has_receipt(self):
+        return bool(self.receipt_sha256) or self.receipt_photo is not None
+
+    def open_receipt(self):
+        """Открывает чек на чтение: из хранилища, либо из старого поля в БД"""
+        if self.receipt_sha256:
+            return get_receipt_storage().open(self.receipt_sha256)
+        photo = self.receipt_photo
+        if isinstance(photo, str):
+            photo = photo.encode('utf-8')
+        return io.BytesIO(bytes(photo or b''))
+
+    def read_receipt(self):
+        with self.open_receipt() as f:
+            return f.read()
+
 
 class MoneyRequest(models.Model):
     """модель запросов денежных средств"""
@@ -66,11 +144,108 @@ class MoneyRequest(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
     admin_comment = models.TextField(blank=True, null=True, verbose_name="Комментарий финансиста")
+    # Ключ диалога в боте, в котором создана заявка: повтор того же сообщения не создает дубль
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False, verbose_name="Ключ идемпотентности")
 
     class Meta:
         verbose_name = "Запрос денежных средств"
         verbose_name_plural = "Запросы денежных средств"
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='money_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='money_user_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='money_status_created_idx'),
+            models.Index(fields=['-created_at'], condition=models.Q(status='new'), name='money_new_idx'),
+        ]
+
+    def __str__(self):
+        return f"Запрос #{self.id} от {self.user} - {self.amount} руб."
+
+class BotState(models.Model):
+    """состояние бота между перезапусками (диалоги, user_data, chat_data)"""
+    kind = models.CharField(max_length=64, verbose_name="Вид")
+    key = models.CharField(max_length=255, verbose_name="Ключ")
+    data = models.JSONField(encoder=DjangoJSONEncoder, null=True, verbose_name="Данные")
+    updated_at = models.DateTimeField(verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Состояние бота"
+        verbose_name_plural = "Состояния бота"
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'key'], name='bot_state_kind_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.key}"
+
+
+class WebhookUpdate(models.Model):
+    """обновление Telegram, принятое webhook и ожидающее обработки (см. bot.inbox)"""
+    update_id = models.BigIntegerField(unique=True, verbose_name="ID обновления")
+    data = models.JSONField(verbose_name="Данные")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата получения")
+
+    class Meta:
+        verbose_name = "Входящее обновление"
+        verbose_name_plural = "Входящие обновления"
+
+    def __str__(self):
+        return f"Обновление {self.update_id}"
+
+
+class Notification(models.Model):
+    """исходящее сообщение пользователю (outbox), отправляется воркером бота"""
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    ]
+
+    chat_id = models.BigIntegerField(verbose_name="Чат")
+    text = models.TextField(verbose_name="Текст")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Следующая попытка")
+    last_error = models.TextField(blank=True, default='', verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата отправки")
+
+    class Meta:
+        verbose_name = "Уведомление"
+        verbose_name_plural = "Уведомления"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='notification_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Уведомление #{self.id} для {self.chat_id}"
+
+
+class RequestRollup(models.Model):
+    """сводка заявок и запросов: пользователь × месяц × статус (см. bot.rollups)"""
+    KIND_CHOICES = [
+        ('expense', 'Заявки на возмещение'),
+        ('money', 'Запросы денежных средств'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Тип")
+    user = models.ForeignKey(TelegramUser, on_delete=models.CASCADE, verbose_name="Пользователь")
+    month = models.DateField(verbose_name="Месяц")
+    status = models.CharField(max_length=20, verbose_name="Статус")
+    count = models.IntegerField(default=0, verbose_name="Количество")
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Сумма")
+
+    class Meta:
+        verbose_name = "Сводка по заявкам"
+        verbose_name_plural = "Сводка по заявкам"
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'user', 'month', 'status'], name='rollup_kind_user_month_status'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'month'], name='rollup_kind_month_idx'),
+        ]
 
     def __str__(self):
-        return f"Запрос #{self.id} от {self.user} - {self.amount} руб."
\ No newline at end of file
+        return f"{self.get_kind_display()}: {self.user_id}, {self.month:%m.%Y}, {self.status}"
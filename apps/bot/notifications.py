@@ -0,0 +1,42 @@
+from .models import Notification
+
+REQUEST_LABELS = {
+    'ExpenseRequest': 'Заявка',
+    'MoneyRequest': 'Запрос',
+}
+
+CHUNK_SIZE = 500
+
+
+def render_status_message(label, pk, amount, status_display, comment):
+    lines = [
+        f"🔔 {label} #{pk} на {amount} руб.",
+        f"Новый статус: {status_display}",
+    ]
+    if comment:
+        lines.append(f"Комментарий: {comment}")
+    return "\n".join(lines)
+
+
+def enqueue_status_notifications(model, ids):
+    """Пишет уведомления пользователям в outbox.
+
+    Вызывается внутри транзакции изменения заявок: уведомления появятся
+    в очереди только вместе с закоммиченным статусом. Сама отправка в
+    Telegram выполняется воркером в процессе бота (bot.outbox).
+    """
+    label = REQUEST_LABELS.get(model.__name__, 'Заявка')
+    statuses = dict(model.STATUS_CHOICES)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        rows = (
+            model.objects.filter(pk__in=ids[start:start + CHUNK_SIZE])
+            .order_by()
+            .values_list('pk', 'user__telegram_id', 'amount', 'status', 'admin_comment')
+        )
+        Notification.objects.bulk_create([
+            Notification(
+                chat_id=telegram_id,
+                text=render_status_message(label, pk, amount, statuses.get(status, status), comment),
+            )
+            for pk, telegram_id, amount, status, comment in rows
+        ])
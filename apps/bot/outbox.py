@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from .db import run_db
+from .metrics import Counter, Gauge, Histogram
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+outbox_depth = Gauge('bot_outbox_queue_depth', 'Уведомлений в очереди на отправку')
+outbox_oldest_age = Gauge('bot_outbox_oldest_pending_seconds', 'Возраст самого старого неотправленного уведомления')
+outbox_sent = Counter('bot_outbox_messages_total', 'Обработанные уведомления', ['result'])
+outbox_latency = Histogram(
+    'bot_outbox_delivery_latency_seconds', 'Время от постановки в очередь до отправки',
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600),
+)
+outbox_merged = Counter('bot_outbox_merged_total', 'Уведомления, отправленные в одном сообщении с предыдущими')
+
+# Лимит длины текста сообщения в Bot API
+MAX_MESSAGE_LENGTH = 4096
+MESSAGE_SEPARATOR = '\n\n'
+
+
+class TokenBucket:
+    """Токен-бакет: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate, capacity=1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self):
+        """Берет токен; возвращает 0 или сколько секунд ждать до следующего"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while (delay := self.try_take()) > 0:
+            await asyncio.sleep(delay)
+
+    @property
+    def idle(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+def _claim_batch(batch_size, lease):
+    """Забирает пачку готовых к отправке уведомлений.
+
+    next_attempt_at сдвигается на время аренды, чтобы второй воркер
+    (или следующий проход) не взял их повторно, пока идет отправка.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            Notification.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values('id', 'chat_id', 'text', 'attempts', 'created_at')[:batch_size]
+        )
+        if batch:
+            Notification.objects.filter(id__in=[n['id'] for n in batch]).update(next_attempt_at=now + lease)
+    return batch
+
+
+def _save_results(results):
+    with transaction.atomic():
+        for notification_id, fields in results:
+            Notification.objects.filter(id=notification_id).update(**fields)
+
+
+def _merge(notifications):
+    """Склеивает уведомления одного чата в сообщения не длиннее MAX_MESSAGE_LENGTH.
+
+    Порядок сохраняется. Попытки и возраст склеенного сообщения - по самому
+    старому уведомлению, результат отправки записывается всем его id.
+    """
+    messages = []
+    for notification in notifications:
+        last = messages[-1] if messages else None
+        if last and len(last['text']) + len(MESSAGE_SEPARATOR) + len(notification['text']) <= MAX_MESSAGE_LENGTH:
+            last['ids'].append(notification['id'])
+            last['text'] += MESSAGE_SEPARATOR + notification['text']
+            last['attempts'] = max(last['attempts'], notification['attempts'])
+            last['created_at'] = min(last['created_at'], notification['created_at'])
+        else:
+            messages.append({**notification, 'ids': [notification['id']]})
+    return messages
+
+
+def _queue_stats():
+    pending = Notification.objects.filter(status='pending')
+    oldest = pending.order_by('created_at').values_list('created_at', flat=True).first()
+    return pending.count(), oldest
+
+
+class OutboxWorker:
+    """Отправляет уведомления из outbox в Telegram.
+
+    Соблюдает общий лимит Bot API и лимит на один чат (токен-бакеты),
+    сообщения разных чатов уходят параллельно, одного чата - по порядку.
+    Уведомления одного чата из пачки склеиваются в одно сообщение, результат
+    пишется в БД сразу после отправки, не дожидаясь остальных чатов.
+    Ошибки сети и 429 повторяются с экспоненциальной задержкой.
+    """
+
+    def __init__(self, bot, config=None):
+        config = {**settings.BOT_OUTBOX, **(config or {})}
+        self.bot = bot
+        self.batch_size = config['BATCH_SIZE']
+        self.poll_interval = config['POLL_INTERVAL']
+        self.max_attempts = config['MAX_ATTEMPTS']
+        self.backoff_base = config['BACKOFF_BASE']
+        self.backoff_max = config['BACKOFF_MAX']
+        self.lease = timedelta(seconds=config['LEASE'])
+        self.stats_interval = config['STATS_INTERVAL']
+        self.global_bucket = TokenBucket(config['GLOBAL_RATE'], capacity=config['GLOBAL_RATE'])
+        self.per_chat_rate = config['PER_CHAT_RATE']
+        self.chat_buckets = {}
+        self._stats_at = 0.0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                # Полные бакеты ничего не помнят - их можно выбросить
+                self.chat_buckets = {k: b for k, b in self.chat_buckets.items() if not b.idle}
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.per_chat_rate)
+        return bucket
+
+    def _backoff(self, attempts):
+        return min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+
+    async def _send(self, notification):
+        await self._chat_bucket(notification['chat_id']).acquire()
+        await self.global_bucket.acquire()
+
+        attempts = notification['attempts'] + 1
+        now = timezone.now()
+        try:
+            await self.bot.send_message(chat_id=notification['chat_id'], text=notification['text'])
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+            # 429 - не ошибка сообщения, попытку не засчитываем
+            outbox_sent.inc(result='retry')
+            return {'next_attempt_at': now + timedelta(seconds=retry_after), 'last_error': str(e)}
+        except (Forbidden, BadRequest) as e:
+            # Пользователь заблокировал бота или чата нет - повторять бессмысленно
+            outbox_sent.inc(result='failed')
+            return {'status': 'failed', 'attempts': attempts, 'last_error': str(e)}
+        except TelegramError as e:
+            if attempts >= self.max_attempts:
+                outbox_sent.inc(result='failed')
+                return {'status': 'failed', 'attempts': attempts, 'last_error': str(e)}
+            outbox_sent.inc(result='retry')
+            return {
+                'attempts': attempts,
+                'next_attempt_at': now + timedelta(seconds=self._backoff(attempts)),
+                'last_error': str(e),
+            }
+
+        outbox_sent.inc(result='sent')
+        outbox_latency.observe((now - notification['created_at']).total_seconds())
+        return {'status': 'sent', 'attempts': attempts, 'sent_at': now, 'last_error': ''}
+
+    async def _send_chat(self, notifications):
+        for message in _merge(notifications):
+            fields = await self._send(message)
+            outbox_merged.inc(len(message['ids']) - 1)
+            await run_db(_save_results, [(notification_id, fields) for notification_id in message['ids']])
+
+    async def process_batch(self):
+        """Один проход: забрать пачку, отправить, записать результат. Возвращает размер пачки"""
+        batch = await run_db(_claim_batch, self.batch_size, self.lease)
+        if not batch:
+            return 0
+
+        by_chat = defaultdict(list)
+        for notification in batch:
+            by_chat[notification['chat_id']].append(notification)
+
+        await asyncio.gather(*(self._send_chat(items) for items in by_chat.values()))
+        return len(batch)
+
+    async def update_stats(self):
+        depth, oldest = await run_db(_queue_stats)
+        outbox_depth.set(depth)
+        outbox_oldest_age.set((timezone.now() - oldest).total_seconds() if oldest else 0)
+        if depth:
+            logger.info(f"Outbox: в очереди {depth}, отправлено {outbox_sent.value(result='sent')}")
+
+    async def run(self):
+        logger.info("Воркер уведомлений запущен")
+        while True:
+            try:
+                if time.monotonic() - self._stats_at > self.stats_interval:
+                    self._stats_at = time.monotonic()
+                    await self.update_stats()
+                processed = await self.process_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка воркера уведомлений")
+                processed = 0
+            if processed < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from telegram.ext import BasePersistence, PersistenceInput
+
+from bot.db import run_db
+from bot.models import BotState
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = 'user_data'
+CHAT_DATA = 'chat_data'
+CONVERSATION = 'conversation:'
+
+
+def _load(kind, max_age=None):
+    """Записи вида kind; с max_age (секунды) более старые удаляются, а не загружаются"""
+    rows = BotState.objects.filter(kind=kind)
+    if max_age:
+        stale = rows.filter(updated_at__lt=timezone.now() - timedelta(seconds=max_age))
+        deleted, _ = stale.delete()
+        if deleted:
+            logger.info(f"Удалено устаревших записей {kind}: {deleted}")
+    return dict(rows.values_list('key', 'data'))
+
+
+def _write(changes):
+    """Записывает накопленные изменения одной транзакцией"""
+    now = timezone.now()
+    upserts = [
+        BotState(kind=kind, key=key, data=data, updated_at=now)
+        for (kind, key), data in changes.items() if data is not None
+    ]
+    deletes = [(kind, key) for (kind, key), data in changes.items() if data is None]
+    with transaction.atomic():
+        if upserts:
+            BotState.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=['kind', 'key'],
+                update_fields=['data', 'updated_at'],
+            )
+        # Удаления одного вида - одним запросом (выгрузка молчащих пользователей дает их пачками)
+        keys_by_kind = {}
+        for kind, key in deletes:
+            keys_by_kind.setdefault(kind, []).append(key)
+        for kind, keys in keys_by_kind.items():
+            BotState.objects.filter(kind=kind, key__in=keys).delete()
+
+
+class DjangoPersistence(BasePersistence):
+    """Хранение состояния диалогов и user_data/chat_data в БД (модель BotState).
+
+    Application сам вызывает update_* раз в update_interval секунд и только
+    для изменившихся пользователей/чатов. Здесь эти вызовы дополнительно
+    собираются в одну транзакцию с bulk upsert, так что на одно сообщение
+    пользователя запись в БД не приходится.
+
+    Состояние читается из БД только при запуске Application. Обновления всех
+    чатов обрабатывает один процесс runbot (в режиме webhook тоже, см.
+    bot.inbox), поэтому refresh_* ничего не перечитывают.
+    """
+
+    def __init__(self, update_interval=None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval or settings.BOT_PERSISTENCE_INTERVAL,
+        )
+        self._pending = {}
+        self._write_task = None
+
+    def _schedule(self, kind, key, data):
+        self._pending[(kind, key)] = data
+        # Все update_* одного прохода Application выполняются до того, как
+        # запустится задача записи, поэтому они попадают в одну транзакцию
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.get_running_loop().create_task(self._write_pending())
+
+    async def _write_pending(self):
+        # Пока идет запись, могут накопиться новые изменения - пишем и их
+        while self._pending:
+            changes, self._pending = self._pending, {}
+            try:
+                await run_db(_write, changes)
+            except Exception:
+                logger.exception("Не удалось сохранить состояние бота")
+                # Вернем изменения, не перетирая более свежие
+                self._pending = {**changes, **self._pending}
+                return
+
+    # Тайм-ауты диалогов (JobQueue) перезапуск не переживают: диалог, который
+    # за время простоя бота уже истек бы, не загружается, иначе он остался бы
+    # в памяти и в БД навсегда. То же с данными давно молчащих пользователей
+
+    async def get_user_data(self):
+        rows = await run_db(_load, USER_DATA, settings.BOT_SESSIONS['DATA_TTL'])
+        return {int(key): data for key, data in rows.items()}
+
+    async def get_chat_data(self):
+        rows = await run_db(_load, CHAT_DATA, settings.BOT_SESSIONS['DATA_TTL'])
+        return {int(key): data for key, data in rows.items()}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        rows = await run_db(_load, CONVERSATION + name, settings.BOT_SESSIONS['CONVERSATION_TIMEOUT'])
+        return {tuple(json.loads(key)): state for key, state in rows.items()}
+
+    async def update_conversation(self, name, key, new_state):
+        self._schedule(CONVERSATION + name, json.dumps(list(key)), new_state)
+
+    # Пустые словари не храним: строка удаляется, таблица не растет
+    # за счет пользователей, закончивших диалог
+
+    async def update_user_data(self, user_id, data):
+        self._schedule(USER_DATA, str(user_id), data or None)
+
+    async def update_chat_data(self, chat_id, data):
+        self._schedule(CHAT_DATA, str(chat_id), data or None)
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        self._schedule(USER_DATA, str(user_id), None)
+
+    async def drop_chat_data(self, chat_id):
+        self._schedule(CHAT_DATA, str(chat_id), None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        if self._write_task is not None:
+            await self._write_task
+        await self._write_pending()
@@ -0,0 +1,232 @@
+"""Фоновая загрузка фото чеков из Telegram.
+
+Обработчик get_receipt сохраняет заявку только с file_id и сразу отвечает
+пользователю. ReceiptFetcher забирает такие заявки из БД, скачивает фото
+(не больше CONCURRENCY одновременно), нормализует и кладет в хранилище.
+Ошибки повторяются с экспоненциальной задержкой, после MAX_ATTEMPTS
+заявка помечается как failed и пользователю уходит уведомление.
+Уже загруженное фото (тот же file_unique_id) повторно не скачивается,
+повторы и похожие чеки отмечаются для финансиста (bot.dedup).
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from pathlib import PurePath
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from .db import run_db
+from .dedup import duplicate_fields, find_by_unique_id, find_duplicate, phash_fields
+from .imaging import hash_image_bytes, normalize_receipt
+from .metrics import Counter, Gauge, Histogram
+from .models import ExpenseRequest, Notification
+from .storage import get_receipt_storage
+
+logger = logging.getLogger(__name__)
+
+fetch_depth = Gauge('bot_receipt_fetch_queue_depth', 'Чеков, ожидающих загрузки из Telegram')
+fetch_results = Counter('bot_receipt_fetch_total', 'Попытки загрузки чеков', ['result'])
+fetch_duration = Histogram('bot_receipt_fetch_seconds', 'Время загрузки и обработки одного чека')
+
+_wakeup = None
+
+
+def wake_receipt_fetcher():
+    """Будит загрузчик этого процесса, чтобы не ждать POLL_INTERVAL"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def _claim_batch(batch_size, lease):
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            ExpenseRequest.objects
+            # Только строки заявок: без of= PostgreSQL блокирует и присоединенного
+            # пользователя, а skip_locked пропускает заявки с занятым пользователем
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(receipt_status='pending', receipt_next_attempt_at__lte=now)
+            .order_by('receipt_next_attempt_at', 'id')
+            .values(
+                'id', 'user__telegram_id', 'receipt_file_id', 'receipt_file_unique_id',
+                'receipt_photo_name', 'receipt_attempts',
+            )[:batch_size]
+        )
+        if batch:
+            ExpenseRequest.objects.filter(id__in=[r['id'] for r in batch]).update(
+                receipt_next_attempt_at=now + lease
+            )
+    return batch
+
+
+def _save_result(receipt, fields, notify_text=None):
+    with transaction.atomic():
+        ExpenseRequest.objects.filter(id=receipt['id'], receipt_status='pending').update(**fields)
+        if notify_text:
+            Notification.objects.create(chat_id=receipt['user__telegram_id'], text=notify_text)
+
+
+def _queue_depth():
+    return ExpenseRequest.objects.filter(receipt_status='pending').count()
+
+
+async def download_receipt(bot, file_id):
+    """Скачивает фото по file_id и при необходимости нормализует.
+
+    Возвращает (bytes, расширение, content_type, перцептивный хеш или None).
+    """
+    photo_file = await bot.get_file(file_id)
+    data = bytes(await photo_file.download_as_bytearray())
+
+    extension = photo_file.file_path.split('.')[-1].lower() if photo_file.file_path else 'jpg'
+    content_type = f'image/{extension}' if extension in ['jpg', 'jpeg', 'png', 'gif'] else 'image/jpeg'
+
+    if settings.RECEIPT_NORMALIZATION['ENABLED']:
+        try:
+            normalized = await normalize_receipt(data)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as e:
+            logger.warning(f"Не удалось обработать фото {file_id}, сохраняем как есть: {e}")
+            return data, extension, content_type, None
+        return normalized.data, normalized.extension, normalized.content_type, normalized.phash
+
+    try:
+        phash = await sync_to_async(hash_image_bytes, thread_sensitive=False)(data)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        phash = None
+    return data, extension, content_type, phash
+
+
+class ReceiptFetcher:
+    """Скачивает отложенные чеки с ограниченным параллелизмом"""
+
+    def __init__(self, bot, config=None):
+        config = {**settings.RECEIPT_FETCHER, **(config or {})}
+        self.bot = bot
+        self.batch_size = config['BATCH_SIZE']
+        self.poll_interval = config['POLL_INTERVAL']
+        self.max_attempts = config['MAX_ATTEMPTS']
+        self.backoff_base = config['BACKOFF_BASE']
+        self.backoff_max = config['BACKOFF_MAX']
+        self.lease = timedelta(seconds=config['LEASE'])
+        self.semaphore = asyncio.Semaphore(config['CONCURRENCY'])
+
+    def _backoff(self, attempts):
+        return min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+
+    def _failed(self, receipt, attempts, error):
+        fetch_results.inc(result='failed')
+        logger.error(f"Чек заявки #{receipt['id']} не загружен: {error}")
+        text = (
+            f"⚠️ Не удалось получить фото чека по заявке #{receipt['id']}.\n"
+            f"Пожалуйста, передайте чек финансисту."
+        )
+        return {'receipt_status': 'failed', 'receipt_attempts': attempts, 'receipt_error': str(error)}, text
+
+    async def _fetch(self, receipt):
+        attempts = receipt['receipt_attempts'] + 1
+        started = time.perf_counter()
+        notify_text = None
+
+        existing = await run_db(find_by_unique_id, receipt['receipt_file_unique_id'], receipt['id'])
+        if existing is not None:
+            # То же фото уже загружено с другой заявкой - скачивать не нужно
+            fetch_results.inc(result='reused')
+            fields = {
+                'receipt_status': 'ready',
+                'receipt_sha256': existing['receipt_sha256'],
+                'receipt_size': existing['receipt_size'],
+                'receipt_photo_name': PurePath(receipt['receipt_photo_name']).with_suffix(
+                    PurePath(existing['receipt_photo_name']).suffix
+                ).name,
+                'receipt_photo_content_type': existing['receipt_photo_content_type'],
+                'receipt_attempts': attempts,
+                'receipt_next_attempt_at': None,
+                'receipt_error': '',
+                'receipt_duplicate_of_id': existing['id'],
+                'receipt_duplicate_distance': 0,
+            }
+            fields.update({name: existing[name] for name in phash_fields(0)})
+            await run_db(_save_result, receipt, fields)
+            return
+
+        try:
+            async with self.semaphore:
+                data, extension, content_type, phash = await download_receipt(self.bot, receipt['receipt_file_id'])
+                stored = await sync_to_async(get_receipt_storage().save, thread_sensitive=False)(data)
+            duplicate = await run_db(find_duplicate, stored.sha256, phash, receipt['id'])
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+            fetch_results.inc(result='retry')
+            fields = {
+                'receipt_next_attempt_at': timezone.now() + timedelta(seconds=retry_after),
+                'receipt_error': str(e),
+            }
+        except BadRequest as e:
+            # Файл не найден или слишком большой для Bot API - повтор не поможет
+            fields, notify_text = self._failed(receipt, attempts, e)
+        except (TelegramError, OSError) as e:
+            if attempts >= self.max_attempts:
+                fields, notify_text = self._failed(receipt, attempts, e)
+            else:
+                fetch_results.inc(result='retry')
+                logger.warning(f"Чек заявки #{receipt['id']}: попытка {attempts} не удалась: {e}")
+                fields = {
+                    'receipt_attempts': attempts,
+                    'receipt_next_attempt_at': timezone.now() + timedelta(seconds=self._backoff(attempts)),
+                    'receipt_error': str(e),
+                }
+        else:
+            fetch_results.inc(result='ready')
+            fetch_duration.observe(time.perf_counter() - started)
+            name = PurePath(receipt['receipt_photo_name']).with_suffix(f'.{extension}').name
+            fields = {
+                'receipt_status': 'ready',
+                'receipt_sha256': stored.sha256,
+                'receipt_size': stored.size,
+                'receipt_photo_name': name,
+                'receipt_photo_content_type': content_type,
+                'receipt_attempts': attempts,
+                'receipt_next_attempt_at': None,
+                'receipt_error': '',
+                **phash_fields(phash),
+                **duplicate_fields(duplicate),
+            }
+            if duplicate is not None:
+                logger.info(f"Чек заявки #{receipt['id']} похож на чек заявки #{duplicate.pk} ({duplicate.distance} бит)")
+        await run_db(_save_result, receipt, fields, notify_text)
+
+    async def process_batch(self):
+        """Один проход: забрать пачку и загрузить чеки параллельно. Возвращает размер пачки"""
+        batch = await run_db(_claim_batch, self.batch_size, self.lease)
+        if batch:
+            await asyncio.gather(*(self._fetch(receipt) for receipt in batch))
+        return len(batch)
+
+    async def run(self):
+        global _wakeup
+        _wakeup = asyncio.Event()
+        logger.info("Загрузчик чеков запущен")
+        try:
+            while True:
+                _wakeup.clear()
+                try:
+                    processed = await self.process_batch()
+                    fetch_depth.set(await run_db(_queue_depth))
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception("Ошибка загрузчика чеков")
+                    processed = 0
+                if processed < self.batch_size:
+                    try:
+                        await asyncio.wait_for(_wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            _wakeup = None
@@ -0,0 +1,123 @@
+import re
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+RANGE_RE = re.compile(r'^\s*bytes=(\d*)-(\d*)\s*$')
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """Разбирает заголовок Range с одним диапазоном.
+
+    Возвращает (start, end) включительно, None если заголовок надо
+    проигнорировать (нет, несколько диапазонов, мусор), или False если
+    диапазон лежит за пределами файла.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header)
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-500: последние 500 байт
+        length = int(last)
+        if length == 0 or size == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start > end or start >= size:
+        return False
+    return start, min(end, size - 1)
+
+
+def iter_file_range(fileobj, start, length, chunk_size=CHUNK_SIZE):
+    """Читает length байт начиная со start кусками, закрывает файл в конце"""
+    try:
+        fileobj.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = fileobj.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+_DONE = object()
+
+
+async def aiter_sync(iterator):
+    """Асинхронный итератор поверх синхронного: каждый кусок читается в потоке
+    запроса (thread_sensitive), поэтому iterator() queryset'а остается на одном
+    соединении с БД. В конце (и при обрыве соединения) итератор закрывается
+    """
+    iterator = iter(iterator)
+    take = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (chunk := await take(iterator, _DONE)) is not _DONE:
+            yield chunk
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=True)()
+
+
+def streaming_response(request, content, **kwargs):
+    """StreamingHttpResponse, который отдает content по кускам и под ASGI.
+
+    Синхронный итератор Django под ASGI сначала читает целиком
+    (sync_to_async(list)), а асинхронный под WSGI - тоже целиком, поэтому
+    вид итератора выбирается по запросу.
+    """
+    if isinstance(request, ASGIRequest):
+        content = aiter_sync(content)
+    return StreamingHttpResponse(content, **kwargs)
+
+
+def ranged_file_response(request, fileobj, size, content_type, etag=None):
+    """Потоковый ответ с файлом, поддерживающий один диапазон Range.
+
+    If-Range учитывается по ETag: если клиент прислал устаревший
+    идентификатор, отдаем файл целиком.
+    """
+    byte_range = None
+    if request.method == 'GET' and (not request.headers.get('If-Range') or request.headers['If-Range'] == etag):
+        byte_range = parse_range(request.headers.get('Range'), size)
+
+    if byte_range is False:
+        fileobj.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is None:
+        if isinstance(request, ASGIRequest):
+            response = streaming_response(request, iter_file_range(fileobj, 0, size), content_type=content_type)
+        else:
+            # Под WSGI FileResponse может отдать файл через wsgi.file_wrapper
+            response = FileResponse(fileobj, content_type=content_type)
+        response['Content-Length'] = str(size)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = streaming_response(
+            request,
+            iter_file_range(fileobj, start, length),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = etag
+    return response
@@ -0,0 +1,142 @@
+"""Сводка заявок для отчетов: пользователь × месяц × статус -> количество и сумма.
+
+Таблица RequestRollup обновляется приращениями там же, где меняются заявки:
+- создание и правка через save() - сигналы в bot.signals;
+- массовая смена статуса - bot.services.transition_status;
+- удаление в админке - RollupDeleteMixin в bot.admin.
+Отчеты (админка, /stats в боте) читают только сводку. Пересчитать ее
+с нуля можно командой rebuild_rollups.
+"""
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import connection
+from django.db.models import Count, DateField, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import ExpenseRequest, MoneyRequest, RequestRollup
+
+KINDS = {
+    ExpenseRequest: 'expense',
+    MoneyRequest: 'money',
+}
+
+CHUNK_SIZE = 500
+
+
+def month_of(value):
+    """Первое число месяца даты создания (в часовом поясе проекта)"""
+    return timezone.localtime(value).date().replace(day=1)
+
+
+def apply_deltas(kind, deltas):
+    """Прибавляет приращения {(user_id, month, status): (count, amount)} к сводке.
+
+    Один запрос INSERT ... ON CONFLICT DO UPDATE (PostgreSQL, SQLite >= 3.24):
+    конкурентные изменения одной строки сводки не теряются. Строки, в которых
+    не осталось заявок, удаляются - как будто сводку пересчитали с нуля.
+    Вызывается внутри транзакции изменения заявок.
+    """
+    deltas = [(key, value) for key, value in deltas.items() if value != (0, 0)]
+    if not deltas:
+        return
+    opts = RequestRollup._meta
+    qn = connection.ops.quote_name
+    table = qn(opts.db_table)
+    month_field = opts.get_field('month')
+    amount_field = opts.get_field('amount')
+
+    for start in range(0, len(deltas), CHUNK_SIZE):
+        chunk = deltas[start:start + CHUNK_SIZE]
+        params = []
+        for (user_id, month, status), (count, amount) in chunk:
+            params += [
+                kind, user_id, month_field.get_db_prep_value(month, connection), status, count,
+                amount_field.get_db_prep_value(amount, connection),
+            ]
+        values = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(chunk))
+        sql = (
+            f"INSERT INTO {table} ({qn('kind')}, {qn('user_id')}, {qn('month')}, {qn('status')}, "
+            f"{qn('count')}, {qn('amount')}) VALUES {values} "
+            f"ON CONFLICT ({qn('kind')}, {qn('user_id')}, {qn('month')}, {qn('status')}) DO UPDATE SET "
+            f"{qn('count')} = {table}.{qn('count')} + excluded.{qn('count')}, "
+            f"{qn('amount')} = {table}.{qn('amount')} + excluded.{qn('amount')}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    # Обнулиться могли только строки, из которых заявки уходили
+    emptied = [key for key, (count, _) in deltas if count < 0]
+    for start in range(0, len(emptied), CHUNK_SIZE):
+        keys = reduce(or_, (
+            Q(user_id=user_id, month=month, status=status) for user_id, month, status in emptied[start:start + CHUNK_SIZE]
+        ))
+        RequestRollup.objects.filter(keys, kind=kind, count=0).delete()
+
+
+def _add(deltas, user_id, month, status, count, amount):
+    key = (user_id, month, status)
+    old_count, old_amount = deltas.get(key, (0, Decimal(0)))
+    deltas[key] = (old_count + count, old_amount + amount)
+
+
+def snapshot(instance):
+    """Поля заявки, от которых зависит сводка"""
+    return instance.user_id, month_of(instance.created_at), instance.status, instance.amount
+
+
+def record_change(model, old, new):
+    """Учитывает создание (old=None), правку или удаление (new=None) одной заявки"""
+    deltas = {}
+    if old is not None:
+        user_id, month, status, amount = old
+        _add(deltas, user_id, month, status, -1, -Decimal(amount))
+    if new is not None:
+        user_id, month, status, amount = new
+        _add(deltas, user_id, month, status, 1, Decimal(amount))
+    apply_deltas(KINDS[model], deltas)
+
+
+def _grouped(queryset):
+    return (
+        queryset.order_by()
+        .values('user_id', 'status', month=TruncMonth('created_at', output_field=DateField()))
+        .annotate(n=Count('id'), total=Sum('amount'))
+    )
+
+
+def record_status_change(model, ids_by_old_status, status):
+    """Переносит заявки из прежних статусов в status (после UPDATE, в той же транзакции)"""
+    deltas = {}
+    for old_status, ids in ids_by_old_status.items():
+        for start in range(0, len(ids), CHUNK_SIZE):
+            rows = _grouped(model.objects.filter(pk__in=ids[start:start + CHUNK_SIZE]))
+            for row in rows:
+                _add(deltas, row['user_id'], row['month'], old_status, -row['n'], -row['total'])
+                _add(deltas, row['user_id'], row['month'], status, row['n'], row['total'])
+    apply_deltas(KINDS[model], deltas)
+
+
+def record_deleted(queryset):
+    """Вычитает из сводки заявки, которые сейчас будут удалены"""
+    deltas = {}
+    for row in _grouped(queryset):
+        _add(deltas, row['user_id'], row['month'], row['status'], -row['n'], -row['total'])
+    apply_deltas(KINDS[queryset.model], deltas)
+
+
+def rebuild(model, user_ids):
+    """Пересчитывает сводку пользователей user_ids по таблице заявок"""
+    kind = KINDS[model]
+    rows = list(_grouped(model.objects.filter(user_id__in=user_ids)))
+    RequestRollup.objects.filter(kind=kind, user_id__in=user_ids).delete()
+    RequestRollup.objects.bulk_create([
+        RequestRollup(
+            kind=kind, user_id=row['user_id'], month=row['month'], status=row['status'],
+            count=row['n'], amount=row['total'],
+        )
+        for row in rows
+    ])
+    return len(rows)
@@ -0,0 +1,92 @@
+"""Полнотекстовый поиск по обоснованию заявок.
+
+PostgreSQL: GIN-индекс по to_tsvector('russian', justification).
+SQLite: внешняя FTS5-таблица <таблица>_fts, которую поддерживают триггеры.
+Индексы создает миграция 0008_justification_search; если БД их не
+поддерживает, поиск откатывается на icontains.
+
+Django пересоздает таблицу SQLite при многих ALTER и теряет триггеры,
+поэтому после каждого migrate они восстанавливаются (ensure_sqlite_triggers).
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_CONFIG = 'russian'
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def sqlite_has_fts5(conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def sqlite_fts_ready(model, conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [fts_table(model)])
+        return cursor.fetchone() is not None
+
+
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {table}_fts(rowid, justification) VALUES (new.id, new.justification);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, justification) VALUES ('delete', old.id, old.justification);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF justification ON {table} BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, justification) VALUES ('delete', old.id, old.justification);
+        INSERT INTO {table}_fts(rowid, justification) VALUES (new.id, new.justification);
+    END""",
+]
+
+
+def ensure_sqlite_triggers(model, conn=connection):
+    """Восстанавливает триггеры FTS; если их не было - перестраивает индекс"""
+    if conn.vendor != 'sqlite' or not sqlite_fts_ready(model, conn):
+        return False
+    table = model._meta.db_table
+    names = [f'{table}_fts_ai', f'{table}_fts_ad', f'{table}_fts_au']
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)", names
+        )
+        if cursor.fetchone()[0] == len(names):
+            return False
+        for sql in SQLITE_TRIGGERS:
+            cursor.execute(sql.format(table=table))
+        cursor.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+    return True
+
+
+def fts5_query(text):
+    """Запрос FTS5 из пользовательского ввода: все слова, каждое - как префикс"""
+    words = _WORD_RE.findall(text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def full_text_q(model, text, field='justification'):
+    """Условие поиска по тексту поля, которое использует полнотекстовый индекс"""
+    table = connection.ops.quote_name(model._meta.db_table)
+    if connection.vendor == 'postgresql':
+        column = connection.ops.quote_name(model._meta.get_field(field).column)
+        return Q(pk__in=RawSQL(
+            f"SELECT id FROM {table} "
+            f"WHERE to_tsvector('{FTS_CONFIG}', {column}) @@ plainto_tsquery('{FTS_CONFIG}', %s)",
+            [text],
+        ))
+    if connection.vendor == 'sqlite' and sqlite_fts_ready(model):
+        query = fts5_query(text)
+        if not query:
+            return Q(pk__in=[])
+        fts = connection.ops.quote_name(fts_table(model))
+        return Q(pk__in=RawSQL(f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s", [query]))
+    return Q(**{f'{field}__icontains': text})
@@ -0,0 +1,70 @@
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .notifications import enqueue_status_notifications
+from .rollups import record_status_change
+
+
+def transition_status(queryset, status):
+    """Переводит заявки из queryset в статус status.
+
+    На PostgreSQL и SQLite >= 3.35 это UPDATE ... RETURNING (по одному на
+    каждый прежний статус - так сводка bot.rollups знает, откуда ушла
+    заявка), иначе SELECT FOR UPDATE + UPDATE в одной транзакции. Заявки,
+    уже находящиеся в этом статусе, не трогаются. Возвращает id измененных
+    заявок; уведомления пользователям пишутся в outbox в той же транзакции.
+    """
+    model = queryset.model
+    queryset = queryset.exclude(status=status).order_by()
+    now = timezone.now()
+    ids_by_old_status = {}
+
+    with transaction.atomic():
+        if connection.features.can_return_columns_from_insert:
+            opts = model._meta
+            qn = connection.ops.quote_name
+            subquery, params = queryset.values('pk').query.sql_with_params()
+            updated_at = opts.get_field('updated_at').get_db_prep_value(now, connection)
+            sql = (
+                f"UPDATE {qn(opts.db_table)} "
+                f"SET {qn('status')} = %s, {qn('updated_at')} = %s "
+                f"WHERE {qn('status')} = %s AND {qn(opts.pk.column)} IN ({subquery}) "
+                f"RETURNING {qn(opts.pk.column)}"
+            )
+            with connection.cursor() as cursor:
+                for old_status, _ in model.STATUS_CHOICES:
+                    if old_status == status:
+                        continue
+                    cursor.execute(sql, (status, updated_at, old_status, *params))
+                    ids = [row[0] for row in cursor.fetchall()]
+                    if ids:
+                        ids_by_old_status[old_status] = ids
+        else:
+            for pk, old_status in queryset.select_for_update().values_list('pk', 'status'):
+                ids_by_old_status.setdefault(old_status, []).append(pk)
+            model.objects.filter(
+                pk__in=[pk for ids in ids_by_old_status.values() for pk in ids]
+            ).update(status=status, updated_at=now)
+
+        ids = sorted(pk for ids in ids_by_old_status.values() for pk in ids)
+        record_status_change(model, ids_by_old_status, status)
+        enqueue_status_notifications(model, ids)
+    return ids
+
+
+def create_request(model, **fields):
+    """Создает заявку или возвращает уже созданную с тем же idempotency_key.
+
+    Дубль (повторная доставка обновления, двойное нажатие) отсекает
+    уникальный индекс (user, idempotency_key); существующая заявка читается
+    только после конфликта. Возвращает (заявка, создана ли).
+    """
+    try:
+        with transaction.atomic():
+            return model.objects.create(**fields), True
+    except IntegrityError:
+        key = fields.get('idempotency_key')
+        existing = model.objects.filter(user_id=fields['user_id'], idempotency_key=key).first() if key else None
+        if existing is None:
+            raise
+        return existing, False
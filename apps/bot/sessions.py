@@ -0,0 +1,113 @@
+"""Предел user_data/chat_data в памяти процесса бота.
+
+Application создает запись user_data/chat_data для каждого пользователя,
+который хоть раз написал боту, и сам их не удаляет. Незавершенные диалоги
+заканчивает conversation_timeout ConversationHandler (см. ExpenseBot.init),
+а здесь выгружаются данные тех, кто молчит дольше DATA_TTL, и самых давних
+сверх MAX_USERS.
+
+SessionKeeper.touch (группа обработчиков -2) запоминает время последнего
+обновления пользователя, run раз в SWEEP_INTERVAL удаляет лишнее через
+Application.drop_user_data/drop_chat_data (вместе с записями persistence)
+и обновляет метрики объема этих данных.
+"""
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+sessions_released = Counter(
+    'bot_sessions_released_total', 'Пользователи, чьи данные выгружены из памяти', ['reason'],
+)
+session_entries = Gauge('bot_session_entries', 'Записей user_data/chat_data в памяти', ['store'])
+session_bytes = Gauge('bot_session_bytes', 'Примерный объем user_data/chat_data в памяти, байт', ['store'])
+tracked_users = Gauge('bot_session_tracked_users', 'Пользователей, чья активность отслеживается')
+
+IDLE = 'idle'
+LRU = 'lru'
+
+
+def deep_sizeof(obj):
+    """Размер объекта вместе с содержимым словарей и списков (строки, числа, вложенные dict/list)"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key) + deep_sizeof(value) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(item) for item in obj)
+    return size
+
+
+class SessionKeeper:
+    """Выгружает user_data/chat_data молчащих пользователей, держит не больше MAX_USERS"""
+
+    def __init__(self, application, config=None):
+        config = {**settings.BOT_SESSIONS, **(config or {})}
+        self.application = application
+        self.ttl = config['DATA_TTL']
+        self.max_users = config['MAX_USERS']
+        self.sweep_interval = config['SWEEP_INTERVAL']
+        # telegram_id пользователя -> (чат последнего обновления, time.monotonic()),
+        # от давно молчащих к недавним
+        self.activity = OrderedDict()
+
+    async def touch(self, update, context):
+        user = update.effective_user
+        if user is None:
+            return
+        chat = update.effective_chat
+        self.activity[user.id] = (chat.id if chat is not None else None, time.monotonic())
+        self.activity.move_to_end(user.id)
+
+    def seed(self):
+        """Данные, загруженные из persistence, считаются свежими с момента запуска"""
+        now = time.monotonic()
+        for user_id in self.application.user_data:
+            # Бот работает в личных чатах: chat_id совпадает с telegram_id
+            self.activity.setdefault(user_id, (user_id, now))
+
+    def release(self, user_id, chat_id, reason):
+        if user_id in self.application.user_data:
+            self.application.drop_user_data(user_id)
+        if chat_id is not None and chat_id in self.application.chat_data:
+            self.application.drop_chat_data(chat_id)
+        sessions_released.inc(reason=reason)
+
+    def sweep(self):
+        now = time.monotonic()
+        released = 0
+        while self.activity:
+            user_id, (chat_id, seen) = next(iter(self.activity.items()))
+            if self.ttl and now - seen >= self.ttl:
+                reason = IDLE
+            elif len(self.activity) > self.max_users:
+                reason = LRU
+            else:
+                break
+            del self.activity[user_id]
+            self.release(user_id, chat_id, reason)
+            released += 1
+        if released:
+            logger.info(f"Выгружены данные {released} пользователей бота")
+        self.update_metrics()
+
+    def update_metrics(self):
+        for store, data in (('user_data', self.application.user_data), ('chat_data', self.application.chat_data)):
+            session_entries.set(len(data), store=store)
+            session_bytes.set(deep_sizeof(dict(data)), store=store)
+        tracked_users.set(len(self.activity))
+
+    async def run(self):
+        self.seed()
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Ошибка при выгрузке данных пользователей бота")
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from .instrumentation import metrics_enabled, time_query
+from .models import ExpenseRequest, MoneyRequest, TelegramUser
+from .rollups import record_change, snapshot
+from .search import ensure_sqlite_triggers
+from .user_cache import user_cache
+
+
+@receiver(post_save, sender=TelegramUser)
+@receiver(post_delete, sender=TelegramUser)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """Сбрасываем кеш пользователя при правке или удалении (например, в админке)"""
+    user_cache.invalidate(instance.telegram_id)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """WAL, чтобы чтение админки и бота не ждало записи (см. SQLITE_PRAGMAS)"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+
+
+@receiver(connection_created)
+def time_bot_queries(sender, connection, **kwargs):
+    """Время запросов к БД засчитывается обновлению бота, которое их выполняет"""
+    if metrics_enabled():
+        connection.execute_wrappers.append(time_query)
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    """Пересоздание таблицы SQLite в миграции удаляет триггеры полнотекстового поиска"""
+    if sender.label != 'bot':
+        return
+    for model in (ExpenseRequest, MoneyRequest):
+        ensure_sqlite_triggers(model, connections[using])
+
+
+@receiver(pre_save, sender=ExpenseRequest)
+@receiver(pre_save, sender=MoneyRequest)
+def remember_rollup_fields(sender, instance, raw=False, **kwargs):
+    """Запоминаем статус, сумму и т.п. до правки, чтобы поправить сводку"""
+    instance._rollup_old = None
+    if raw or instance.pk is None:
+        return
+    old = sender.objects.filter(pk=instance.pk).only('user_id', 'created_at', 'status', 'amount').first()
+    if old is not None:
+        instance._rollup_old = snapshot(old)
+
+
+@receiver(post_save, sender=ExpenseRequest)
+@receiver(post_save, sender=MoneyRequest)
+def update_rollup(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    new = snapshot(instance)
+    old = getattr(instance, '_rollup_old', None)
+    if old != new:
+        record_change(sender, old, new)
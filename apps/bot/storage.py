@@ -0,0 +1,103 @@
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+@dataclass(frozen=True)
+class StoredReceipt:
+    """результат сохранения чека в хранилище"""
+    sha256: str
+    size: int
+    created: bool
+
+
+class ReceiptStorage:
+    """базовый класс хранилища чеков, адресуемого по SHA-256 содержимого"""
+
+    def save(self, data: bytes) -> StoredReceipt:
+        raise NotImplementedError
+
+    def open(self, sha256: str):
+        """Открывает чек на чтение (бинарный файловый объект)"""
+        raise NotImplementedError
+
+    def exists(self, sha256: str) -> bool:
+        raise NotImplementedError
+
+    def size(self, sha256: str) -> int:
+        raise NotImplementedError
+
+    def delete(self, sha256: str):
+        raise NotImplementedError
+
+    @staticmethod
+    def hash_bytes(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+
+class FileSystemReceiptStorage(ReceiptStorage):
+    """Чеки на локальном диске: <location>/ab/cd/<sha256>.
+
+    Одинаковые фото записываются один раз - повторное сохранение
+    только возвращает уже существующий хеш.
+    """
+
+    def __init__(self, location=None):
+        self.location = Path(location or Path(settings.MEDIA_ROOT) / 'receipt_store')
+
+    def path(self, sha256: str) -> Path:
+        if len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256):
+            raise ValueError(f"Некорректный хеш чека: {sha256!r}")
+        return self.location / sha256[:2] / sha256[2:4] / sha256
+
+    def save(self, data: bytes) -> StoredReceipt:
+        data = bytes(data)
+        sha256 = self.hash_bytes(data)
+        target = self.path(sha256)
+        if target.exists():
+            return StoredReceipt(sha256=sha256, size=len(data), created=False)
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Пишем во временный файл рядом и атомарно переименовываем,
+        # чтобы читатели никогда не видели недописанный чек
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return StoredReceipt(sha256=sha256, size=len(data), created=True)
+
+    def open(self, sha256: str):
+        return open(self.path(sha256), 'rb')
+
+    def exists(self, sha256: str) -> bool:
+        return self.path(sha256).exists()
+
+    def size(self, sha256: str) -> int:
+        return self.path(sha256).stat().st_size
+
+    def delete(self, sha256: str):
+        try:
+            self.path(sha256).unlink()
+        except FileNotFoundError:
+            pass
+
+
+@lru_cache(maxsize=None)
+def get_receipt_storage() -> ReceiptStorage:
+    """Хранилище чеков из настройки RECEIPT_STORAGE"""
+    config = settings.RECEIPT_STORAGE
+    storage_class = import_string(config['BACKEND'])
+    return storage_class(**config.get('OPTIONS', {}))
@@ -0,0 +1,94 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from bot.amounts import AmountError, field_max, parse_amount
+from bot.models import MoneyRequest, TelegramUser
+from bot.services import create_request
+
+
+class ParseAmountTests(SimpleTestCase):
+    def test_plain_and_grouped(self):
+        for text, expected in [
+            ('1500', '1500.00'),
+            ('1 500', '1500.00'),
+            ('1 500,50', '1500.50'),
+            ("1'500", '1500.00'),
+            ('1.500,50', '1500.50'),
+            ('1,500.50', '1500.50'),
+            ('1.500.000', '1500000.00'),
+            ('1,500,000', '1500000.00'),
+        ]:
+            with self.subTest(text=text):
+                self.assertEqual(parse_amount(text), Decimal(expected))
+
+    def test_decimal_separators(self):
+        for text, expected in [('1,5', '1.50'), ('1.5', '1.50'), ('1,50', '1.50'), ('0,500', '0.50')]:
+            with self.subTest(text=text):
+                self.assertEqual(parse_amount(text), Decimal(expected))
+
+    def test_two_decimal_places(self):
+        self.assertEqual(str(parse_amount('1500')), '1500.00')
+
+    def test_currency(self):
+        for text in ('1500 руб.', '1500₽', '1500 р', '₽1500', '1500 RUB'):
+            with self.subTest(text=text):
+                self.assertEqual(parse_amount(text), Decimal('1500.00'))
+
+    def test_ambiguous_thousands(self):
+        for text in ('1.500', '1,500', '12,345'):
+            with self.subTest(text=text), self.assertRaises(AmountError):
+                parse_amount(text)
+
+    def test_too_many_decimals(self):
+        with self.assertRaisesMessage(AmountError, "не больше двух знаков"):
+            parse_amount('0.001')
+
+    def test_garbage(self):
+        for text in ('', 'abc', '1.50.5', '1,5.5', '-100', '1e3', None):
+            with self.subTest(text=text), self.assertRaises(AmountError):
+                parse_amount(text)
+
+    def test_limits(self):
+        self.assertEqual(parse_amount('0,01'), Decimal('0.01'))
+        with self.assertRaises(AmountError):
+            parse_amount('0')
+        self.assertEqual(parse_amount(str(field_max())), field_max())
+        with self.assertRaises(AmountError):
+            parse_amount(str(field_max() + Decimal('0.01')))
+
+    @override_settings(REQUEST_AMOUNT={'MIN': '100', 'MAX': '50000'})
+    def test_configured_limits(self):
+        self.assertEqual(parse_amount('50 000'), Decimal('50000.00'))
+        with self.assertRaisesMessage(AmountError, "не больше 50 000,00"):
+            parse_amount('50 000,01')
+        with self.assertRaisesMessage(AmountError, "не меньше 100,00"):
+            parse_amount('99,99')
+
+
+class CreateRequestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = TelegramUser.objects.create(telegram_id=2001)
+        cls.other = TelegramUser.objects.create(telegram_id=2002)
+
+    def test_create_request_idempotent(self):
+        fields = dict(user_id=self.user.pk, amount='100.00', justification='бензин', idempotency_key='2001:15')
+        request, created = create_request(MoneyRequest, **fields)
+        self.assertTrue(created)
+        again, created = create_request(MoneyRequest, **{**fields, 'amount': '999.00'})
+        self.assertFalse(created)
+        self.assertEqual(again.pk, request.pk)
+        self.assertEqual(again.amount, Decimal('100.00'))
+        self.assertEqual(MoneyRequest.objects.count(), 1)
+
+    def test_create_request_key_per_user(self):
+        create_request(MoneyRequest, user_id=self.user.pk, amount='1', justification='a', idempotency_key='k')
+        _, created = create_request(MoneyRequest, user_id=self.other.pk, amount='1', justification='a', idempotency_key='k')
+        self.assertTrue(created)
+
+    def test_create_request_without_key(self):
+        for _ in range(2):
+            _, created = create_request(MoneyRequest, user_id=self.user.pk, amount='1', justification='a')
+            self.assertTrue(created)
+        self.assertEqual(MoneyRequest.objects.count(), 2)
@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from bot.concurrency import PerChatUpdateProcessor, chat_key
+
+
+def update(chat_id=None, user_id=None):
+    return SimpleNamespace(
+        effective_chat=SimpleNamespace(id=chat_id) if chat_id else None,
+        effective_user=SimpleNamespace(id=user_id) if user_id else None,
+    )
+
+
+class PerChatUpdateProcessorTests(SimpleTestCase):
+    def test_chat_key(self):
+        self.assertEqual(chat_key(update(chat_id=1, user_id=2)), ('chat', 1))
+        self.assertEqual(chat_key(update(user_id=2)), ('user', 2))
+        self.assertIsNone(chat_key(update()))
+
+    async def test_order_within_chat(self):
+        processor = PerChatUpdateProcessor(8)
+        done = []
+        active = []
+
+        async def handle(n, delay):
+            active.append(n)
+            self.assertEqual(len(active), 1)
+            await asyncio.sleep(delay)
+            active.remove(n)
+            done.append(n)
+
+        # Первое обновление самое медленное, но следующие ждут его
+        await asyncio.gather(*(
+            processor.process_update(update(chat_id=1), handle(n, delay))
+            for n, delay in enumerate((0.03, 0.01, 0))
+        ))
+        self.assertEqual(done, [0, 1, 2])
+        self.assertEqual((processor.pending, processor._chat_locks), (0, {}))
+
+    async def test_chats_in_parallel(self):
+        processor = PerChatUpdateProcessor(8)
+        second_started = asyncio.Event()
+
+        async def first():
+            # Дождется, только если второй чат обрабатывается одновременно
+            await asyncio.wait_for(second_started.wait(), 1)
+
+        async def second():
+            second_started.set()
+
+        await asyncio.gather(
+            processor.process_update(update(chat_id=1), first()),
+            processor.process_update(update(chat_id=2), second()),
+        )
+
+    async def test_limit_and_pending(self):
+        processor = PerChatUpdateProcessor(2)
+        release = asyncio.Event()
+        active = []
+        peak = []
+
+        async def handle():
+            active.append(1)
+            peak.append(len(active))
+            await release.wait()
+            active.pop()
+
+        tasks = [
+            asyncio.create_task(processor.process_update(update(chat_id=chat_id), handle()))
+            for chat_id in (1, 2, 3, 3)
+        ]
+        await asyncio.sleep(0.01)
+        self.assertEqual(processor.pending, 4)
+        self.assertEqual(len(active), 2)
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(processor.pending, 0)
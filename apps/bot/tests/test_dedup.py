@@ -0,0 +1,73 @@
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from bot.dedup import BANDS, BAND_BITS, dedup_overflows, find_duplicate, hamming, phash_fields
+from bot.models import ExpenseRequest, TelegramUser
+
+
+class PhashBandsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = TelegramUser.objects.create(telegram_id=1001)
+
+    def test_bands(self):
+        fields = phash_fields(0x1234_5678_9ABC_DEF0)
+        self.assertEqual(
+            [fields[f'receipt_phash_b{i}'] for i in range(BANDS)],
+            [0xDEF0, 0x9ABC, 0x5678, 0x1234],
+        )
+
+    def test_negative_hash(self):
+        # BigIntegerField хранит 64-битный хеш со знаком, части - всегда без знака
+        fields = phash_fields(-1)
+        self.assertEqual(fields['receipt_phash'], -1)
+        for i in range(BANDS):
+            self.assertEqual(fields[f'receipt_phash_b{i}'], (1 << BAND_BITS) - 1)
+
+    def test_none(self):
+        self.assertEqual(set(phash_fields(None).values()), {None})
+
+    def test_hamming(self):
+        self.assertEqual(hamming(0, 0b1011), 3)
+        self.assertEqual(hamming(-1, 0), 64)
+
+    def _expense(self, phash):
+        return ExpenseRequest.objects.create(
+            user=self.user, amount=Decimal('100.00'), justification='чек',
+            receipt_photo_name='receipt.jpg', **phash_fields(phash),
+        )
+
+    def test_find_similar(self):
+        phash = 0x0F0F_3C3C_5A5A_9696
+        original = self._expense(phash)
+        # Три бита в трех разных частях: совпадает только одна часть
+        similar = phash ^ (1 | 1 << BAND_BITS | 1 << (2 * BAND_BITS))
+        duplicate = find_duplicate('', similar, max_distance=3)
+        self.assertEqual((duplicate.pk, duplicate.distance), (original.pk, 3))
+        # По биту в каждой части - ни одна часть не совпадает
+        different = similar ^ (1 << (3 * BAND_BITS))
+        self.assertIsNone(find_duplicate('', different, max_distance=3))
+
+    def test_degenerate_hash(self):
+        self._expense(0)
+        self.assertIsNone(find_duplicate('', 0))
+
+    @override_settings(RECEIPT_DEDUP={'MAX_DISTANCE': 3, 'MAX_CANDIDATES': 5})
+    def test_many_candidates(self):
+        phash = 0x0F0F_3C3C_5A5A_9696
+        # Общая первая часть, остальные далеко: кандидаты, но не дубли
+        far = phash ^ ~0xFFFF
+        ExpenseRequest.objects.bulk_create([
+            ExpenseRequest(
+                user=self.user, amount=Decimal('1'), justification='бланк',
+                receipt_photo_name='r.jpg', **phash_fields(far),
+            )
+            for _ in range(20)
+        ])
+        original = self._expense(phash ^ 0b101)
+        overflows = dedup_overflows.value()
+        with self.assertLogs('bot.dedup', 'WARNING'):
+            duplicate = find_duplicate('', phash, max_distance=3)
+        self.assertEqual((duplicate.pk, duplicate.distance), (original.pk, 2))
+        self.assertEqual(dedup_overflows.value(), overflows + 1)
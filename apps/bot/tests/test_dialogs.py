@@ -0,0 +1,64 @@
+import asyncio
+
+from django.conf import settings
+from django.test import TransactionTestCase, override_settings
+
+from bot.bot import ExpenseBot
+from bot.fakeapi import FAKE_TOKEN, FakeBotAPI, start_fake_api, stop_fake_api
+from bot.handlers import states
+from bot.models import ExpenseRequest, MoneyRequest
+from bot.user_cache import user_cache
+
+CHAT_ID = 9_400_000_001
+
+
+class DialogTests(TransactionTestCase):
+    """Диалоги целиком: бот в режиме polling против фейкового Bot API"""
+
+    def setUp(self):
+        # После очистки БД пользователь получит другой pk
+        user_cache.clear()
+
+    def run_dialog(self, steps):
+        """Отправляет тексты steps по очереди, возвращает ответы бота"""
+        async def scenario():
+            api = FakeBotAPI()
+            server, task, base_url = await start_fake_api(api)
+            replies = []
+            try:
+                with override_settings(
+                    TELEGRAM_BOT_TOKEN=FAKE_TOKEN, TELEGRAM_BASE_URL=base_url,
+                    BOT_METRICS={**settings.BOT_METRICS, 'PORT': 0},
+                ):
+                    bot = ExpenseBot()
+                    # Короткий long polling: остановка ждет текущий getUpdates
+                    await bot.start_polling(timeout=1)
+                    try:
+                        for text in steps:
+                            reply = api.expect_reply(CHAT_ID)
+                            api.send_text(CHAT_ID, text)
+                            replies.append((await asyncio.wait_for(reply, 10))['text'])
+                    finally:
+                        await bot.stop_polling()
+            finally:
+                await stop_fake_api(server, task)
+            return replies
+
+        return asyncio.run(scenario())
+
+    def test_state_numbers_unique(self):
+        numbers = [value for name, value in vars(states).items() if name.isupper()]
+        self.assertEqual(len(numbers), len(set(numbers)))
+
+    def test_expense_asks_for_receipt(self):
+        replies = self.run_dialog(['/start', 'Новая заявка', '1500', 'Удлинитель в 305 кабинет'])
+        self.assertIn("Новая заявка на возмещение", replies[1])
+        self.assertIn("Пришлите фото чека", replies[3])
+        self.assertFalse(MoneyRequest.objects.exists())
+
+    def test_money_request_created(self):
+        replies = self.run_dialog(['/start', 'Новый запрос', '1 500', 'Заправить машину'])
+        request = MoneyRequest.objects.get()
+        self.assertIn(f"Запрос #{request.pk} создан", replies[3])
+        self.assertEqual(str(request.amount), '1500.00')
+        self.assertFalse(ExpenseRequest.objects.exists())
@@ -0,0 +1,59 @@
+import csv
+import io
+import zipfile
+from decimal import Decimal
+
+from django.test import TestCase
+
+from bot.export import export, export_rows, iter_csv, iter_xlsx, stream_zip
+from bot.models import MoneyRequest, TelegramUser
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = TelegramUser.objects.create(telegram_id=5000, full_name='=cmd|calc', username='worker')
+        for i, justification in enumerate(['=HYPERLINK("http://evil","x")', '+1', '-1', '@SUM(A1)', 'обычный']):
+            MoneyRequest.objects.create(user=user, amount=Decimal('-12.50') + i, justification=justification)
+
+    def _csv(self):
+        data = b''.join(iter_csv(MoneyRequest, export_rows(MoneyRequest.objects.all(), chunk_size=2), chunk_rows=2))
+        self.assertTrue(data.startswith('\ufeff'.encode('utf-8')))
+        return list(csv.reader(io.StringIO(data.decode('utf-8-sig')), delimiter=';'))
+
+    def test_csv_formulas_escaped(self):
+        rows = self._csv()
+        self.assertEqual(len(rows), 6)
+        justifications = [row[7] for row in rows[1:]]
+        self.assertEqual(
+            justifications,
+            ['\'=HYPERLINK("http://evil","x")', "'+1", "'-1", "'@SUM(A1)", 'обычный'],
+        )
+        self.assertEqual(rows[1][3], "'=cmd|calc")
+        # Суммы - числа, а не текст: отрицательные не экранируются
+        self.assertEqual(rows[1][5], '-12,50')
+
+    def test_xlsx_formulas_escaped(self):
+        data = b''.join(iter_xlsx(MoneyRequest, export_rows(MoneyRequest.objects.all()), chunk_rows=2))
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertIsNone(archive.testzip())
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertIn('>\'=HYPERLINK("http://evil","x")<', sheet)
+        self.assertIn('>\'+1<', sheet)
+        self.assertIn('>\'@SUM(A1)<', sheet)
+        self.assertNotIn('>=HYPERLINK', sheet)
+        self.assertIn('<c><v>-12.50</v></c>', sheet)
+
+    def test_export_content_type(self):
+        data, content_type = export(MoneyRequest.objects.all(), 'csv')
+        self.assertEqual(content_type, 'text/csv; charset=utf-8')
+        self.assertIn("'=HYPERLINK".encode('utf-8'), b''.join(data))
+
+    def test_stream_zip(self):
+        entries = [('a.txt', [b'x' * 1000, b'y'], True), ('b.bin', iter([b'\x00\x01']), False)]
+        chunks = list(stream_zip(entries))
+        self.assertGreater(len(chunks), 1)
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+            self.assertEqual(archive.read('a.txt'), b'x' * 1000 + b'y')
+            self.assertEqual(archive.read('b.bin'), b'\x00\x01')
+            self.assertEqual(archive.getinfo('b.bin').compress_type, zipfile.ZIP_STORED)
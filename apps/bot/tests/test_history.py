@@ -0,0 +1,119 @@
+import asyncio
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from telegram.error import BadRequest
+
+from bot.handlers import history
+from bot.handlers.history import EXPENSES, MONEY, TIMELINE, decode_cursor, encode_cursor, fetch_page
+from bot.models import ExpenseRequest, MoneyRequest, TelegramUser
+from bot.user_cache import user_cache
+
+
+class HistoryCursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        created_at = datetime(2025, 3, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc)
+        raw = encode_cursor(created_at, 42)
+        self.assertEqual(decode_cursor(raw), (created_at, 42))
+
+    def test_fits_callback_data(self):
+        # callback_data в Telegram - не больше 64 байт вместе с префиксом "h:<вид>:"
+        created_at = datetime(2999, 12, 31, tzinfo=dt_timezone.utc)
+        self.assertLessEqual(len(f"h:a:{encode_cursor(created_at, 2 ** 63 - 1)}".encode()), 64)
+
+    def test_garbled(self):
+        for raw in ('abc', '12', '1:2:3', '12:x', 'x:12', '99999999999999999999:1'):
+            with self.subTest(raw=raw), self.assertRaises(ValueError):
+                decode_cursor(raw)
+
+
+class FetchPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = TelegramUser.objects.create(telegram_id=4001)
+        other = TelegramUser.objects.create(telegram_id=4002)
+        MoneyRequest.objects.create(user=other, amount=Decimal('1'), justification='чужой')
+        created_at = timezone.now()
+        for i in range(3):
+            MoneyRequest.objects.create(user=cls.user, amount=Decimal(i + 1), justification='x')
+            ExpenseRequest.objects.create(
+                user=cls.user, amount=Decimal(i + 10), justification='x', receipt_photo_name='r.jpg',
+            )
+        # Одинаковое время создания: порядок задает id
+        MoneyRequest.objects.filter(user=cls.user).update(created_at=created_at)
+
+    def _all_pages(self, kind, page_size):
+        rows, cursor = [], None
+        while True:
+            page, has_next = fetch_page(kind, self.user.pk, cursor, page_size=page_size)
+            rows += [(row['kind'], row['id']) for row in page]
+            if not has_next:
+                return rows
+            self.assertEqual(len(page), page_size)
+            cursor = (page[-1]['created_at'], page[-1]['id'])
+
+    def test_pages_cover_all_rows_once(self):
+        for kind, expected in ((EXPENSES, 3), (MONEY, 3), (TIMELINE, 6)):
+            with self.subTest(kind=kind):
+                rows = self._all_pages(kind, page_size=2)
+                self.assertEqual(len(rows), expected)
+                self.assertEqual(len(set(rows)), expected)
+
+    def test_newest_first(self):
+        rows, has_next = fetch_page(MONEY, self.user.pk, page_size=5)
+        self.assertFalse(has_next)
+        self.assertEqual([row['id'] for row in rows], sorted((row['id'] for row in rows), reverse=True))
+
+
+class FakeQuery:
+    """CallbackQuery с нужными history_page методами"""
+
+    def __init__(self, data, user_id, not_modified=False):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id)
+        self.not_modified = not_modified
+        self.answers = []
+        self.edits = []
+
+    async def answer(self, text=None, **kwargs):
+        self.answers.append(text)
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        self.edits.append(text)
+        if self.not_modified:
+            raise BadRequest("Message is not modified: specified new message content and reply markup are exactly the same")
+
+
+@override_settings(BOT_HISTORY_PAGE_SIZE=2)
+class HistoryPageTests(TransactionTestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = TelegramUser.objects.create(telegram_id=4101)
+        for i in range(3):
+            MoneyRequest.objects.create(user=self.user, amount=Decimal(i + 1), justification='x')
+
+    def page(self, data, **kwargs):
+        query = FakeQuery(data, self.user.telegram_id, **kwargs)
+        asyncio.run(history.history_page(SimpleNamespace(callback_query=query), None))
+        return query
+
+    def test_next_page(self):
+        newest, last_on_page, oldest = MoneyRequest.objects.order_by('-created_at', '-id')
+        query = self.page(f"h:{MONEY}:{encode_cursor(last_on_page.created_at, last_on_page.pk)}")
+        self.assertEqual(query.answers, [None])
+        self.assertIn(f"Запрос #{oldest.pk}\n", query.edits[0])
+        self.assertNotIn(f"Запрос #{newest.pk}\n", query.edits[0])
+
+    def test_stale_callbacks_show_first_page(self):
+        for data in (f"h:{MONEY}:abc", f"h:{MONEY}:99999999999999999999:1", "h:expense:abc", "h"):
+            with self.subTest(data=data):
+                query = self.page(data)
+                self.assertEqual(query.answers, [history.STALE_CURSOR])
+                self.assertEqual(len(query.edits), 1)
+
+    def test_unchanged_first_page(self):
+        query = self.page(f"h:{MONEY}:abc", not_modified=True)
+        self.assertEqual(query.answers, [history.STALE_CURSOR])
@@ -0,0 +1,116 @@
+import asyncio
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from telegram.error import Forbidden, NetworkError, RetryAfter
+
+from bot.models import Notification
+from bot.outbox import MAX_MESSAGE_LENGTH, OutboxWorker, _claim_batch, _merge
+
+CONFIG = {'GLOBAL_RATE': 1000, 'PER_CHAT_RATE': 1000, 'BATCH_SIZE': 10}
+
+
+class FakeBot:
+    def __init__(self, errors=None):
+        self.sent = []
+        self.errors = errors or {}
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.errors:
+            raise self.errors[chat_id]
+        self.sent.append((chat_id, text))
+
+
+@override_settings(BOT_DB_POOL_SIZE=0)
+class OutboxTests(TestCase):
+    def _notify(self, chat_id, text='x', **fields):
+        return Notification.objects.create(chat_id=chat_id, text=text, **fields)
+
+    def test_claim_leases_batch(self):
+        first = self._notify(1)
+        self._notify(2, next_attempt_at=timezone.now() + timedelta(hours=1))
+        self._notify(3, status='sent')
+
+        batch = _claim_batch(10, timedelta(seconds=60))
+
+        self.assertEqual([n['id'] for n in batch], [first.pk])
+        first.refresh_from_db()
+        self.assertGreater(first.next_attempt_at, timezone.now() + timedelta(seconds=50))
+        # Пока аренда не истекла, повторно не выдается
+        self.assertEqual(_claim_batch(10, timedelta(seconds=60)), [])
+
+    def test_merge(self):
+        now = timezone.now()
+        rows = [
+            {'id': 1, 'chat_id': 7, 'text': 'a', 'attempts': 0, 'created_at': now},
+            {'id': 2, 'chat_id': 7, 'text': 'b', 'attempts': 2, 'created_at': now - timedelta(minutes=1)},
+            {'id': 3, 'chat_id': 7, 'text': 'c' * MAX_MESSAGE_LENGTH, 'attempts': 0, 'created_at': now},
+        ]
+        messages = _merge(rows)
+        self.assertEqual([m['ids'] for m in messages], [[1, 2], [3]])
+        self.assertEqual(messages[0]['text'], 'a\n\nb')
+        self.assertEqual(messages[0]['attempts'], 2)
+        self.assertEqual(messages[0]['created_at'], now - timedelta(minutes=1))
+
+    async def test_process_batch_merges_chat(self):
+        for i in range(3):
+            await Notification.objects.acreate(chat_id=10, text=f'статус {i}')
+        await Notification.objects.acreate(chat_id=20, text='другой чат')
+        bot = FakeBot()
+
+        self.assertEqual(await OutboxWorker(bot, CONFIG).process_batch(), 4)
+
+        self.assertEqual(sorted(bot.sent), [(10, 'статус 0\n\nстатус 1\n\nстатус 2'), (20, 'другой чат')])
+        statuses = [n async for n in Notification.objects.values_list('status', 'attempts')]
+        self.assertEqual(statuses, [('sent', 1)] * 4)
+
+    async def test_errors(self):
+        await Notification.objects.acreate(chat_id=1, text='blocked')
+        await Notification.objects.acreate(chat_id=2, text='flaky')
+        await Notification.objects.acreate(chat_id=3, text='flood')
+        await Notification.objects.acreate(chat_id=4, text='ok')
+        bot = FakeBot({
+            1: Forbidden('bot was blocked by the user'),
+            2: NetworkError('timeout'),
+            3: RetryAfter(30),
+        })
+        before = timezone.now()
+
+        await OutboxWorker(bot, {**CONFIG, 'BACKOFF_BASE': 5}).process_batch()
+
+        rows = {n.chat_id: n async for n in Notification.objects.all()}
+        self.assertEqual((rows[1].status, rows[1].attempts), ('failed', 1))
+        self.assertEqual((rows[2].status, rows[2].attempts), ('pending', 1))
+        self.assertGreaterEqual(rows[2].next_attempt_at, before + timedelta(seconds=5))
+        # 429 не считается попыткой
+        self.assertEqual((rows[3].status, rows[3].attempts), ('pending', 0))
+        self.assertGreaterEqual(rows[3].next_attempt_at, before + timedelta(seconds=30))
+        self.assertEqual(rows[4].status, 'sent')
+        self.assertEqual(bot.sent, [(4, 'ok')])
+
+    async def test_max_attempts(self):
+        await Notification.objects.acreate(chat_id=1, text='flaky', attempts=7)
+        await OutboxWorker(FakeBot({1: NetworkError('timeout')}), {**CONFIG, 'MAX_ATTEMPTS': 8}).process_batch()
+        notification = await Notification.objects.aget()
+        self.assertEqual((notification.status, notification.attempts), ('failed', 8))
+
+    async def test_saved_per_chat(self):
+        fast = await Notification.objects.acreate(chat_id=1, text='быстрый')
+        await Notification.objects.acreate(chat_id=2, text='медленный')
+        seen = []
+
+        class SlowBot(FakeBot):
+            async def send_message(self, chat_id, text):
+                if chat_id == 2:
+                    # Первый чат записывается в БД, пока второй еще в работе
+                    for _ in range(100):
+                        status = await Notification.objects.values_list('status', flat=True).aget(pk=fast.pk)
+                        if status == 'sent':
+                            break
+                        await asyncio.sleep(0.01)
+                    seen.append(status)
+                await super().send_message(chat_id, text)
+
+        await OutboxWorker(SlowBot(), CONFIG).process_batch()
+        self.assertEqual(seen, ['sent'])
@@ -0,0 +1,80 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from bot import persistence
+from bot.models import BotState
+from bot.persistence import CHAT_DATA, CONVERSATION, USER_DATA, DjangoPersistence
+
+
+@override_settings(BOT_DB_POOL_SIZE=0)
+class DjangoPersistenceTests(TestCase):
+    def _rows(self):
+        return sorted(BotState.objects.values_list('kind', 'key', 'data'))
+
+    async def test_round_trip(self):
+        store = DjangoPersistence(update_interval=60)
+        await store.update_user_data(101, {'amount': '150.00'})
+        await store.update_chat_data(101, {'menu': 1})
+        await store.update_conversation('expense', (101, 101), 2)
+        await store.flush()
+
+        restored = DjangoPersistence(update_interval=60)
+        self.assertEqual(await restored.get_user_data(), {101: {'amount': '150.00'}})
+        self.assertEqual(await restored.get_chat_data(), {101: {'menu': 1}})
+        self.assertEqual(await restored.get_conversations('expense'), {(101, 101): 2})
+        self.assertEqual(await restored.get_conversations('money'), {})
+
+    async def test_changes_coalesced(self):
+        store = DjangoPersistence(update_interval=60)
+        with mock.patch.object(persistence, '_write', wraps=persistence._write) as write:
+            for amount in ('1', '2', '3'):
+                await store.update_user_data(101, {'amount': amount})
+            await store.update_user_data(102, {'amount': '5'})
+            await store.flush()
+        # Все изменения одного прохода - одна транзакция, последнее значение побеждает
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(
+            [row async for row in BotState.objects.order_by('key').values_list('key', 'data')],
+            [('101', {'amount': '3'}), ('102', {'amount': '5'})],
+        )
+
+    async def test_empty_data_deleted(self):
+        store = DjangoPersistence(update_interval=60)
+        await store.update_user_data(101, {'amount': '1'})
+        await store.update_conversation('expense', (101, 101), 1)
+        await store.flush()
+        await store.update_user_data(101, {})
+        await store.update_conversation('expense', (101, 101), None)
+        await store.flush()
+        self.assertFalse(await BotState.objects.aexists())
+
+    async def test_failed_write_retried(self):
+        store = DjangoPersistence(update_interval=60)
+        with mock.patch.object(persistence, '_write', side_effect=RuntimeError('db is down')):
+            await store.update_user_data(101, {'amount': '1'})
+            with self.assertLogs('bot.persistence', 'ERROR'):
+                await store.flush()
+        # Пока запись не удалась, пришло более свежее значение
+        await store.update_user_data(101, {'amount': '2'})
+        await store.drop_chat_data(7)
+        await store.flush()
+        self.assertEqual(await BotState.objects.values_list('data', flat=True).aget(kind=USER_DATA), {'amount': '2'})
+
+    def test_stale_rows_dropped_on_load(self):
+        now = timezone.now()
+        old = now - timedelta(hours=2)
+        BotState.objects.bulk_create([
+            BotState(kind=USER_DATA, key='1', data={'a': 1}, updated_at=now),
+            BotState(kind=USER_DATA, key='2', data={'a': 2}, updated_at=old),
+            BotState(kind=CHAT_DATA, key='1', data={'c': 1}, updated_at=old),
+            BotState(kind=CONVERSATION + 'expense', key='[1, 1]', data=2, updated_at=now - timedelta(minutes=5)),
+        ])
+        with self.assertLogs('bot.persistence', 'INFO'):
+            self.assertEqual(persistence._load(USER_DATA, 3600), {'1': {'a': 1}})
+            self.assertEqual(persistence._load(CHAT_DATA, 3600), {})
+            # Диалог, который уже истек бы по тайм-ауту, не восстанавливается
+            self.assertEqual(persistence._load(CONVERSATION + 'expense', 60), {})
+        self.assertEqual(self._rows(), [(USER_DATA, '1', {'a': 1})])
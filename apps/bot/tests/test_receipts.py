@@ -0,0 +1,111 @@
+import io
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from telegram.error import BadRequest, NetworkError
+
+from bot.models import ExpenseRequest, Notification, TelegramUser
+from bot.receipts import ReceiptFetcher, _claim_batch
+from bot.storage import get_receipt_storage
+
+
+def png_bytes(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class FakeFile:
+    def __init__(self, data):
+        self.data = data
+        self.file_path = 'photos/file_1.png'
+
+    async def download_as_bytearray(self):
+        return bytearray(self.data)
+
+
+class FakeBot:
+    def __init__(self, files=None, errors=None):
+        self.files = files or {}
+        self.errors = errors or {}
+        self.downloads = []
+
+    async def get_file(self, file_id):
+        self.downloads.append(file_id)
+        if file_id in self.errors:
+            raise self.errors[file_id]
+        return FakeFile(self.files[file_id])
+
+
+@override_settings(BOT_DB_POOL_SIZE=0, RECEIPT_NORMALIZATION={'ENABLED': False})
+class ReceiptFetcherTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = TelegramUser.objects.create(telegram_id=6001)
+
+    def setUp(self):
+        location = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(RECEIPT_STORAGE={
+            'BACKEND': 'bot.storage.FileSystemReceiptStorage', 'OPTIONS': {'location': location},
+        }))
+        get_receipt_storage.cache_clear()
+        self.addCleanup(get_receipt_storage.cache_clear)
+
+    def _fields(self, file_id, unique_id=None, **fields):
+        return {
+            'user': self.user, 'amount': Decimal('100.00'), 'justification': 'чек',
+            'receipt_photo_name': 'receipt.jpg', 'receipt_file_id': file_id,
+            'receipt_file_unique_id': unique_id or file_id, 'receipt_status': 'pending',
+            'receipt_next_attempt_at': timezone.now(), **fields,
+        }
+
+    def test_claim_leases_batch(self):
+        ready = ExpenseRequest.objects.create(**self._fields('a'))
+        ExpenseRequest.objects.create(**self._fields('b', receipt_next_attempt_at=timezone.now() + timedelta(hours=1)))
+
+        batch = _claim_batch(10, timedelta(seconds=60))
+
+        self.assertEqual([(r['id'], r['user__telegram_id']) for r in batch], [(ready.pk, 6001)])
+        self.assertEqual(_claim_batch(10, timedelta(seconds=60)), [])
+
+    async def test_fetch_and_reuse(self):
+        first = await ExpenseRequest.objects.acreate(**self._fields('a', 'same'))
+        bot = FakeBot({'a': png_bytes('red')})
+        await ReceiptFetcher(bot).process_batch()
+        await first.arefresh_from_db()
+        self.assertEqual((first.receipt_status, first.receipt_photo_name), ('ready', 'receipt.png'))
+        self.assertIsNotNone(first.receipt_phash)
+        with first.open_receipt() as f:
+            self.assertEqual(f.read(), png_bytes('red'))
+
+        # То же фото (file_unique_id) с другой заявкой не скачивается повторно
+        second = await ExpenseRequest.objects.acreate(**self._fields('b', 'same'))
+        await ReceiptFetcher(bot).process_batch()
+        await second.arefresh_from_db()
+        self.assertEqual(bot.downloads, ['a'])
+        self.assertEqual(
+            (second.receipt_status, second.receipt_sha256, second.receipt_duplicate_of_id),
+            ('ready', first.receipt_sha256, first.pk),
+        )
+
+    async def test_errors(self):
+        missing = await ExpenseRequest.objects.acreate(**self._fields('missing'))
+        flaky = await ExpenseRequest.objects.acreate(**self._fields('flaky'))
+        bot = FakeBot(errors={'missing': BadRequest('Wrong file_id'), 'flaky': NetworkError('timeout')})
+        before = timezone.now()
+
+        with self.assertLogs('bot.receipts', 'WARNING'):
+            await ReceiptFetcher(bot, {'BACKOFF_BASE': 10}).process_batch()
+
+        await missing.arefresh_from_db()
+        await flaky.arefresh_from_db()
+        self.assertEqual((missing.receipt_status, missing.receipt_attempts), ('failed', 1))
+        notification = await Notification.objects.aget()
+        self.assertEqual(notification.chat_id, 6001)
+        self.assertIn(f"#{missing.pk}", notification.text)
+        self.assertEqual((flaky.receipt_status, flaky.receipt_attempts), ('pending', 1))
+        self.assertGreaterEqual(flaky.receipt_next_attempt_at, before + timedelta(seconds=10))
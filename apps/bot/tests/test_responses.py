@@ -0,0 +1,80 @@
+import io
+
+from django.test import RequestFactory, SimpleTestCase
+
+from bot.responses import aiter_sync, iter_file_range, parse_range, ranged_file_response
+
+DATA = bytes(range(256)) * 4
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        for header, expected in [
+            ('bytes=0-99', (0, 99)),
+            ('bytes=100-', (100, 1023)),
+            ('bytes=-100', (924, 1023)),
+            ('bytes=-5000', (0, 1023)),
+            ('bytes=1000-5000', (1000, 1023)),
+            (' bytes=5-5 ', (5, 5)),
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(parse_range(header, 1024), expected)
+
+    def test_ignored(self):
+        for header in (None, '', 'bytes=-', 'bytes=0-1,5-6', 'items=0-1', 'bytes=a-b'):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 1024))
+
+    def test_unsatisfiable(self):
+        for header, size in [
+            ('bytes=1024-', 1024), ('bytes=5-4', 1024), ('bytes=-0', 1024), ('bytes=0-', 0), ('bytes=-10', 0),
+        ]:
+            with self.subTest(header=header, size=size):
+                self.assertIs(parse_range(header, size), False)
+
+
+class RangedFileResponseTests(SimpleTestCase):
+    def _get(self, **headers):
+        request = RequestFactory().get('/receipt', headers=headers)
+        return ranged_file_response(request, io.BytesIO(DATA), len(DATA), 'image/webp', etag='"abc"')
+
+    def _body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response['Content-Length'], response['Accept-Ranges'], response['ETag']), ('1024', 'bytes', '"abc"'))
+        self.assertEqual(self._body(response), DATA)
+
+    def test_partial(self):
+        response = self._get(Range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual((response['Content-Range'], response['Content-Length']), ('bytes 10-19/1024', '10'))
+        self.assertEqual(self._body(response), DATA[10:20])
+
+    def test_unsatisfiable(self):
+        response = self._get(Range='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_if_range(self):
+        self.assertEqual(self._get(Range='bytes=0-9', **{'If-Range': '"abc"'}).status_code, 206)
+        # Файл изменился - отдаем целиком
+        response = self._get(Range='bytes=0-9', **{'If-Range': '"old"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._body(response), DATA)
+
+    def test_iter_file_range(self):
+        fileobj = io.BytesIO(DATA)
+        chunks = list(iter_file_range(fileobj, 1000, 100, chunk_size=10))
+        self.assertEqual(b''.join(chunks), DATA[1000:])
+        self.assertTrue(fileobj.closed)
+
+    async def test_aiter_sync_closes(self):
+        fileobj = io.BytesIO(DATA)
+        chunks = aiter_sync(iter_file_range(fileobj, 0, len(DATA), chunk_size=100))
+        self.assertEqual(await anext(chunks), DATA[:100])
+        # Клиент оборвал соединение: итератор и файл закрываются
+        await chunks.aclose()
+        self.assertTrue(fileobj.closed)
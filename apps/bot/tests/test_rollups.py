@@ -0,0 +1,66 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+
+from bot.models import ExpenseRequest, MoneyRequest, RequestRollup, TelegramUser
+from bot.rollups import rebuild, record_deleted
+from bot.services import transition_status
+
+
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [TelegramUser.objects.create(telegram_id=3000 + i) for i in range(3)]
+
+    def _rollup(self):
+        return sorted(RequestRollup.objects.values_list('kind', 'user_id', 'month', 'status', 'count', 'amount'))
+
+    def _delete(self, queryset):
+        # Так удаляет админка (RollupDeleteMixin)
+        record_deleted(queryset)
+        queryset.delete()
+
+    def assertMatchesRebuild(self):
+        incremental = self._rollup()
+        self.assertFalse([row for row in incremental if row[4] == 0])
+        user_ids = [user.pk for user in self.users]
+        rebuild(ExpenseRequest, user_ids)
+        rebuild(MoneyRequest, user_ids)
+        self.assertEqual(incremental, self._rollup())
+
+    def test_matches_rebuild(self):
+        requests = []
+        for i, user in enumerate(self.users):
+            for amount in ('100.00', '250.50', '13.37'):
+                requests.append(MoneyRequest.objects.create(user=user, amount=Decimal(amount), justification='x'))
+            ExpenseRequest.objects.create(
+                user=user, amount=Decimal(10 + i), justification='x', receipt_photo_name='r.jpg',
+            )
+        # Заявка прошлого месяца попадает в другую строку сводки
+        old = requests[0]
+        MoneyRequest.objects.filter(pk=old.pk).update(created_at=old.created_at - timedelta(days=40))
+        rebuild(MoneyRequest, [old.user_id])
+
+        transition_status(MoneyRequest.objects.filter(pk__in=[r.pk for r in requests[:5]]), 'approved')
+        transition_status(MoneyRequest.objects.filter(pk__in=[r.pk for r in requests[:2]]), 'paid')
+        edited = requests[6]
+        edited.amount = Decimal('999.99')
+        edited.status = 'rejected'
+        edited.save()
+        self._delete(MoneyRequest.objects.filter(pk=requests[7].pk))
+        self.assertMatchesRebuild()
+
+    def test_empty_rows_deleted(self):
+        request = MoneyRequest.objects.create(user=self.users[0], amount=Decimal('5'), justification='x')
+        transition_status(MoneyRequest.objects.all(), 'approved')
+        self.assertEqual([row[3] for row in self._rollup()], ['approved'])
+        self._delete(MoneyRequest.objects.filter(pk=request.pk))
+        self.assertEqual(self._rollup(), [])
+
+    def test_transition_status_keeps_rollup(self):
+        MoneyRequest.objects.create(user=self.users[0], amount=Decimal('100'), justification='x')
+        MoneyRequest.objects.create(user=self.users[0], amount=Decimal('50'), justification='x', status='paid')
+        transition_status(MoneyRequest.objects.all(), 'rejected')
+        rows = list(RequestRollup.objects.filter(kind='money').values_list('status', 'count', 'amount'))
+        self.assertEqual(rows, [('rejected', 2, Decimal('150.00'))])
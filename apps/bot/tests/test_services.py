@@ -0,0 +1,44 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+
+from bot.models import MoneyRequest, Notification, TelegramUser
+from bot.services import transition_status
+
+
+class ServicesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = TelegramUser.objects.create(telegram_id=2001)
+        cls.other = TelegramUser.objects.create(telegram_id=2002)
+
+    def _money(self, user, amount, status='new'):
+        return MoneyRequest.objects.create(user=user, amount=Decimal(amount), justification='бензин', status=status)
+
+    def _check_transition(self):
+        first = self._money(self.user, '100')
+        second = self._money(self.other, '200')
+        approved = self._money(self.user, '300', status='approved')
+        updated_at = approved.updated_at
+
+        ids = transition_status(MoneyRequest.objects.all(), 'approved')
+
+        self.assertEqual(ids, sorted([first.pk, second.pk]))
+        self.assertEqual(set(MoneyRequest.objects.values_list('status', flat=True)), {'approved'})
+        approved.refresh_from_db()
+        self.assertEqual(approved.updated_at, updated_at)
+        notifications = Notification.objects.order_by('chat_id')
+        self.assertEqual([n.chat_id for n in notifications], [2001, 2002])
+        self.assertIn(f"Запрос #{first.pk} на 100.00 руб.", notifications[0].text)
+        self.assertIn("Новый статус: Одобрен", notifications[0].text)
+        self.assertEqual(transition_status(MoneyRequest.objects.all(), 'approved'), [])
+        self.assertEqual(Notification.objects.count(), 2)
+
+    def test_transition_status(self):
+        self._check_transition()
+
+    def test_transition_status_without_returning(self):
+        with mock.patch.object(connection.features, 'can_return_columns_from_insert', False):
+            self._check_transition()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from bot.storage import FileSystemReceiptStorage
+
+
+class FileSystemReceiptStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.location = self.enterContext(tempfile.TemporaryDirectory())
+        self.storage = FileSystemReceiptStorage(self.location)
+
+    def _files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.location)
+            for root, _, names in os.walk(self.location) for name in names
+        )
+
+    def test_save_and_read(self):
+        stored = self.storage.save(bytearray(b'receipt'))
+        self.assertEqual((stored.size, stored.created), (7, True))
+        self.assertEqual(stored.sha256, self.storage.hash_bytes(b'receipt'))
+        sha = stored.sha256
+        self.assertEqual(self._files(), [os.path.join(sha[:2], sha[2:4], sha)])
+        with self.storage.open(sha) as f:
+            self.assertEqual(f.read(), b'receipt')
+        self.assertEqual(self.storage.size(sha), 7)
+
+    def test_same_content_stored_once(self):
+        first = self.storage.save(b'receipt')
+        with mock.patch('bot.storage.tempfile.mkstemp') as mkstemp:
+            second = self.storage.save(b'receipt')
+        mkstemp.assert_not_called()
+        self.assertEqual((second.sha256, second.created), (first.sha256, False))
+        self.assertEqual(len(self._files()), 1)
+
+    def test_failed_write_leaves_nothing(self):
+        with mock.patch('bot.storage.os.replace', side_effect=OSError('disk full')), self.assertRaises(OSError):
+            self.storage.save(b'receipt')
+        # Ни недописанного чека, ни временного файла
+        self.assertEqual(self._files(), [])
+        self.assertFalse(self.storage.exists(self.storage.hash_bytes(b'receipt')))
+
+    def test_delete(self):
+        sha = self.storage.save(b'receipt').sha256
+        self.storage.delete(sha)
+        self.storage.delete(sha)
+        self.assertFalse(self.storage.exists(sha))
+
+    def test_invalid_hash(self):
+        for value in ('', '../' + 'a' * 61, 'A' * 64, 'a' * 63):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                self.storage.path(value)
@@ -0,0 +1,83 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+from telegram.ext import ApplicationHandlerStop
+
+from bot.throttling import NOTICES, OVERLOAD, RATE_LIMIT, FloodControl, updates_dropped
+
+CONFIG = {'RATE': 0.001, 'BURST': 2, 'MAX_PENDING': 10, 'NOTICE_INTERVAL': 10.0, 'MAX_USERS': 100}
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text):
+        self.replies.append(text)
+
+
+def update(user_id, message, update_id=1):
+    return SimpleNamespace(
+        update_id=update_id, effective_user=SimpleNamespace(id=user_id),
+        callback_query=None, effective_message=message,
+    )
+
+
+def context(pending=0):
+    application = SimpleNamespace(update_queue=asyncio.Queue(), update_processor=SimpleNamespace(pending=pending))
+    return SimpleNamespace(application=application)
+
+
+class FloodControlTests(SimpleTestCase):
+    async def _passes(self, flood, upd, ctx=None):
+        try:
+            await flood.check(upd, ctx or context())
+        except ApplicationHandlerStop:
+            return False
+        return True
+
+    async def test_rate_limit(self):
+        flood = FloodControl(CONFIG)
+        message = FakeMessage()
+        dropped = updates_dropped.value(reason=RATE_LIMIT)
+        with self.assertLogs('bot.throttling', 'WARNING'):
+            results = [await self._passes(flood, update(1, message)) for _ in range(4)]
+        # Запас BURST проходит, дальше - отказ и одно предупреждение
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(message.replies, [NOTICES[RATE_LIMIT]])
+        self.assertEqual(updates_dropped.value(reason=RATE_LIMIT) - dropped, 2)
+        # У другого пользователя свой бакет
+        self.assertTrue(await self._passes(flood, update(2, FakeMessage())))
+
+    async def test_notice_interval(self):
+        flood = FloodControl({**CONFIG, 'BURST': 1})
+        message = FakeMessage()
+        with mock.patch('bot.throttling.time.monotonic', return_value=100.0):
+            await self._passes(flood, update(1, message))
+            with self.assertLogs('bot.throttling', 'WARNING'):
+                await self._passes(flood, update(1, message))
+            await self._passes(flood, update(1, message))
+        with mock.patch('bot.throttling.time.monotonic', return_value=110.0), self.assertLogs('bot.throttling'):
+            await self._passes(flood, update(1, message))
+        self.assertEqual(len(message.replies), 2)
+
+    async def test_overload(self):
+        flood = FloodControl(CONFIG)
+        message = FakeMessage()
+        self.assertTrue(await self._passes(flood, update(1, message), context(pending=10)))
+        with self.assertLogs('bot.throttling', 'WARNING'):
+            self.assertFalse(await self._passes(flood, update(1, message), context(pending=11)))
+        self.assertEqual(message.replies, [NOTICES[OVERLOAD]])
+
+    async def test_without_user(self):
+        upd = SimpleNamespace(update_id=1, effective_user=None)
+        self.assertTrue(await self._passes(FloodControl(CONFIG), upd))
+
+    async def test_users_bounded(self):
+        flood = FloodControl({**CONFIG, 'MAX_USERS': 2})
+        for user_id in (1, 2, 1, 3):
+            await self._passes(flood, update(user_id, FakeMessage()))
+        # Дольше всех молчал пользователь 2
+        self.assertEqual(list(flood.users), [1, 3])
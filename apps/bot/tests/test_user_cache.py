@@ -0,0 +1,36 @@
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+
+from bot.user_cache import MAX_TTL, CachedUser, TelegramUserCache
+
+
+class TelegramUserCacheTests(SimpleTestCase):
+    def test_ttl(self):
+        cache = TelegramUserCache(maxsize=10, ttl=60)
+        user = CachedUser(1, 'u', 'User')
+        with mock.patch('bot.user_cache.time.monotonic', return_value=1000.0):
+            cache.set(42, user)
+        with mock.patch('bot.user_cache.time.monotonic', return_value=1059.0):
+            self.assertEqual(cache.get(42), user)
+        # Правка из админки (другой процесс) видна не позже чем через TTL
+        with mock.patch('bot.user_cache.time.monotonic', return_value=1061.0):
+            self.assertIsNone(cache.get(42))
+        self.assertEqual(len(cache), 0)
+
+    def test_lru(self):
+        cache = TelegramUserCache(maxsize=2, ttl=60)
+        for telegram_id in (1, 2):
+            cache.set(telegram_id, CachedUser(telegram_id, None, None))
+        cache.get(1)
+        cache.set(3, CachedUser(3, None, None))
+        self.assertIsNone(cache.get(2))
+        self.assertIsNotNone(cache.get(1))
+        cache.invalidate(1)
+        self.assertIsNone(cache.get(1))
+
+    def test_ttl_bounded(self):
+        for ttl in (0, MAX_TTL + 1):
+            with self.subTest(ttl=ttl), self.assertRaises(ImproperlyConfigured):
+                TelegramUserCache(maxsize=10, ttl=ttl)
@@ -0,0 +1,134 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from bot.bot import ExpenseBot
+from bot.fakeapi import FAKE_TOKEN, FakeBotAPI, start_fake_api, stop_fake_api
+from bot.inbox import InboxReader, store_update
+from bot.models import WebhookUpdate
+from bot.user_cache import user_cache
+from bot.webhook import MAX_BODY_SIZE, TelegramWebhookMiddleware
+
+SECRET = 'webhook-secret'
+PATH = '/telegram/webhook/'
+
+
+def text_update(update_id, chat_id, text):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 1700000000, 'text': text,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Тест'},
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}] if text.startswith('/') else [],
+        },
+    }
+
+
+async def post(middleware, body=b'', method='POST', path=PATH, secret=SECRET, chunks=None):
+    """Запрос к ASGI-приложению; возвращает код ответа"""
+    headers = [(b'content-type', b'application/json')]
+    if secret is not None:
+        headers.append((b'x-telegram-bot-api-secret-token', secret.encode()))
+    scope = {'type': 'http', 'method': method, 'path': path, 'headers': headers}
+    chunks = list(chunks or [body])
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1} for i, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await middleware(scope, receive, send)
+    return sent[0]['status']
+
+
+async def django_app(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+@override_settings(TELEGRAM_WEBHOOK_SECRET=SECRET, TELEGRAM_WEBHOOK_PATH=PATH, BOT_DB_POOL_SIZE=0)
+class WebhookTests(TestCase):
+    def setUp(self):
+        self.middleware = TelegramWebhookMiddleware(django_app)
+
+    def test_secret_required(self):
+        with override_settings(TELEGRAM_WEBHOOK_SECRET=''), self.assertRaises(ImproperlyConfigured):
+            TelegramWebhookMiddleware(django_app)
+
+    async def test_rejected(self):
+        body = json.dumps(text_update(1, 10, '/start')).encode()
+        self.assertEqual(await post(self.middleware, body, method='GET'), 405)
+        self.assertEqual(await post(self.middleware, body, secret=None), 403)
+        self.assertEqual(await post(self.middleware, body, secret='wrong'), 403)
+        self.assertEqual(await post(self.middleware, chunks=[b'{' * MAX_BODY_SIZE, b'x']), 413)
+        self.assertEqual(await post(self.middleware, b'not json'), 400)
+        with self.assertLogs('bot.webhook', 'WARNING'):
+            self.assertEqual(await post(self.middleware, b'{"message": {}}'), 400)
+        self.assertFalse(await WebhookUpdate.objects.aexists())
+
+    async def test_update_stored_once(self):
+        body = json.dumps(text_update(7, 10, '/start')).encode()
+        self.assertEqual(await post(self.middleware, chunks=[body[:10], body[10:]]), 200)
+        # Повтор от Telegram (не дождался ответа) не дублируется
+        self.assertEqual(await post(self.middleware, body), 200)
+        update = await WebhookUpdate.objects.aget()
+        self.assertEqual((update.update_id, update.data['message']['text']), (7, '/start'))
+
+    async def test_other_paths_go_to_django(self):
+        self.assertEqual(await post(self.middleware, path='/admin/', secret=None), 204)
+
+    async def test_inbox_reader_keeps_order(self):
+        for update_id in (3, 1, 2):
+            await sync_to_async(store_update)(update_id, text_update(update_id, 10, 'текст'))
+        await sync_to_async(store_update)(4, {'update_id': 4, 'message': {}})
+        application = SimpleNamespace(bot=None, update_queue=asyncio.Queue())
+
+        with self.assertLogs('bot.inbox', 'WARNING'):
+            self.assertEqual(await InboxReader(application, {'BATCH_SIZE': 10}).process_batch(), 4)
+
+        queued = [application.update_queue.get_nowait().update_id for _ in range(application.update_queue.qsize())]
+        # Порядок приема, а не update_id
+        self.assertEqual(queued, [3, 1, 2])
+        self.assertFalse(await WebhookUpdate.objects.aexists())
+
+
+class WebhookBotTests(TransactionTestCase):
+    """Обновление через webhook обрабатывает runbot: endpoint -> БД -> Application"""
+
+    def setUp(self):
+        user_cache.clear()
+
+    def test_reply(self):
+        async def scenario():
+            api = FakeBotAPI()
+            server, task, base_url = await start_fake_api(api)
+            try:
+                with override_settings(
+                    TELEGRAM_BOT_TOKEN=FAKE_TOKEN, TELEGRAM_BASE_URL=base_url,
+                    TELEGRAM_WEBHOOK_URL='https://bot.example', TELEGRAM_WEBHOOK_SECRET=SECRET,
+                    TELEGRAM_WEBHOOK_PATH=PATH, BOT_WEBHOOK_INBOX={'POLL_INTERVAL': 0.05, 'BATCH_SIZE': 10},
+                    BOT_METRICS={**settings.BOT_METRICS, 'PORT': 0},
+                ):
+                    runbot = asyncio.create_task(ExpenseBot().run_webhook())
+                    try:
+                        reply = api.expect_reply(9_500_000_001)
+                        body = json.dumps(text_update(1, 9_500_000_001, '/start')).encode()
+                        self.assertEqual(await post(TelegramWebhookMiddleware(django_app), body), 200)
+                        return (await asyncio.wait_for(reply, 10))['text']
+                    finally:
+                        runbot.cancel()
+                        with self.assertRaises(asyncio.CancelledError):
+                            await runbot
+            finally:
+                await stop_fake_api(server, task)
+
+        self.assertIn("Выберите действие", asyncio.run(scenario()))
@@ -0,0 +1,106 @@
+"""Ограничение потока обновлений перед ConversationHandler.
+
+FloodControl.check регистрируется в группе обработчиков -1 и видит каждое
+обновление раньше диалога. Обновление дальше не обрабатывается
+(ApplicationHandlerStop), если:
+
+- пользователь превысил свой лимит: токен-бакет RATE обновлений в секунду
+  с запасом BURST (несколько фото подряд проходят, флуд - нет);
+- бот перегружен: обновлений в очереди и в обработке больше MAX_PENDING,
+  например когда медленно отвечает БД. Лишние обновления получают короткий
+  ответ без запросов к БД, и очередь не растет без предела.
+
+Пользователю об этом пишем не чаще раза в NOTICE_INTERVAL секунд, иначе
+ответы на флуд сами становятся флудом.
+"""
+import logging
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop
+
+from .concurrency import pending_updates
+from .metrics import Counter, Gauge
+from .outbox import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+updates_dropped = Counter(
+    'bot_updates_dropped_total', 'Обновления, отброшенные ограничением потока', ['reason'],
+)
+update_backlog = Gauge('bot_update_backlog', 'Обновлений в очереди и в обработке')
+
+RATE_LIMIT = 'rate_limit'
+OVERLOAD = 'overload'
+
+NOTICES = {
+    RATE_LIMIT: "Слишком много сообщений подряд. Подождите несколько секунд и повторите последнее.",
+    OVERLOAD: "Бот сейчас перегружен. Повторите последнее сообщение через минуту.",
+}
+
+
+class UserState:
+    __slots__ = ('bucket', 'notified_at')
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.notified_at = None
+
+
+class FloodControl:
+    """Токен-бакет на пользователя и общий предел необработанных обновлений"""
+
+    def __init__(self, config=None):
+        config = {**settings.BOT_FLOOD, **(config or {})}
+        self.rate = config['RATE']
+        self.burst = config['BURST']
+        self.max_pending = config['MAX_PENDING']
+        self.notice_interval = config['NOTICE_INTERVAL']
+        self.max_users = config['MAX_USERS']
+        # telegram_id -> UserState, давно не писавшие вытесняются первыми.
+        # Вытесненный бакет был бы полным - пользователь ничего не теряет
+        self.users = OrderedDict()
+
+    def _user(self, user_id):
+        state = self.users.get(user_id)
+        if state is None:
+            state = self.users[user_id] = UserState(TokenBucket(self.rate, self.burst))
+            if len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+        else:
+            self.users.move_to_end(user_id)
+        return state
+
+    async def check(self, update, context):
+        user = update.effective_user
+        if user is None:
+            return
+
+        backlog = pending_updates(context.application)
+        update_backlog.set(backlog)
+        state = self._user(user.id)
+        if self.max_pending and backlog > self.max_pending:
+            reason = OVERLOAD
+        elif state.bucket.try_take() > 0:
+            reason = RATE_LIMIT
+        else:
+            return
+
+        updates_dropped.inc(reason=reason)
+        now = time.monotonic()
+        if state.notified_at is None or now - state.notified_at >= self.notice_interval:
+            state.notified_at = now
+            logger.warning(f"Обновление {update.update_id} от {user.id} отброшено: {reason}, в очереди {backlog}")
+            await self._notify(update, NOTICES[reason])
+        raise ApplicationHandlerStop
+
+    async def _notify(self, update, text):
+        try:
+            if update.callback_query is not None:
+                await update.callback_query.answer(text)
+            elif update.effective_message is not None:
+                await update.effective_message.reply_text(text)
+        except TelegramError as e:
+            logger.warning(f"Не удалось предупредить пользователя об ограничении: {e}")
@@ -0,0 +1,53 @@
+import io
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+
+def thumbnail_sizes():
+    return settings.RECEIPT_THUMBNAILS['SIZES']
+
+
+def thumbnail_path(sha256: str, size: str) -> Path:
+    """Путь к миниатюре чека на диске (может еще не существовать)"""
+    location = Path(settings.RECEIPT_THUMBNAILS['LOCATION'])
+    return location / size / sha256[:2] / f"{sha256}.jpg"
+
+
+def render_thumbnail(data: bytes, max_px: int) -> bytes:
+    """Уменьшает фото до max_px по длинной стороне и кодирует в JPEG"""
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_px, max_px))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=settings.RECEIPT_THUMBNAILS['QUALITY'], optimize=True)
+        return out.getvalue()
+
+
+def get_thumbnail(sha256: str, size: str, load_original) -> Path:
+    """Возвращает путь к миниатюре, создавая её при первом обращении.
+
+    load_original вызывается только если миниатюры еще нет на диске.
+    """
+    max_px = thumbnail_sizes()[size]
+    path = thumbnail_path(sha256, size)
+    if path.exists():
+        return path
+
+    data = render_thumbnail(load_original(), max_px)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return path
@@ -0,0 +1,99 @@
+"""HTTP-клиент бота к Bot API.
+
+По умолчанию Application использует два HTTPXRequest: один для getUpdates,
+другой для всего остального, включая getFile и скачивание фото чеков.
+Медленные скачивания тогда занимают соединения, которые нужны ответам
+пользователям. Здесь клиенты собираются из TELEGRAM_HTTP: отдельный пул
+для getUpdates, пул для методов API и отдельный пул для файлов, каждый со
+своими таймаутами. SplitRequest направляет в пул файлов getFile и
+скачивание (/file/bot...), остальное - в пул API.
+"""
+import asyncio
+import importlib.util
+import logging
+
+from django.conf import settings
+from telegram.request import BaseRequest, HTTPXRequest
+
+from .instrumentation import InstrumentedHTTPXRequest, metrics_enabled
+
+logger = logging.getLogger(__name__)
+
+# Методы, которые идут через пул файлов (вместе со скачиванием файлов)
+MEDIA_METHODS = frozenset({'getFile'})
+
+
+def http_version():
+    """Версия HTTP из настроек; HTTP/2 без пакета h2 заменяется на 1.1"""
+    version = settings.TELEGRAM_HTTP['HTTP_VERSION']
+    if version in ('2', '2.0') and importlib.util.find_spec('h2') is None:
+        logger.warning('HTTP/2 для Bot API требует пакета h2 (pip install "httpx[http2]"), используется HTTP/1.1')
+        return '1.1'
+    return version
+
+
+def make_request(pool):
+    """HTTPXRequest для пула из TELEGRAM_HTTP ('API', 'GET_UPDATES' или 'MEDIA')"""
+    config = settings.TELEGRAM_HTTP[pool]
+    request_class = InstrumentedHTTPXRequest if metrics_enabled() else HTTPXRequest
+    return request_class(
+        connection_pool_size=config['POOL_SIZE'],
+        connect_timeout=config['CONNECT_TIMEOUT'],
+        read_timeout=config['READ_TIMEOUT'],
+        write_timeout=config['WRITE_TIMEOUT'],
+        pool_timeout=config['POOL_TIMEOUT'],
+        http_version=http_version(),
+    )
+
+
+class SplitRequest(BaseRequest):
+    """Методы Bot API через пул api, getFile и скачивание файлов - через пул media"""
+
+    __slots__ = ('api', 'media')
+
+    def __init__(self, api, media):
+        self.api = api
+        self.media = media
+
+    @property
+    def read_timeout(self):
+        return self.api.read_timeout
+
+    async def initialize(self):
+        await asyncio.gather(self.api.initialize(), self.media.initialize())
+
+    async def shutdown(self):
+        await asyncio.gather(self.api.shutdown(), self.media.shutdown())
+
+    def route(self, url):
+        if '/file/bot' in url or url.rsplit('/', 1)[-1] in MEDIA_METHODS:
+            return self.media
+        return self.api
+
+    async def do_request(
+        self,
+        url,
+        method,
+        request_data=None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ):
+        # Таймауты по умолчанию (DEFAULT_NONE) каждый пул берет из своих настроек
+        return await self.route(url).do_request(
+            url, method, request_data,
+            read_timeout=read_timeout, write_timeout=write_timeout,
+            connect_timeout=connect_timeout, pool_timeout=pool_timeout,
+        )
+
+
+def build_request():
+    """Клиент для методов Bot API: с отдельным пулом файлов, если он задан"""
+    if settings.TELEGRAM_HTTP['MEDIA']['POOL_SIZE']:
+        return SplitRequest(make_request('API'), make_request('MEDIA'))
+    return make_request('API')
+
+
+def build_get_updates_request():
+    return make_request('GET_UPDATES')
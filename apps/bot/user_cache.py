@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from bot.db import run_db
+from bot.models import TelegramUser
+
+# Дольше этого кеш не может отставать от изменений из других процессов
+MAX_TTL = 300
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    pk: int
+    username: str | None
+    full_name: str | None
+
+
+class TelegramUserCache:
+    """LRU-кеш telegram_id -> пользователь с ограниченным временем жизни.
+
+    Кеш у каждого процесса свой. Сигналы сбрасывают запись только в том
+    процессе, где пользователь изменен; правки из админки (другой процесс)
+    бот видит не позже чем через TTL, поэтому TTL короткий и ограничен MAX_TTL.
+    """
+
+    def __init__(self, maxsize, ttl):
+        if not 0 < ttl <= MAX_TTL:
+            raise ImproperlyConfigured(f"TELEGRAM_USER_CACHE TTL должен быть от 1 до {MAX_TTL} секунд")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, telegram_id):
+        with self._lock:
+            item = self._data.get(telegram_id)
+            if item is None:
+                return None
+            expires_at, user = item
+            if expires_at < time.monotonic():
+                del self._data[telegram_id]
+                return None
+            self._data.move_to_end(telegram_id)
+            return user
+
+    def set(self, telegram_id, user):
+        with self._lock:
+            self._data[telegram_id] = (time.monotonic() + self.ttl, user)
+            self._data.move_to_end(telegram_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, telegram_id):
+        with self._lock:
+            self._data.pop(telegram_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+user_cache = TelegramUserCache(
+    maxsize=settings.TELEGRAM_USER_CACHE['MAXSIZE'],
+    ttl=settings.TELEGRAM_USER_CACHE['TTL'],
+)
+
+
+def _load_user(telegram_id):
+    row = (
+        TelegramUser.objects.filter(telegram_id=telegram_id)
+        .values_list('pk', 'username', 'full_name')
+        .first()
+    )
+    if row is None:
+        raise TelegramUser.DoesNotExist(f"Пользователь {telegram_id} не найден")
+    return CachedUser(*row)
+
+
+def _sync_user(telegram_id, username, full_name):
+    """Создает пользователя или обновляет имя, только если оно изменилось"""
+    tg_user, created = TelegramUser.objects.get_or_create(
+        telegram_id=telegram_id,
+        defaults={'username': username, 'full_name': full_name},
+    )
+    if not created and (tg_user.username, tg_user.full_name) != (username, full_name):
+        TelegramUser.objects.filter(pk=tg_user.pk).update(username=username, full_name=full_name)
+    return CachedUser(tg_user.pk, username, full_name)
+
+
+async def get_user_pk(telegram_id):
+    """PK пользователя по telegram_id; без обращения к БД, если он в кеше"""
+    cached = user_cache.get(telegram_id)
+    if cached is None:
+        cached = await run_db(_load_user, telegram_id)
+        user_cache.set(telegram_id, cached)
+    return cached.pk
+
+
+async def sync_user(telegram_id, username, full_name):
+    """Регистрирует пользователя; пишет в БД, только если данные изменились"""
+    cached = user_cache.get(telegram_id)
+    if cached is not None and (cached.username, cached.full_name) == (username, full_name):
+        return cached.pk
+    cached = await run_db(_sync_user, telegram_id, username, full_name)
+    user_cache.set(telegram_id, cached)
+    return cached.pk
@@ -1,3 +1,19 @@
-from django.shortcuts import render
+import hmac
 
-# Create your views here.
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+
+from .metrics import registry
+
+
+@require_GET
+def metrics(request):
+    """Метрики процесса в формате Prometheus (только с токеном BOT_METRICS['TOKEN'])"""
+    token = settings.BOT_METRICS['TOKEN']
+    # Без токена /metrics был бы публичным вместе с сайтом - не отдаем вовсе
+    if not settings.BOT_METRICS['ENABLED'] or not token:
+        raise Http404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,110 @@
+"""Прием обновлений Telegram через webhook внутри ASGI-приложения.
+
+Воркеры ASGI только принимают обновления и сохраняют их в очередь в БД,
+обрабатывает их один процесс ``manage.py runbot`` (см. bot.inbox)::
+
+    TELEGRAM_BOT_MODE=webhook uvicorn config.asgi:application --workers 4
+    gunicorn config.asgi:application -k uvicorn.workers.UvicornWorker -w 4
+    TELEGRAM_BOT_MODE=webhook python manage.py runbot
+
+runbot регистрирует адрес webhook, обрабатывает очередь и рассылает
+уведомления. Он должен быть запущен в одном экземпляре, как и при polling:
+все чаты обслуживает один Application, поэтому состояние диалогов не
+расходится между воркерами. Локально можно отправить записанное обновление::
+
+    curl -X POST http://localhost:8000/telegram/webhook/ \\
+         -H 'X-Telegram-Bot-Api-Secret-Token: <TELEGRAM_WEBHOOK_SECRET>' \\
+         -H 'Content-Type: application/json' -d @update.json
+"""
+import hmac
+import json
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from telegram import Update
+
+from .db import run_db
+from .inbox import store_update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = b'x-telegram-bot-api-secret-token'
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class TelegramWebhookMiddleware:
+    """ASGI-обертка: POST на TELEGRAM_WEBHOOK_PATH уходит в очередь бота в БД,
+    остальные запросы - в Django."""
+
+    def __init__(self, app):
+        if not settings.TELEGRAM_WEBHOOK_SECRET:
+            raise ImproperlyConfigured("Для режима webhook нужен TELEGRAM_WEBHOOK_SECRET")
+        self.app = app
+        self.path = '/' + settings.TELEGRAM_WEBHOOK_PATH.strip('/') + '/'
+        self.secret = settings.TELEGRAM_WEBHOOK_SECRET.encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'].rstrip('/') + '/' == self.path:
+            await self.handle_update(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    @staticmethod
+    async def lifespan(receive, send):
+        # Django lifespan не поддерживает, а запускать здесь нечего
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle_update(self, scope, receive, send):
+        if scope['method'] != 'POST':
+            return await self.respond(send, 405)
+
+        headers = dict(scope['headers'])
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, b''), self.secret):
+            return await self.respond(send, 403)
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if len(body) > MAX_BODY_SIZE:
+                return await self.respond(send, 413)
+            if not message.get('more_body'):
+                break
+
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return await self.respond(send, 400)
+
+        try:
+            update = Update.de_json(data, None)
+        except Exception:
+            logger.warning("Некорректное обновление от Telegram: %s", body[:200])
+            return await self.respond(send, 400)
+
+        # Отвечаем, как только обновление сохранено; обработает его runbot.
+        # Если БД недоступна, Telegram получит 500 и повторит обновление позже
+        try:
+            await run_db(store_update, update.update_id, data)
+        except Exception:
+            logger.exception("Не удалось сохранить обновление %s", update.update_id)
+            return await self.respond(send, 500)
+        await self.respond(send, 200)
+
+    @staticmethod
+    async def respond(send, status):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/plain'), (b'content-length', b'0')],
+        })
+        await send({'type': 'http.response.body', 'body': b''})
@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.TELEGRAM_BOT_MODE == 'webhook':
+    from bot.webhook import TelegramWebhookMiddleware
+
+    application = TelegramWebhookMiddleware(application)